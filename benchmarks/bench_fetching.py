@@ -0,0 +1,103 @@
+"""
+Time taken to read questions as their own question types from a bank of
+5,000 questions.
+
+    python benchmarks/bench_fetching.py
+
+For each number of questions read, times Question.objects.by_type(), which
+groups the ids by question_type and reads each type's table on its own,
+next to the previous approach of select_subclasses(), which joins the
+tables of every question type. Runs against a throwaway test database
+built from test_settings.
+"""
+import os
+import random
+import sys
+import timeit
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_settings')
+warnings.simplefilter('ignore')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, reset_queries, transaction  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    CaptureQueriesContext, setup_test_environment)
+
+from essay.models import Essay_Question  # noqa: E402
+from multichoice.models import MCQuestion  # noqa: E402
+from music.models import Music_Question  # noqa: E402
+from quiz.models import Category, Question  # noqa: E402
+from true_false.models import TF_Question  # noqa: E402
+
+BANK_SIZE = 5000
+SIZES = (10, 100, 1000, 5000)
+REPEAT = 20
+
+
+def build_bank(rng):
+    categories = [Category.objects.create(category='category-%d' % i)
+                  for i in range(10)]
+    with transaction.atomic():
+        for i in range(BANK_SIZE):
+            fields = {'content': 'Question %d' % i,
+                      'category': rng.choice(categories)}
+            kind = i % 4
+            if kind == 0:
+                MCQuestion.objects.create(answer_order='none', **fields)
+            elif kind == 1:
+                TF_Question.objects.create(correct=True, **fields)
+            elif kind == 2:
+                Essay_Question.objects.create(**fields)
+            else:
+                Music_Question.objects.create(**fields)
+    return list(Question.objects.values_list('pk', flat=True))
+
+
+def joined(question_ids):
+    questions = {question.pk: question for question in
+                 Question.objects.filter(pk__in=question_ids)
+                                 .select_related('category')
+                                 .select_subclasses()}
+    return [questions[question_id] for question_id in question_ids]
+
+
+def by_type(question_ids):
+    return Question.objects.by_type(question_ids)
+
+
+def per_call(func, question_ids):
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        func(question_ids)
+    seconds = timeit.timeit(lambda: func(question_ids), number=REPEAT)
+    return seconds / REPEAT * 1e3, len(queries)
+
+
+def main():
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        rng = random.Random(0)
+        bank = build_bank(rng)
+
+        print('%10s %16s %16s' % ('questions', 'joined (ms)', 'by type (ms)'))
+        for size in SIZES:
+            question_ids = rng.sample(bank, size)
+            assert ([q.__class__ for q in joined(question_ids)] ==
+                    [q.__class__ for q in by_type(question_ids)])
+
+            join_ms, join_queries = per_call(joined, question_ids)
+            type_ms, type_queries = per_call(by_type, question_ids)
+            print('%10d %10.1f (%2d q) %10.1f (%2d q)'
+                  % (size, join_ms, join_queries, type_ms, type_queries))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
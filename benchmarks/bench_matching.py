@@ -0,0 +1,82 @@
+"""
+Marking latency of free text answers against the number of accepted
+spellings per question.
+
+    python benchmarks/bench_matching.py
+
+For each size, times AnswerMatcher.matches() over a mix of exact,
+contained, misspelled and wrong guesses, next to the previous approach of
+running fuzz.partial_ratio against every answer.
+"""
+import os
+import random
+import string
+import sys
+import timeit
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.simplefilter('ignore')
+
+from fuzzywuzzy import fuzz  # noqa: E402
+
+from quiz.matching import AnswerMatcher  # noqa: E402
+
+ARTIST = 'Siouxsie and the Banshees'
+GUESSES = [
+    'siouxsie and the banshees',
+    'I think it was Siouxsie and the Banshees',
+    'Suzie and the Banshees',
+    'Siouxsie & the Banshes',
+    'The Cure',
+    'Echo and the Bunnymen',
+]
+SIZES = (5, 50, 500)
+REPEAT = 50
+
+
+def alternatives(count, rng):
+    """
+    Returns count spellings of the artist: the name itself and variations
+    with letters dropped, doubled or replaced.
+    """
+    spellings = {ARTIST}
+    while len(spellings) < count:
+        letters = list(ARTIST)
+        for _ in range(rng.randint(1, 4)):
+            i = rng.randrange(len(letters))
+            change = rng.choice(('drop', 'double', 'replace'))
+            if change == 'drop':
+                del letters[i]
+            elif change == 'double':
+                letters.insert(i, letters[i])
+            else:
+                letters[i] = rng.choice(string.ascii_lowercase)
+        spellings.add(''.join(letters))
+    return sorted(spellings)
+
+
+def naive(answers, guess):
+    return any(fuzz.partial_ratio(answer.lower(), guess.lower()) > 90
+               for answer in answers)
+
+
+def per_guess(func, answers):
+    seconds = timeit.timeit(lambda: [func(answers, g) for g in GUESSES],
+                            number=REPEAT)
+    return seconds / (REPEAT * len(GUESSES)) * 1e6
+
+
+def main():
+    rng = random.Random(0)
+    print('%12s %14s %14s' % ('answers', 'matcher (us)', 'naive (us)'))
+    for size in SIZES:
+        answers = alternatives(size, rng)
+        matcher = AnswerMatcher(answers)
+        indexed = per_guess(lambda m, guess: m.matches(guess), matcher)
+        loop = per_guess(naive, answers)
+        print('%12d %14.1f %14.1f' % (size, indexed, loop))
+
+
+if __name__ == '__main__':
+    main()
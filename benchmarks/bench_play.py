@@ -0,0 +1,397 @@
+"""
+Latency and throughput of whole quiz sittings played through QuizTake by
+many players at once.
+
+    python benchmarks/bench_play.py [--workers 8] [--pool thread|process]
+
+Each session opens a quiz's start page, then takes the quiz, answering
+every question it is shown until it reaches the result page. Sessions
+alternate between signed in and anonymous players and are spread over
+the rounds, which alternate between answers after each question and
+answers at the end, and hold essay and music questions as well as
+multiple choice and true/false ones. Guesses are picked at random from
+the form, so some answers are right and some wrong.
+
+By default the sessions run through the Django test client against a
+throwaway SQLite database file built from test_settings and filled by
+generate_event_data. With --url they are sent over HTTP to a running
+server instead, whose database should have been filled by the
+generate_event_data command with the same --prefix, --password and
+--players:
+
+    python manage.py generate_event_data --users 1000
+    python benchmarks/bench_play.py --url http://localhost:8000/q/ \\
+        --quiz round-1 --quiz round-2
+
+Reports the p50, p95 and p99 latency of each endpoint, with its errors
+and SQLite "database is locked" errors, and the overall throughput, and
+writes them with the settings used to a JSON file, to compare releases.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_settings')
+warnings.simplefilter('ignore')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.conf.urls import include, url  # noqa: E402
+from django.db import OperationalError, connection, connections  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from quiz.eventdata import generate_event_data  # noqa: E402
+
+LOCKED = 'database is locked'
+
+# the most questions a session answers, in case a quiz never finishes
+MAX_STEPS = 500
+
+RADIO = re.compile(r'<input[^>]*type="radio"[^>]*name="answers"[^>]*>')
+VALUE = re.compile(r'value="([^"]*)"')
+CSRF = re.compile(r'name="csrfmiddlewaretoken" value="([^"]*)"')
+
+GUESSES = ['The Beatles', 'Kate Bush', 'Answer 3', 'Song 12', 'No idea']
+
+
+# the quiz urls, with stand-ins for the account urls the templates link
+# to, for the test client
+urlpatterns = [
+    url(r'^accounts/login/$', lambda request: HttpResponse(),
+        name='account_login'),
+    url(r'^accounts/logout/$', lambda request: HttpResponse(),
+        name='account_logout'),
+    url(r'^accounts/signup/$', lambda request: HttpResponse(),
+        name='account_signup'),
+    url(r'^', include('quiz.urls')),
+]
+
+
+class Locked(Exception):
+    pass
+
+
+class TestClientTransport(object):
+    """
+    Sends requests through the Django test client, in this process.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.client = Client()
+
+    def login(self, username, password):
+        self.client.force_login(
+            get_user_model().objects.get(username=username))
+
+    def request(self, method, path, data=None):
+        try:
+            if method == 'POST':
+                response = self.client.post(self.base + path, data)
+            else:
+                response = self.client.get(self.base + path)
+        except OperationalError as e:
+            if LOCKED in str(e):
+                raise Locked()
+            raise
+        return response.status_code, response.content.decode('utf-8')
+
+    def close(self):
+        connection.close()
+
+
+class HTTPTransport(object):
+    """
+    Sends requests over HTTP to a running server, keeping cookies.
+    """
+
+    def __init__(self, base, login_url):
+        self.base = base
+        self.login_url = login_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def login(self, username, password):
+        status, body = self.request('GET', self.login_url)
+        # both the allauth and django.contrib.auth field names
+        self.request('POST', self.login_url,
+                     {'login': username, 'username': username,
+                      'password': password, 'csrfmiddlewaretoken':
+                      _csrf_token(body)})
+
+    def request(self, method, path, data=None):
+        url = urllib.parse.urljoin(self.base, path)
+        body = None
+        headers = {'Referer': url}
+        if method == 'POST':
+            body = urllib.parse.urlencode(data or {}, doseq=True).encode()
+        try:
+            with self.opener.open(urllib.request.Request(
+                    url, data=body, headers=headers)) as response:
+                return response.status, response.read().decode('utf-8')
+        except urllib.error.HTTPError as e:
+            content = e.read().decode('utf-8', 'replace')
+            if LOCKED in content:
+                raise Locked()
+            return e.code, content
+
+    def close(self):
+        pass
+
+
+def _csrf_token(body):
+    match = CSRF.search(body)
+    return match.group(1) if match else ''
+
+
+def _answer(body, rng):
+    """
+    Returns the data to post for the question form in body, or None if
+    the page has no question.
+    """
+    if 'name="question_id"' not in body:
+        return None
+
+    data = {'csrfmiddlewaretoken': _csrf_token(body),
+            'question_id': re.search(r'name="question_id" value="(\d+)"',
+                                     body).group(1)}
+    choices = [VALUE.search(radio).group(1)
+               for radio in RADIO.findall(body)]
+    if choices:
+        data['answers'] = rng.choice(choices)
+    else:
+        data['answers'] = rng.choice(GUESSES)
+        if 'name="answer_title"' in body:
+            data['answer_title'] = rng.choice(GUESSES)
+    return data
+
+
+def play(session):
+    """
+    Plays one session and returns a list of (endpoint, seconds, outcome,
+    detail) with outcome 'ok', 'error' or 'locked', and detail describing
+    an error.
+    """
+    options = session['options']
+    rng = random.Random(session['seed'])
+    if options['url']:
+        transport = HTTPTransport(options['url'], options['login_url'])
+    else:
+        transport = TestClientTransport('/')
+    timings = []
+
+    def timed(endpoint, method, path, data=None):
+        start = time.perf_counter()
+        try:
+            status, body = transport.request(method, path, data)
+        except Locked:
+            timings.append((endpoint, time.perf_counter() - start,
+                            'locked', LOCKED))
+            return None
+        except Exception as e:
+            timings.append((endpoint, time.perf_counter() - start,
+                            'error', repr(e)))
+            return None
+        if status != 200:
+            timings.append((endpoint, time.perf_counter() - start,
+                            'error', 'HTTP %d' % status))
+            return None
+        timings.append((endpoint, time.perf_counter() - start, 'ok', None))
+        return body
+
+    try:
+        if session['username']:
+            transport.login(session['username'], options['password'])
+
+        quiz = session['quiz']
+        timed('start_page', 'GET', '%s/' % quiz)
+        body = timed('take:first', 'GET', '%s/take/' % quiz)
+        for step in range(MAX_STEPS):
+            data = body and _answer(body, rng)
+            if data is None:
+                break
+            body = timed('take:answer', 'POST', '%s/take/' % quiz, data)
+            if body is not None and 'name="question_id"' not in body:
+                # the answer to the last question shows the result
+                endpoint, seconds, outcome, detail = timings.pop()
+                timings.append(('take:result', seconds, outcome, detail))
+    finally:
+        transport.close()
+
+    kind = 'user' if session['username'] else 'anon'
+    return [('%s %s' % (kind, endpoint), seconds, outcome, detail)
+            for endpoint, seconds, outcome, detail in timings]
+
+
+def percentile(values, percent):
+    """
+    The nearest rank percentile of sorted values.
+    """
+    if not values:
+        return None
+    rank = max(int(round(percent / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarise(timings, wall):
+    endpoints = {}
+    for endpoint, seconds, outcome, detail in timings:
+        entry = endpoints.setdefault(endpoint, {'times': [], 'error': 0,
+                                                'locked': 0, 'detail': None})
+        if outcome == 'ok':
+            entry['times'].append(seconds * 1000)
+        else:
+            entry[outcome] += 1
+            entry['detail'] = entry['detail'] or detail
+
+    summary = {}
+    for endpoint, entry in sorted(endpoints.items()):
+        times = sorted(entry['times'])
+        summary[endpoint] = {
+            'requests': len(times) + entry['error'] + entry['locked'],
+            'errors': entry['error'],
+            'locked': entry['locked'],
+            'p50_ms': percentile(times, 50),
+            'p95_ms': percentile(times, 95),
+            'p99_ms': percentile(times, 99),
+            'mean_ms': sum(times) / len(times) if times else None,
+            'first_error': entry['detail'],
+        }
+    return {'endpoints': summary,
+            'requests': len(timings),
+            'seconds': wall,
+            'requests_per_second': len(timings) / wall if wall else None}
+
+
+def report(results):
+    print('%-18s %8s %8s %8s %10s %10s %10s'
+          % ('endpoint', 'requests', 'errors', 'locked', 'p50 (ms)',
+             'p95 (ms)', 'p99 (ms)'))
+    for endpoint, entry in results['endpoints'].items():
+        print('%-18s %8d %8d %8d %10s %10s %10s' % (
+            endpoint, entry['requests'], entry['errors'], entry['locked'],
+            *('-' if entry[key] is None else '%.1f' % entry[key]
+              for key in ('p50_ms', 'p95_ms', 'p99_ms'))))
+    print('%d requests in %.1fs, %.1f requests a second'
+          % (results['requests'], results['seconds'],
+             results['requests_per_second'] or 0))
+
+
+def run(sessions, options):
+    if options['pool'] == 'process':
+        # each worker process opens its own database connections
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            options['workers'], mp_context=multiprocessing.get_context('fork'))
+    else:
+        pool = ThreadPoolExecutor(options['workers'])
+
+    start = time.perf_counter()
+    with pool:
+        timings = [timing for result in pool.map(play, sessions)
+                   for timing in result]
+    return timings, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sessions', type=int, default=200,
+                        help="The number of sittings played.")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--pool', choices=['thread', 'process'],
+                        default='thread')
+    parser.add_argument('--anon', type=float, default=0.5,
+                        help="The share of sessions by anonymous players.")
+    parser.add_argument('--anon-state', choices=['session', 'cookie'],
+                        default='session',
+                        help="Where anonymous sittings are kept, with the "
+                             "test client.")
+    parser.add_argument('--players', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=4)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', default=None,
+                        help="Play against the server at this quiz url.")
+    parser.add_argument('--login-url', default='/accounts/login/')
+    parser.add_argument('--quiz', action='append', default=[],
+                        help="A quiz to play on the server, by its url.")
+    parser.add_argument('--prefix', default='player')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--output', default='bench_play.json',
+                        help="Where to write the results as JSON.")
+    options = vars(parser.parse_args())
+
+    old_name = None
+    if options['url'] is None:
+        settings.ROOT_URLCONF = __name__
+        settings.QUIZ_ANON_STATE = options['anon_state']
+        setup_test_environment()
+        # a file rather than memory, so that every thread and process
+        # shares the database, and its locking, as a server's would
+        test_dir = tempfile.mkdtemp()
+        connection.settings_dict['TEST'] = {
+            'NAME': os.path.join(test_dir, 'bench_play.sqlite3')}
+        old_name = connection.creation.create_test_db(verbosity=0)
+        generate_event_data(users=options['players'],
+                            rounds=options['rounds'],
+                            questions=options['questions'],
+                            seed=options['seed'], prefix=options['prefix'],
+                            password=options['password'])
+        from quiz.models import Quiz
+        options['quiz'] = list(Quiz.objects.order_by('round_number')
+                                           .values_list('url', flat=True))
+    elif not options['quiz']:
+        parser.error('--quiz is needed with --url')
+
+    try:
+        rng = random.Random(options['seed'])
+        sessions = [{'options': options,
+                     'seed': rng.getrandbits(32),
+                     'quiz': options['quiz'][i % len(options['quiz'])],
+                     'username': None if rng.random() < options['anon']
+                     else '%s-%d' % (options['prefix'],
+                                     rng.randrange(options['players']))}
+                    for i in range(options['sessions'])]
+        timings, wall = run(sessions, options)
+    finally:
+        if old_name is not None:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            os.rmdir(test_dir)
+
+    results = summarise(timings, wall)
+    report(results)
+
+    results['options'] = options
+    results['environment'] = {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': None if options['url'] else connection.vendor,
+        'cpus': os.cpu_count(),
+    }
+    with open(options['output'], 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+    print('Results written to %s' % options['output'])
+
+
+if __name__ == '__main__':
+    main()
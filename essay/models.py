@@ -2,19 +2,19 @@ from __future__ import unicode_literals
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from django.db import models
+from quiz.cache import watch_question_models
 from quiz.models import Question
-from fuzzywuzzy import fuzz
 
 
 @python_2_unicode_compatible
 class Essay_Question(Question):
 
+    @classmethod
+    def answers_for(cls, question_ids):
+        return Essay_Answer.objects.filter(question__in=question_ids)
+
     def check_if_correct(self, guess):
-        answers = Essay_Answer.objects.filter(question=self)
-        for answer in answers:
-            if fuzz.partial_ratio(str(answer).lower(), guess.lower()) > 90:
-                return True
-        return False
+        return self.answer_matcher('correct_answer').matches(guess)
 
     def get_answers(self):
         return False
@@ -46,4 +46,7 @@ class Essay_Answer(models.Model):
 
     class Meta:
         verbose_name = _("Answer")
-        verbose_name_plural = _("Answers")    
+        verbose_name_plural = _("Answers")
+
+
+watch_question_models(Essay_Question, Essay_Answer)
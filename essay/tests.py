@@ -1,6 +1,8 @@
 from django.test import TestCase
 
-from .models import Essay_Question
+from quiz.cache import get_question
+
+from .models import Essay_Question, Essay_Answer
 
 
 class TestEssayQuestionModel(TestCase):
@@ -20,3 +22,17 @@ class TestEssayQuestionModel(TestCase):
     def test_answer_to_string(self):
         self.assertEqual('To be...',
                          self.essay.answer_choice_to_string('To be...'))
+
+    def test_check_if_correct(self):
+        Essay_Answer.objects.create(question=self.essay,
+                                    correct_answer='The Beatles')
+        self.assertEqual(self.essay.check_if_correct('beatles'), True)
+        self.assertEqual(self.essay.check_if_correct('THE BEATLES!'), True)
+        self.assertEqual(self.essay.check_if_correct('the beatels'), False)
+        self.assertEqual(self.essay.check_if_correct('the rolling stones'),
+                         False)
+
+        question = get_question(self.essay.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(question.check_if_correct('Beatles, The'),
+                             True)
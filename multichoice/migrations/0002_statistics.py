@@ -0,0 +1,48 @@
+# Generated by Django 2.2 on 2026-10-18 19:28
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def count_logged_choices(apps, schema_editor):
+    """
+    Starts the counters from the answers already logged.
+    """
+    SittingAnswer = apps.get_model('quiz', 'SittingAnswer')
+    Answer = apps.get_model('multichoice', 'Answer')
+    ChoiceStatistic = apps.get_model('multichoice', 'ChoiceStatistic')
+
+    picks = SittingAnswer.objects.filter(question__mcquestion__isnull=False)\
+                                 .values('guess')\
+                                 .annotate(picked=Count('pk'))\
+                                 .order_by()
+    existing = set(Answer.objects.values_list('pk', flat=True))
+    ChoiceStatistic.objects.bulk_create(
+        [ChoiceStatistic(answer_id=int(row['guess']), picked=row['picked'])
+         for row in picks
+         if row['guess'].isdigit() and int(row['guess']) in existing],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multichoice', '0001_initial'),
+        ('quiz', '0011_sitting_answers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceStatistic',
+            fields=[
+                ('answer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistic', serialize=False, to='multichoice.Answer', verbose_name='Answer')),
+                ('picked', models.PositiveIntegerField(default=0, verbose_name='Picked')),
+            ],
+            options={
+                'verbose_name': 'Answer statistic',
+                'verbose_name_plural': 'Answer statistics',
+            },
+        ),
+        migrations.RunPython(count_logged_choices, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
 from __future__ import unicode_literals
+import random
+
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from django.db import models
-from quiz.models import Question
+from quiz.cache import watch_question_models
+from quiz.models import CounterManager, Question
 
 
 ANSWER_ORDER_OPTIONS = (
@@ -22,8 +25,21 @@ class MCQuestion(Question):
                     "to the user"),
         verbose_name=_("Answer Order"))
 
+    @classmethod
+    def answers_for(cls, question_ids):
+        return Answer.objects.filter(question__in=question_ids)
+
+    def get_answer(self, answer_id):
+        if self.answer_cache is None:
+            return Answer.objects.get(id=answer_id)
+
+        for answer in self.answer_cache:
+            if str(answer.id) == str(answer_id):
+                return answer
+        raise Answer.DoesNotExist
+
     def check_if_correct(self, guess):
-        answer = Answer.objects.get(id=guess)
+        answer = self.get_answer(guess)
 
         if answer.correct is True:
             return True
@@ -39,15 +55,28 @@ class MCQuestion(Question):
             return queryset.order_by()
         return queryset
 
+    def order_cached_answers(self, answers):
+        if self.answer_order == 'content':
+            return sorted(answers, key=lambda answer: answer.content)
+        if self.answer_order == 'random':
+            return random.sample(answers, len(answers))
+        return list(answers)
+
     def get_answers(self):
+        if self.answer_cache is not None:
+            return self.order_cached_answers(self.answer_cache)
         return self.order_answers(Answer.objects.filter(question=self))
 
     def get_answers_list(self):
         return [(answer.id, answer.content) for answer in
-                self.order_answers(Answer.objects.filter(question=self))]
+                self.get_answers()]
 
     def answer_choice_to_string(self, guess):
-        return Answer.objects.get(id=guess).content
+        return self.get_answer(guess).content
+
+    def record_statistics(self, guess, is_correct):
+        super(MCQuestion, self).record_statistics(guess, is_correct)
+        ChoiceStatistic.objects.add({'picked': 1}, answer_id=int(guess))
 
     class Meta:
         verbose_name = _("Multiple Choice Question")
@@ -75,3 +104,24 @@ class Answer(models.Model):
     class Meta:
         verbose_name = _("Answer")
         verbose_name_plural = _("Answers")
+
+
+class ChoiceStatistic(models.Model):
+    """
+    The number of times signed in players have picked an answer.
+    """
+    answer = models.OneToOneField(Answer, primary_key=True,
+                                  related_name='statistic',
+                                  verbose_name=_("Answer"),
+                                  on_delete=models.CASCADE)
+
+    picked = models.PositiveIntegerField(default=0, verbose_name=_("Picked"))
+
+    objects = CounterManager()
+
+    class Meta:
+        verbose_name = _("Answer statistic")
+        verbose_name_plural = _("Answer statistics")
+
+
+watch_question_models(MCQuestion, Answer)
@@ -2,26 +2,42 @@ from __future__ import unicode_literals
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from django.db import models
+from quiz.cache import watch_question_models
 from quiz.models import Question
-from fuzzywuzzy import fuzz
 
 
 @python_2_unicode_compatible
 class Music_Question(Question):
 
+    @classmethod
+    def answers_for(cls, question_ids):
+        return Music_Answer.objects.filter(question__in=question_ids)
+
     def check_if_correct(self, guess):
-        answers = Music_Answer.objects.filter(question=self)
-        for answer in answers:
-            if fuzz.partial_ratio(str(answer.correct_artist).lower(), guess.lower()) > 90:
-                return True
-        return False
+        return self.answer_matcher('correct_artist').matches(guess)
 
     def check_title_correct(self, guess):
-        answers = Music_Answer.objects.filter(question=self)
-        for answer in answers:
-            if fuzz.partial_ratio(str(answer.correct_title).lower(), guess.lower()) > 90:
-                return True
-        return False
+        return self.answer_matcher('correct_title').matches(guess)
+
+    def mark(self, guess):
+        """
+        guess is the artist, or an (artist, title) pair when the title was
+        given too, in which case each part right is worth half a point.
+        """
+        if not isinstance(guess, (list, tuple)):
+            return super(Music_Question, self).mark(guess)
+
+        artist, title = guess
+        if not title:
+            return super(Music_Question, self).mark(artist)
+
+        is_correct = self.check_if_correct(artist)
+        score = 0
+        if is_correct:
+            score = 0.5
+        if self.check_title_correct(title):
+            score += 0.5
+        return is_correct, score
 
     def get_answers(self):
         return False
@@ -30,6 +46,8 @@ class Music_Question(Question):
         return False
 
     def answer_choice_to_string(self, guess):
+        if isinstance(guess, (list, tuple)):
+            return ' - '.join(part for part in guess if part)
         return str(guess)
 
     def __str__(self):
@@ -58,4 +76,7 @@ class Music_Answer(models.Model):
 
     class Meta:
         verbose_name = _("Answer")
-        verbose_name_plural = _("Answers")    
+        verbose_name_plural = _("Answers")
+
+
+watch_question_models(Music_Question, Music_Answer)
@@ -1,14 +1,49 @@
-from django import forms
-from django.contrib import admin
-from django.contrib.admin.widgets import FilteredSelectMultiple
+from django.contrib import admin, messages
+from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import ugettext_lazy as _
 
-from .models import Quiz, Category, SubCategory, Progress, Question
+from .marking import remark_questions
+from .models import Quiz, Category, SubCategory, Progress, Question, QuizQuestion, Sitting, get_statistic
 from multichoice.models import MCQuestion, Answer
 from true_false.models import TF_Question
 from essay.models import Essay_Question, Essay_Answer
 from music.models import Music_Question, Music_Answer
 
+class QuizQuestionInline(admin.TabularInline):
+    model = QuizQuestion
+    extra = 1
+    fields = ('quiz', 'position')
+
+def remark_answers(modeladmin, request, queryset):
+    result = remark_questions(list(queryset.values_list('pk', flat=True)))
+    modeladmin.message_user(request,
+                            _('Re-marked %(answers)d answers: %(sittings)d '
+                              'sittings and %(scores)d scores changed.')
+                            % result)
+remark_answers.short_description = _("Re-mark stored answers")
+
+class QuestionStatisticsMixin(object):
+    """
+    Shows how often each question has been answered, and answered
+    correctly, in the change list.
+    """
+
+    def get_queryset(self, request):
+        return super(QuestionStatisticsMixin, self).get_queryset(request)\
+                                                  .select_related('statistic')
+
+    def answered(self, obj):
+        statistic = get_statistic(obj)
+        return statistic.answered if statistic else 0
+    answered.short_description = _("Answered")
+
+    def percent_correct(self, obj):
+        statistic = get_statistic(obj)
+        if statistic is None or statistic.percent_correct is None:
+            return '-'
+        return '%d%%' % statistic.percent_correct
+    percent_correct.short_description = _("Correct")
+
 class AnswerInline(admin.TabularInline):
     model = Answer
 
@@ -18,46 +53,44 @@ class EssayAnswerInline(admin.TabularInline):
 class MusicAnswerInline(admin.TabularInline):
     model = Music_Answer
 
-class QuizAdminForm(forms.ModelForm):
+class QuizQuestionPositionInline(admin.TabularInline):
     """
-    below is from
-    http://stackoverflow.com/questions/11657682/
-    django-admin-interface-using-horizontal-filter-with-
-    inline-manytomany-field
+    The quiz's questions in order, with their positions editable.
     """
+    model = QuizQuestion
+    extra = 1
+    fields = ('position', 'question')
+    ordering = ('position', 'pk')
+    raw_id_fields = ('question',)
 
-    class Meta:
-        model = Quiz
-        exclude = []
-
-    questions = forms.ModelMultipleChoiceField(
-        queryset=Question.objects.all().select_subclasses(),
-        required=False,
-        label=_("Questions"),
-        widget=FilteredSelectMultiple(
-            verbose_name=_("Questions"),
-            is_stacked=False))
-
-    def __init__(self, *args, **kwargs):
-        super(QuizAdminForm, self).__init__(*args, **kwargs)
-        if self.instance.pk:
-            self.fields['questions'].initial =\
-                self.instance.question_set.all().select_subclasses()
-
-    def save(self, commit=True):
-        quiz = super(QuizAdminForm, self).save(commit=False)
-        quiz.save()
-        quiz.question_set.set(self.cleaned_data['questions'])
-        self.save_m2m()
-        return quiz
+    def get_queryset(self, request):
+        return super(QuizQuestionPositionInline, self).get_queryset(request)\
+                                                      .select_related('quiz',
+                                                                      'question')
 
 
 class QuizAdmin(admin.ModelAdmin):
-    form = QuizAdminForm
-
-    list_display = ('title', 'category', 'draft')
+    list_display = ('title', 'round_number', 'category', 'draft')
     list_filter = ('category',)
     search_fields = ('description', 'category', )
+    actions = ['open_round']
+
+    inlines = [QuizQuestionPositionInline]
+
+    def open_round(self, request, queryset):
+        for quiz in queryset:
+            try:
+                count = Sitting.objects.open_round(quiz)
+            except ImproperlyConfigured as e:
+                self.message_user(request, '%s: %s' % (quiz, e),
+                                  level=messages.ERROR)
+            else:
+                self.message_user(request,
+                                  _('Opened %(quiz)s with %(count)d new '
+                                    'sittings.') % {'quiz': quiz,
+                                                    'count': count})
+    open_round.short_description = _("Open round and create sittings for "
+                                     "all players")
 
 
 class CategoryAdmin(admin.ModelAdmin):
@@ -70,16 +103,31 @@ class SubCategoryAdmin(admin.ModelAdmin):
     list_filter = ('category',)
 
 
-class MCQuestionAdmin(admin.ModelAdmin):
-    list_display = ('content', 'category', )
+class MCQuestionAdmin(QuestionStatisticsMixin, admin.ModelAdmin):
+    list_display = ('content', 'category', 'answered', 'percent_correct',
+                    'picked')
     list_filter = ('category',)
     fields = ('content', 'category', 'sub_category',
-              'figure', 'quiz', 'explanation', 'answer_order')
+              'figure', 'explanation', 'answer_order')
 
     search_fields = ('content', 'explanation')
-    filter_horizontal = ('quiz',)
 
-    inlines = [AnswerInline]
+    inlines = [QuizQuestionInline, AnswerInline]
+    actions = [remark_answers]
+
+    def get_queryset(self, request):
+        return super(MCQuestionAdmin, self).get_queryset(request)\
+                                           .prefetch_related(
+                                               'answer_set__statistic')
+
+    def picked(self, obj):
+        counts = []
+        for answer in obj.answer_set.all():
+            statistic = get_statistic(answer)
+            counts.append('%s: %d' % (answer.content,
+                                      statistic.picked if statistic else 0))
+        return ', '.join(counts)
+    picked.short_description = _("Picked")
 
 
 class ProgressAdmin(admin.ModelAdmin):
@@ -87,36 +135,38 @@ class ProgressAdmin(admin.ModelAdmin):
     to do:
             create a user section
     """
-    search_fields = ('user', 'score', )
+    search_fields = ('user__username', )
 
 
-class TFQuestionAdmin(admin.ModelAdmin):
-    list_display = ('content', 'category', )
+class TFQuestionAdmin(QuestionStatisticsMixin, admin.ModelAdmin):
+    list_display = ('content', 'category', 'answered', 'percent_correct')
     list_filter = ('category',)
     fields = ('content', 'category', 'sub_category',
-              'figure', 'quiz', 'explanation', 'correct',)
+              'figure', 'explanation', 'correct',)
 
     search_fields = ('content', 'explanation')
-    filter_horizontal = ('quiz',)
+
+    inlines = [QuizQuestionInline]
+    actions = [remark_answers]
 
 
-class EssayQuestionAdmin(admin.ModelAdmin):
-    list_display = ('content', 'category', )
+class EssayQuestionAdmin(QuestionStatisticsMixin, admin.ModelAdmin):
+    list_display = ('content', 'category', 'answered', 'percent_correct')
     list_filter = ('category',)
-    fields = ('content', 'category', 'figure', 'sub_category', 'quiz', 'explanation', )
+    fields = ('content', 'category', 'figure', 'sub_category', 'explanation', )
     search_fields = ('content', 'explanation')
-    filter_horizontal = ('quiz',)
 
-    inlines = [EssayAnswerInline]
+    inlines = [QuizQuestionInline, EssayAnswerInline]
+    actions = [remark_answers]
 
-class MusicQuestionAdmin(admin.ModelAdmin):
-    list_display = ('content', 'category', )
+class MusicQuestionAdmin(QuestionStatisticsMixin, admin.ModelAdmin):
+    list_display = ('content', 'category', 'answered', 'percent_correct')
     list_filter = ('category', )
-    fields = ('content','category', 'figure', 'sub_category', 'quiz', 'explanation')
+    fields = ('content','category', 'figure', 'sub_category', 'explanation')
     search_fields = ('content', 'explanation')
-    filter_horizontal = ('quiz', )
 
-    inlines = [MusicAnswerInline]
+    inlines = [QuizQuestionInline, MusicAnswerInline]
+    actions = [remark_answers]
 
 admin.site.register(Quiz, QuizAdmin)
 admin.site.register(Category, CategoryAdmin)
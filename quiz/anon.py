@@ -0,0 +1,223 @@
+"""
+Progress of players who are not signed in.
+
+An anonymous sitting is kept as the seed and pack digest its question order
+is derived from (as for Sitting), the number of questions answered, the
+score and a bitmap of the questions answered incorrectly.
+
+By default it is kept in the session. With
+
+    QUIZ_ANON_STATE = 'cookie'
+
+in settings, each sitting is kept in a signed cookie of its own instead,
+as is the running score across quizzes, so anonymous play writes nothing
+to the database and needs no session storage shared between servers.
+The cookies are signed, not encrypted: players can read their own state
+and cannot forge a new one. Nothing is kept on the server to tell a fresh
+cookie from an old one, though, so a player can send back an earlier
+cookie they were given, eg. from before a wrong answer, and answer again.
+The same goes for the quiz_score cookie. Only use cookies where that
+does not matter, as in casual play; sessions do not have this problem.
+"""
+from django.conf import settings
+from django.core import signing
+
+# anonymous sittings expire after 3 days
+EXPIRY = 259200
+
+COOKIE_NAME = 'quiz_%s'
+SCORE_COOKIE_NAME = 'quiz_score'
+SALT = 'quiz.anon'
+
+
+class AnonSitting(object):
+    """
+    One anonymous player's progress through a quiz.
+
+    seed, pack - the seed and pack digest the question order is derived from
+    cursor - the number of questions answered
+    score - the number of questions answered correctly
+    incorrect - bitmap of the questions answered incorrectly, by their
+                index in the question order
+    """
+
+    def __init__(self, seed, pack, cursor=0, score=0, incorrect=0):
+        self.seed = seed
+        self.pack = pack
+        self.cursor = cursor
+        self.score = score
+        self.incorrect = incorrect
+
+    def add_answer(self, is_correct):
+        if is_correct:
+            self.score += 1
+        else:
+            self.incorrect |= 1 << self.cursor
+        self.cursor += 1
+
+    def incorrect_questions(self, question_order):
+        """
+        Returns the ids of the questions answered incorrectly, given the
+        sitting's question order.
+        """
+        return [question_id for index, question_id in enumerate(question_order)
+                if self.incorrect >> index & 1]
+
+
+def anon_session_score(session, to_add=0, possible=0):
+    """
+    Returns the session score for non-signed in users.
+    If number passed in then add this to the running total and
+    return session score.
+
+    examples:
+        anon_session_score(1, 1) will add 1 out of a possible 1
+        anon_session_score(0, 2) will add 0 out of a possible 2
+        x, y = anon_session_score() will return the session score
+                                    without modification
+
+    Left this as an individual function for unit testing
+    """
+    if "session_score" not in session:
+        session["session_score"], session["session_score_possible"] = 0, 0
+
+    if possible > 0:
+        session["session_score"] += to_add
+        session["session_score_possible"] += possible
+
+    return session["session_score"], session["session_score_possible"]
+
+
+class SessionState(object):
+    """
+    Keeps anonymous sittings in the session, under the keys given by
+    Quiz.anon_q_list, anon_score_id and anon_q_data.
+    """
+
+    def __init__(self, request):
+        self.session = request.session
+
+    def load(self, quiz):
+        """
+        Returns the player's sitting of quiz, or None if there is none.
+        """
+        state = self.session.get(quiz.anon_q_list())
+        data = self.session.get(quiz.anon_q_data())
+        # sittings kept in an earlier format are started again
+        if not isinstance(state, dict) or not isinstance(data, dict) \
+                or 'incorrect' not in data:
+            return None
+
+        return AnonSitting(state['seed'], state['pack'], state['cursor'],
+                           self.session.get(quiz.anon_score_id(), 0),
+                           data['incorrect'])
+
+    def start(self, quiz, sitting):
+        self.session.set_expiry(EXPIRY)
+        self.save(quiz, sitting)
+
+    def save(self, quiz, sitting):
+        self.session[quiz.anon_q_list()] = dict(seed=sitting.seed,
+                                                pack=sitting.pack,
+                                                cursor=sitting.cursor)
+        self.session[quiz.anon_score_id()] = sitting.score
+        self.session[quiz.anon_q_data()] = dict(incorrect=sitting.incorrect)
+
+    def delete(self, quiz):
+        for key in (quiz.anon_q_list(), quiz.anon_score_id(),
+                    quiz.anon_q_data()):
+            self.session.pop(key, None)
+
+    def add_to_total(self, to_add=0, possible=0):
+        """
+        Adds to the player's score across all quizzes and returns it, as
+        anon_session_score does.
+        """
+        return anon_session_score(self.session, to_add, possible)
+
+    def apply(self, response):
+        """
+        Writes any changes to the response; the session middleware saves
+        the session itself.
+        """
+
+
+class CookieState(object):
+    """
+    Keeps each anonymous sitting in a signed cookie named after its quiz,
+    holding [seed, pack, cursor, score, incorrect], and the score across
+    quizzes in a cookie of its own. The signature stops tampering but not
+    replay: any cookie issued within EXPIRY is accepted again.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        # cookie name to new value, or None to delete the cookie
+        self.changed = {}
+
+    def _get(self, name):
+        if name in self.changed:
+            return self.changed[name]
+
+        value = self.request.COOKIES.get(name)
+        if value is None:
+            return None
+        try:
+            return signing.loads(value, salt=SALT, max_age=EXPIRY)
+        except signing.BadSignature:
+            return None
+
+    def load(self, quiz):
+        """
+        Returns the player's sitting of quiz, or None if there is none.
+        """
+        state = self._get(COOKIE_NAME % quiz.id)
+        try:
+            return AnonSitting(*state)
+        except TypeError:
+            return None
+
+    def start(self, quiz, sitting):
+        self.save(quiz, sitting)
+
+    def save(self, quiz, sitting):
+        self.changed[COOKIE_NAME % quiz.id] = [sitting.seed, sitting.pack,
+                                               sitting.cursor, sitting.score,
+                                               sitting.incorrect]
+
+    def delete(self, quiz):
+        self.changed[COOKIE_NAME % quiz.id] = None
+
+    def add_to_total(self, to_add=0, possible=0):
+        """
+        Adds to the player's score across all quizzes and returns it, as
+        anon_session_score does.
+        """
+        total = self._get(SCORE_COOKIE_NAME) or [0, 0]
+        if possible > 0:
+            total = [total[0] + to_add, total[1] + possible]
+            self.changed[SCORE_COOKIE_NAME] = total
+        return tuple(total)
+
+    def apply(self, response):
+        """
+        Sets or deletes the cookies changed while handling the request.
+        """
+        for name, value in self.changed.items():
+            if value is None:
+                response.delete_cookie(name)
+            else:
+                response.set_cookie(name,
+                                    signing.dumps(value, salt=SALT,
+                                                  compress=True),
+                                    max_age=EXPIRY, httponly=True)
+
+
+def get_anon_state(request):
+    """
+    Returns where the request's anonymous sittings are kept, as chosen by
+    the QUIZ_ANON_STATE setting.
+    """
+    if getattr(settings, 'QUIZ_ANON_STATE', 'session') == 'cookie':
+        return CookieState(request)
+    return SessionState(request)
@@ -0,0 +1,173 @@
+"""
+Per-process caches of quiz content.
+
+Questions are held fully loaded, subclass and answers included, so showing
+and marking a question does not touch the database once the cache is warm.
+
+Each cache is tied to a version number kept in Django's cache framework.
+Saving or deleting a watched model bumps the version, and every process
+drops its copies the next time it looks. For this to reach all processes
+the default cache must be shared between them (eg. memcached, redis or
+files); the local memory cache only invalidates the process that made the
+change, so a system check warns when it is configured.
+"""
+import copy
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+QUESTION_VERSION_KEY = 'quiz:question_version'
+QUIZ_VERSION_KEY = 'quiz:quiz_version'
+
+_caches = {}
+
+
+def get_version(key):
+    """
+    Returns the current version for key, starting a new one if it has
+    been evicted from the cache.
+    """
+    version = cache.get(key)
+    if version is None:
+        # start from the clock so a restarted version never matches one
+        # that a process is still holding
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_version(key)
+
+
+def versioned(name, version_key=QUESTION_VERSION_KEY):
+    """
+    Returns the per-process dict cached under name, emptied if the version
+    held under version_key has moved on since it was filled.
+    """
+    version = get_version(version_key)
+    cached = _caches.get(name)
+    if cached is None or cached[0] != version:
+        cached = (version, {})
+        _caches[name] = cached
+    return cached[1]
+
+
+def clear():
+    """
+    Drops everything cached by this process.
+    """
+    _caches.clear()
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get(DEFAULT_CACHE_ALIAS, {}).get('BACKEND')
+    if backend != 'django.core.cache.backends.locmem.LocMemCache':
+        return []
+    return [checks.Warning(
+        "The default cache is local to each process, so changes to "
+        "questions and quizzes are not seen by other processes until "
+        "they restart.",
+        hint="Set CACHES to a cache shared by every process, eg. "
+             "memcached, redis or FileBasedCache, or silence this check "
+             "if the site runs in a single process.",
+        id='quiz.W001')]
+
+
+def invalidate_questions(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump_version(QUESTION_VERSION_KEY)
+
+
+def watch_question_models(*models):
+    """
+    Invalidates the question cache whenever one of models is saved or
+    deleted, or when rows are added to or removed from one of them as a
+    many to many relation. Each question type registers itself and its
+    answer model.
+    """
+    for model in models:
+        label = model._meta.label
+        post_save.connect(invalidate_questions, sender=model,
+                          dispatch_uid='quiz_cache_save_%s' % label)
+        post_delete.connect(invalidate_questions, sender=model,
+                            dispatch_uid='quiz_cache_delete_%s' % label)
+        m2m_changed.connect(invalidate_questions, sender=model,
+                            dispatch_uid='quiz_cache_m2m_%s' % label)
+
+
+def invalidate_quizzes(sender, **kwargs):
+    bump_version(QUIZ_VERSION_KEY)
+
+
+def watch_quiz_model(model):
+    """
+    Invalidates the quiz cache whenever a quiz is saved or deleted.
+    """
+    post_save.connect(invalidate_quizzes, sender=model,
+                      dispatch_uid='quiz_cache_save_quiz')
+    post_delete.connect(invalidate_quizzes, sender=model,
+                        dispatch_uid='quiz_cache_delete_quiz')
+
+
+def get_quiz(url):
+    """
+    Returns a copy of the quiz with the given url, so taking a quiz does
+    not look it up on every answer. Raises Quiz.DoesNotExist if there is
+    no such quiz.
+    """
+    from .models import Quiz
+
+    quizzes = versioned('quiz:quizzes', QUIZ_VERSION_KEY)
+    quiz = quizzes.get(url)
+    if quiz is None:
+        quiz = Quiz.objects.get(url=url)
+        quizzes[url] = quiz
+    return copy.copy(quiz)
+
+
+def get_question(question_id):
+    """
+    Returns the question with its subclass and answers loaded.
+
+    Each caller gets its own copy, so attributes set on it for one request
+    (eg. user_answer) do not leak into another.
+    """
+    from .models import Question
+
+    questions = versioned('quiz:questions')
+    question = questions.get(question_id)
+    if question is None:
+        question = Question.objects.get_by_type(question_id)
+        question.load_answers()
+        questions[question_id] = question
+    return copy.copy(question)
+
+
+def get_questions(question_ids):
+    """
+    Returns copies of the questions in the order given, as get_question
+    does, reading those not cached yet together: one query per question
+    type and one per answer table. Questions that no longer exist are left
+    out.
+    """
+    from .models import Question, load_answers
+
+    questions = versioned('quiz:questions')
+    missing = [question_id for question_id in question_ids
+               if question_id not in questions]
+    if missing:
+        loaded = Question.objects.by_type(missing)
+        load_answers(loaded)
+        for question in loaded:
+            questions[question.id] = question
+
+    return [copy.copy(questions[question_id]) for question_id in question_ids
+            if question_id in questions]
@@ -0,0 +1,275 @@
+"""
+Synthetic event data, for load and scale testing.
+
+Creates players, rounds of mixed question types and, for each player, a
+sitting of each round they take part in, completed or part way through,
+with its logged answers, scores, round totals, category progress and
+question statistics. The answers are marked by the questions themselves,
+so the data is what play through QuizTake would have left behind.
+
+Everything apart from the questions, which cannot be bulk created as
+they are spread over two tables, is written with bulk inserts, so a
+hundred thousand scores take seconds. The same seed and options always
+give the same data.
+"""
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from django.utils.timezone import now
+
+BATCH_SIZE = 500
+
+# the default weights of each question type in the rounds
+MIX = {'mc': 4, 'tf': 3, 'essay': 1, 'music': 2}
+
+ARTISTS = ['The Beatles', 'Nina Simone', 'Kraftwerk', 'Aretha Franklin',
+           'Radiohead', 'Bob Marley', 'Kate Bush', 'Prince']
+
+
+def _create_question(kind, number, category, rng):
+    """
+    Creates a question of the given kind with its answers, and returns
+    it with a function giving a player's guess at it: the right answer
+    with the probability passed, a wrong one otherwise.
+    """
+    from essay.models import Essay_Answer, Essay_Question
+    from multichoice.models import Answer, MCQuestion
+    from music.models import Music_Answer, Music_Question
+    from true_false.models import TF_Question
+
+    content = 'Question %d' % number
+
+    if kind == 'mc':
+        question = MCQuestion.objects.create(content=content,
+                                             category=category,
+                                             answer_order='random')
+        Answer.objects.bulk_create(
+            Answer(question=question, content='Choice %d' % i,
+                   correct=i == 0) for i in range(4))
+        choices = list(Answer.objects.filter(question=question)
+                                     .order_by('pk'))
+
+        def guess(rng, p):
+            if rng.random() < p:
+                return str(choices[0].pk)
+            return str(rng.choice(choices[1:]).pk)
+
+    elif kind == 'tf':
+        correct = rng.random() < 0.5
+        question = TF_Question.objects.create(content=content,
+                                              category=category,
+                                              correct=correct)
+
+        def guess(rng, p):
+            return str(correct if rng.random() < p else not correct)
+
+    elif kind == 'essay':
+        answer = 'Answer %d' % number
+        question = Essay_Question.objects.create(content=content,
+                                                 category=category)
+        Essay_Answer.objects.create(question=question, correct_answer=answer)
+
+        def guess(rng, p):
+            return answer if rng.random() < p else 'No idea'
+
+    elif kind == 'music':
+        artist = rng.choice(ARTISTS)
+        title = 'Song %d' % number
+        question = Music_Question.objects.create(content=content,
+                                                 category=category)
+        Music_Answer.objects.create(question=question, correct_artist=artist,
+                                    correct_title=title)
+
+        def guess(rng, p):
+            return [artist if rng.random() < p else 'Someone else',
+                    title if rng.random() < p else '']
+
+    else:
+        raise ValueError("Unknown question type '%s'." % kind)
+
+    return question, guess
+
+
+def generate_event_data(users=1000, rounds=10, questions=10, mix=None,
+                        accuracy=0.6, spread=0.15, participation=0.9,
+                        complete=0.9, categories=5, seed=0,
+                        prefix='player', password='password'):
+    """
+    Creates an event's worth of data and returns a dict counting what
+    was created.
+
+    users - the number of players, named prefix-0, prefix-1, ..., all
+            with the given password
+    rounds - the number of rounds, numbered after the existing ones
+    questions - the number of questions in each round
+    mix - the weight of each question type, keyed on 'mc', 'tf', 'essay'
+          and 'music'
+    accuracy, spread - each player answers correctly with a probability
+                       drawn from a normal distribution with this mean
+                       and standard deviation
+    participation - the share of rounds each player takes part in
+    complete - the share of sittings completed; the others stop at a
+               random question
+    categories - the number of categories the questions are spread over,
+                 named prefix-category-1, ... and reused if they exist
+    seed - seeds the random choices
+    """
+    from multichoice.models import ChoiceStatistic, MCQuestion
+
+    from .cache import QUESTION_VERSION_KEY, bump_version
+    from .models import (MAX_SEED, Category, CategoryProgress,
+                         QuestionStatistic, Quiz, QuizQuestion, RoundTotal,
+                         Score, Sitting, SittingAnswer, load_answers)
+    from .pack import get_pack
+
+    rng = random.Random(seed)
+    kinds, weights = zip(*sorted((mix or MIX).items()))
+    User = get_user_model()
+    result = dict.fromkeys(['users', 'rounds', 'questions', 'sittings',
+                            'complete', 'answers', 'scores'], 0)
+
+    with transaction.atomic():
+        # every player shares the one hash, as hashing is slow on purpose
+        hashed = make_password(password)
+        names = ['%s-%d' % (prefix, i) for i in range(users)]
+        User.objects.bulk_create(
+            (User(username=name, password=hashed) for name in names),
+            batch_size=BATCH_SIZE)
+        # only the players created here, read back by name in batches as
+        # bulk_create does not return their ids on every database
+        players = []
+        for start in range(0, users, BATCH_SIZE):
+            players.extend(User.objects.filter(
+                username__in=names[start:start + BATCH_SIZE]).order_by('pk'))
+        result['users'] = users
+
+        category_list = [Category.objects.get_or_create(
+            category=('%s-category-%d' % (prefix, i + 1)).lower())[0]
+            for i in range(categories)]
+
+        first = (Quiz.objects.aggregate(last=Max('round_number'))['last']
+                 or 0) + 1
+        round_list = []
+        guessers = {}
+        for number in range(first, first + rounds):
+            quiz = Quiz.objects.create(
+                title='Round %d' % number, url='round-%d' % number,
+                description='Generated round %d' % number,
+                category=rng.choice(category_list), round_number=number,
+                random_order=True, answers_at_end=number % 2 == 0,
+                exam_paper=True)
+            links = []
+            for position in range(1, questions + 1):
+                question, guess = _create_question(
+                    rng.choices(kinds, weights)[0],
+                    (number - 1) * questions + position,
+                    rng.choice(category_list), rng)
+                guessers[question.pk] = (question, guess)
+                links.append(QuizQuestion(quiz=quiz, question=question,
+                                          position=position))
+            QuizQuestion.objects.bulk_create(links)
+            round_list.append(quiz)
+        bump_version(QUESTION_VERSION_KEY)
+        load_answers([question for question, _ in guessers.values()])
+        result['rounds'] = rounds
+        result['questions'] = len(guessers)
+
+        verdicts = {}
+        sittings, answers, scores = [], [], []
+        totals, progress, statistics, picked = {}, {}, {}, {}
+        for player in players:
+            p = min(max(rng.gauss(accuracy, spread), 0), 1)
+            for quiz in round_list:
+                if rng.random() >= participation:
+                    continue
+                pack = get_pack(quiz.id)
+                sitting_seed = rng.randint(1, MAX_SEED)
+                order = pack.order(sitting_seed)
+                done = rng.random() < complete
+                cursor = len(order) if done else rng.randrange(len(order))
+                sitting = Sitting(user=player, quiz=quiz, question_order='',
+                                  seed=sitting_seed,
+                                  pack_version=pack.digest, cursor=cursor,
+                                  current_score=0, complete=done,
+                                  end=now() if done else None)
+
+                incorrect = 0
+                for index, question_id in enumerate(order[:cursor]):
+                    question, guess = guessers[question_id]
+                    answer = guess(rng, p)
+                    key = (question_id, str(answer))
+                    if key not in verdicts:
+                        verdicts[key] = question.mark(answer)
+                    is_correct, score = verdicts[key]
+                    is_correct = is_correct is True
+
+                    if is_correct:
+                        sitting.current_score += 1
+                    else:
+                        incorrect |= 1 << index
+
+                    title = ''
+                    if isinstance(answer, list):
+                        answer, title = answer
+                    # the sitting's id is filled in once it is saved
+                    answers.append((player.pk, quiz.pk, SittingAnswer(
+                        question_id=question_id, position=index,
+                        guess=answer, title=title, correct=is_correct,
+                        score=score)))
+                    scores.append(Score(user=player, round=quiz.round_number,
+                                        question=pack.position(question_id),
+                                        score=score))
+
+                    key = (player.pk, quiz.round_number)
+                    totals[key] = totals.get(key, 0) + score
+                    key = (player.pk, question.category_id)
+                    counts = progress.setdefault(key, [0, 0])
+                    counts[0] += 1 if is_correct else 0
+                    counts[1] += 1
+                    counts = statistics.setdefault(question_id, [0, 0])
+                    counts[0] += 1
+                    counts[1] += 1 if is_correct else 0
+                    if isinstance(question, MCQuestion):
+                        picked[int(answer)] = picked.get(int(answer), 0) + 1
+
+                sitting._set_incorrect_bits(incorrect)
+                sittings.append(sitting)
+                result['complete'] += 1 if done else 0
+
+        Sitting.objects.bulk_create(sittings, batch_size=BATCH_SIZE)
+        sitting_ids = {(user_id, quiz_id): pk for pk, user_id, quiz_id in
+                       Sitting.objects.filter(quiz__in=round_list)
+                                      .values_list('pk', 'user', 'quiz')}
+        for user_id, quiz_id, answer in answers:
+            answer.sitting_id = sitting_ids[(user_id, quiz_id)]
+        answers = [answer for _, _, answer in answers]
+        result['sittings'] = len(sittings)
+
+        SittingAnswer.objects.bulk_create(answers, batch_size=BATCH_SIZE)
+        Score.objects.bulk_create(scores, batch_size=BATCH_SIZE)
+        RoundTotal.objects.bulk_create(
+            (RoundTotal(user_id=user_id, round=round, total=total)
+             for (user_id, round), total in totals.items()),
+            batch_size=BATCH_SIZE)
+        CategoryProgress.objects.bulk_create(
+            (CategoryProgress(user_id=user_id, category_id=category_id,
+                              score=score, possible=possible)
+             for (user_id, category_id), (score, possible)
+             in progress.items()),
+            batch_size=BATCH_SIZE)
+        QuestionStatistic.objects.bulk_create(
+            (QuestionStatistic(question_id=question_id, answered=answered,
+                               correct=correct)
+             for question_id, (answered, correct) in statistics.items()),
+            batch_size=BATCH_SIZE)
+        ChoiceStatistic.objects.bulk_create(
+            (ChoiceStatistic(answer_id=answer_id, picked=count)
+             for answer_id, count in picked.items()),
+            batch_size=BATCH_SIZE)
+        result['answers'] = len(answers)
+        result['scores'] = len(scores)
+
+    return result
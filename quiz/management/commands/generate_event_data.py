@@ -0,0 +1,80 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from quiz.eventdata import MIX, generate_event_data
+
+
+def mix(value):
+    """
+    Parses question type weights given as eg. mc=4,tf=3,essay=1,music=2.
+    """
+    weights = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        if kind.strip() not in MIX:
+            raise ValueError(kind)
+        weights[kind.strip()] = float(weight or 1)
+    return weights
+
+
+def share(value):
+    value = float(value)
+    if not 0 <= value <= 1:
+        raise ValueError(value)
+    return value
+
+
+class Command(BaseCommand):
+    help = ("Creates players, rounds of mixed questions and their "
+            "sittings, answers and scores, for load and scale testing. "
+            "The same seed and options always give the same data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--rounds', type=int, default=10,
+                            help="The number of rounds, numbered after "
+                                 "the existing ones.")
+        parser.add_argument('--questions', type=int, default=10,
+                            help="The number of questions in each round.")
+        parser.add_argument('--mix', type=mix, default=None,
+                            help="The weight of each question type, as "
+                                 "mc=4,tf=3,essay=1,music=2 (the default).")
+        parser.add_argument('--accuracy', type=share, default=0.6,
+                            help="The mean share of questions players "
+                                 "answer correctly.")
+        parser.add_argument('--spread', type=float, default=0.15,
+                            help="The standard deviation of the players' "
+                                 "accuracy.")
+        parser.add_argument('--participation', type=share, default=0.9,
+                            help="The share of rounds each player takes.")
+        parser.add_argument('--complete', type=share, default=0.9,
+                            help="The share of sittings completed.")
+        parser.add_argument('--categories', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='player',
+                            help="Players are named prefix-0, prefix-1, ...")
+        parser.add_argument('--password', default='password',
+                            help="The password of every player.")
+
+    def handle(self, *args, **options):
+        started = time.time()
+        try:
+            result = generate_event_data(
+                users=options['users'], rounds=options['rounds'],
+                questions=options['questions'], mix=options['mix'],
+                accuracy=options['accuracy'], spread=options['spread'],
+                participation=options['participation'],
+                complete=options['complete'],
+                categories=options['categories'], seed=options['seed'],
+                prefix=options['prefix'], password=options['password'])
+        except IntegrityError as e:
+            raise CommandError("%s. Is there already data with prefix "
+                               "'%s'?" % (e, options['prefix']))
+
+        result['seconds'] = time.time() - started
+        self.stdout.write("Created %(users)d users, %(rounds)d rounds with "
+                          "%(questions)d questions, %(sittings)d sittings "
+                          "(%(complete)d complete), %(answers)d answers and "
+                          "%(scores)d scores in %(seconds).1fs." % result)
@@ -0,0 +1,27 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.models import Quiz, Sitting
+
+
+class Command(BaseCommand):
+    help = ("Takes quizzes out of draft and creates a sitting for every "
+            "active user.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', metavar='url',
+                            help="The user friendly url of a quiz.")
+
+    def handle(self, *args, **options):
+        for url in options['urls']:
+            try:
+                quiz = Quiz.objects.get(url=url)
+            except Quiz.DoesNotExist:
+                raise CommandError("No quiz with url '%s'." % url)
+
+            try:
+                count = Sitting.objects.open_round(quiz)
+            except ImproperlyConfigured as e:
+                raise CommandError("%s: %s" % (quiz, e))
+
+            self.stdout.write("Opened %s with %d new sittings." % (quiz, count))
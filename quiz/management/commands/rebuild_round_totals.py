@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from quiz.models import RoundTotal
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-user round totals from the Score table."
+
+    def handle(self, *args, **options):
+        count = RoundTotal.objects.rebuild()
+        self.stdout.write("Rebuilt %d round totals." % count)
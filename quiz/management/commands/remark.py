@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from quiz.marking import remark_questions
+
+
+class Command(BaseCommand):
+    help = ("Marks every stored answer to the given questions again, "
+            "updating sittings, scores and round totals.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='+', type=int,
+                            metavar='question_id')
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Mark the answers across a pool of this "
+                                 "many processes.")
+
+    def handle(self, *args, **options):
+        result = remark_questions(options['question_ids'],
+                                  processes=options['processes'])
+        self.stdout.write("Re-marked %(answers)d answers: %(sittings)d "
+                          "sittings and %(scores)d scores changed." % result)
@@ -0,0 +1,245 @@
+"""
+Re-marking of stored answers after a question's answer key has changed.
+
+Every answer logged for the given questions is marked again. The logged
+answers, sittings, scores and round totals are then brought in line with
+the new verdicts in one transaction, using bulk updates. Answers from
+sittings that have been deleted (quizzes that are not exam papers delete
+them once finished) cannot be re-marked.
+
+mark_answer applies a marker's verdict on a single answer the same way.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+import multiprocessing
+import operator
+
+from django.db import transaction
+from django.db.models import Q, Sum
+
+BATCH_SIZE = 500
+
+# the number of answers sent to a worker process at a time
+CHUNK_SIZE = 50
+
+
+def _mark(questions, items):
+    return [(key, ) + tuple(questions[question_id].mark(guess))
+            for key, question_id, guess in items]
+
+
+_worker_questions = {}
+
+
+def _init_worker(questions):
+    _worker_questions.update(questions)
+
+
+def _mark_in_worker(items):
+    return _mark(_worker_questions, items)
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def remark_questions(question_ids, processes=None, batch_size=BATCH_SIZE):
+    """
+    Marks every stored answer to the given questions again and applies
+    the new verdicts and scores.
+
+    With processes, the answers are marked by a pool of that many worker
+    processes, forked from this one.
+
+    Returns a dict counting the answers marked, and the sittings and
+    scores changed.
+    """
+    from .models import Question, QuizQuestion, Sitting, load_answers
+
+    questions = {question.id: question for question in
+                 Question.objects.by_type(question_ids)}
+    load_answers(list(questions.values()))
+
+    links = QuizQuestion.objects.filter(question_id__in=questions)\
+                                .select_related('quiz')
+    quizzes = {link.quiz_id: link.quiz for link in links}
+    positions = {(link.quiz_id, link.question_id): link.position
+                 for link in links}
+
+    result = {'answers': 0, 'sittings': 0, 'scores': 0}
+    if not quizzes:
+        return result
+
+    sittings = Sitting.objects.filter(quiz_id__in=quizzes,
+                                      answers__question_id__in=questions)\
+                              .distinct().order_by('pk')
+
+    pool = None
+    if processes:
+        pool = ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker, initargs=(questions, ))
+
+    scores = {}
+    try:
+        with transaction.atomic():
+            # read in pages by pk rather than through one open cursor, as
+            # the sittings are updated as they go
+            batch = list(sittings[:batch_size])
+            while batch:
+                answers, changed = _remark_sittings(
+                    batch, questions, quizzes, positions, scores, pool)
+                result['answers'] += answers
+                result['sittings'] += changed
+                batch = list(sittings.filter(pk__gt=batch[-1].pk)
+                             [:batch_size])
+            result['scores'] = _apply_scores(scores)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return result
+
+
+def mark_answer(sitting, question_id, is_correct):
+    """
+    Overrides the verdict on a sitting's answer, as a marker does by hand:
+    a correct answer scores a full point and an incorrect one none. The
+    sitting, its logged answer, the question's statistics and the user's
+    score and round total are updated together. Returns True if the
+    verdict has changed.
+    """
+    from .models import QuestionStatistic, QuizQuestion
+
+    score = 1 if is_correct else 0
+    with transaction.atomic():
+        if not sitting.mark_question(question_id, is_correct):
+            return False
+        sitting.save(update_fields=['incorrect', 'current_score'])
+        sitting.answers.filter(question_id=question_id)\
+                       .update(correct=bool(is_correct), score=score)
+        QuestionStatistic.objects.add({'correct': 1 if is_correct else -1},
+                                      question_id=question_id)
+
+        quiz = sitting.quiz
+        position = QuizQuestion.objects.filter(quiz_id=quiz.id,
+                                               question_id=question_id)\
+                                       .values_list('position', flat=True)\
+                                       .first()
+        if quiz.round_number is not None and position is not None:
+            _apply_scores({(quiz.round_number, position):
+                           {sitting.user_id: score}})
+    return True
+
+
+def _remark_sittings(sittings, questions, quizzes, positions, scores, pool):
+    """
+    Marks the answers logged in a batch of sittings, bulk updates the
+    answers and sittings whose verdicts have changed, with the questions'
+    statistics, and records each answer's new score in scores, keyed on
+    (round, position) and then user. Returns the number of answers marked
+    and of sittings changed.
+    """
+    from .models import QuestionStatistic, Sitting, SittingAnswer
+
+    index = {sitting.pk: i for i, sitting in enumerate(sittings)}
+    for sitting in sittings:
+        sitting.quiz = quizzes[sitting.quiz_id]
+
+    logged = list(SittingAnswer.objects.filter(sitting__in=index,
+                                               question_id__in=questions)
+                                       .order_by('pk'))
+    items = [(i, answer.question_id, answer.answer)
+             for i, answer in enumerate(logged)]
+
+    if pool is None:
+        marked = _mark(questions, items)
+    else:
+        marked = [result for results in
+                  pool.map(_mark_in_worker, _batches(items, CHUNK_SIZE))
+                  for result in results]
+
+    changed = {}
+    changed_answers = []
+    correct = {}
+    for i, is_correct, score in marked:
+        answer = logged[i]
+        if answer.correct != bool(is_correct):
+            correct[answer.question_id] = correct.get(answer.question_id, 0)\
+                + (1 if is_correct else -1)
+        if answer.correct != bool(is_correct) or answer.score != score:
+            answer.correct, answer.score = bool(is_correct), score
+            changed_answers.append(answer)
+
+        sitting = sittings[index[answer.sitting_id]]
+        try:
+            if sitting.mark_question(answer.question_id, is_correct):
+                changed[sitting.pk] = sitting
+        except ValueError:
+            # the question was added to the quiz after the sitting started
+            continue
+
+        quiz = sitting.quiz
+        position = positions.get((quiz.id, answer.question_id))
+        if quiz.round_number is not None and position is not None:
+            # sittings and answers are in order, so the latest one wins
+            scores.setdefault((quiz.round_number, position), {})[
+                sitting.user_id] = score
+
+    SittingAnswer.objects.bulk_update(changed_answers, ['correct', 'score'])
+    for question_id, difference in correct.items():
+        if difference:
+            QuestionStatistic.objects.add({'correct': difference},
+                                          question_id=question_id)
+    Sitting.objects.bulk_update(list(changed.values()),
+                                ['incorrect', 'current_score'])
+    return len(items), len(changed)
+
+
+def _apply_scores(scores):
+    """
+    Updates the stored scores that differ from the new ones and rebuilds
+    the round totals of the users affected. Returns the number of scores
+    changed.
+    """
+    from .models import RoundTotal, Score
+
+    if not scores:
+        return 0
+
+    matching = reduce(operator.or_, (Q(round=round, question=position)
+                                     for round, position in scores))
+    changed = []
+    for score in Score.objects.select_for_update().filter(matching):
+        new = scores[(score.round, score.question)].get(score.user_id)
+        if new is not None and new != score.score:
+            score.score = new
+            changed.append(score)
+    if not changed:
+        return 0
+    Score.objects.bulk_update(changed, ['score'], batch_size=BATCH_SIZE)
+
+    users = set(score.user_id for score in changed)
+    rounds = set(score.round for score in changed)
+
+    totals = {(row['user'], row['round']): row['total'] for row in
+              Score.objects.filter(user__in=users, round__in=rounds)
+                           .values('user', 'round')
+                           .annotate(total=Sum('score'))
+                           .order_by()}
+    round_totals = list(RoundTotal.objects.select_for_update()
+                                          .filter(user__in=users,
+                                                  round__in=rounds))
+    for round_total in round_totals:
+        round_total.total = totals.get((round_total.user_id,
+                                        round_total.round), 0)
+    RoundTotal.objects.bulk_update(round_totals, ['total'],
+                                   batch_size=BATCH_SIZE)
+    return len(changed)
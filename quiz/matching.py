@@ -0,0 +1,147 @@
+"""
+Marking of free text answers.
+
+A guess is compared with the accepted answers after both have been
+normalized: case folded, accents and punctuation removed and a leading
+article dropped. Exact and token set hits are decided without any fuzzy
+scoring; only the remaining guesses are scored with fuzz.partial_ratio,
+and only against the few answers sharing the most trigrams with them, so
+questions with many accepted spellings cost about as much to mark as
+questions with a few.
+
+Short answers are only matched by fuzz.ratio on the whole guess, as a
+guess containing them, or containing something close to them, is not
+the same answer: "who cares" is not "The Who".
+"""
+import heapq
+import re
+import unicodedata
+from collections import Counter
+from itertools import chain
+
+from fuzzywuzzy import fuzz
+
+ARTICLES = ('the', 'a', 'an')
+
+# a guess is accepted when its partial ratio with an answer is above this
+FUZZY_THRESHOLD = 90
+
+# the number of answers a guess is scored against
+CANDIDATES = 5
+
+# answers shorter than this are compared with the whole guess
+SHORT_ANSWER = 6
+
+# the least an answer is left with once its article is dropped
+MIN_LENGTH = 3
+
+APOSTROPHES = re.compile(r"['‘’`]")
+PUNCTUATION = re.compile(r'[^\w\s]|_')
+
+
+def normalize(text):
+    """
+    Returns text case folded, without accents or punctuation and with any
+    leading article removed, as single spaced words. The article must be
+    a word of its own in text ("A-ha" keeps it) and is kept if dropping
+    it would leave fewer than MIN_LENGTH characters.
+    """
+    text = unicodedata.normalize('NFKD', str(text).casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = APOSTROPHES.sub('', text)
+    words = PUNCTUATION.sub(' ', text).split()
+    first = text.split()[:1]
+    if len(words) > 1 and first and first[0] in ARTICLES:
+        rest = ' '.join(words[1:])
+        if len(rest) >= MIN_LENGTH:
+            return rest
+    return ' '.join(words)
+
+
+def trigrams(text):
+    text = ' %s ' % text
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class AnswerMatcher(object):
+    """
+    Decides whether a guess matches one of a question's accepted answers.
+
+    Built once from the answers and kept with the question, so marking
+    a guess needs no queries. Answers are indexed by word, for token set
+    hits, and by trigram, to pick the candidates for fuzzy scoring.
+    """
+
+    def __init__(self, answers, threshold=FUZZY_THRESHOLD,
+                 candidates=CANDIDATES):
+        normalized = (normalize(answer) for answer in answers)
+        self.answers = tuple(sorted(set(a for a in normalized if a)))
+        self.exact = frozenset(self.answers)
+        self.threshold = threshold
+        self.candidates = candidates
+
+        self.word_counts = []
+        self.words = {}
+        self.trigram_counts = []
+        self.trigrams = {}
+        for index, answer in enumerate(self.answers):
+            words = set(answer.split())
+            self.word_counts.append(len(words))
+            for word in words:
+                self.words.setdefault(word, []).append(index)
+
+            grams = trigrams(answer)
+            self.trigram_counts.append(len(grams))
+            for gram in grams:
+                self.trigrams.setdefault(gram, []).append(index)
+
+    def __len__(self):
+        return len(self.answers)
+
+    def matches(self, guess):
+        guess = normalize(guess)
+        if not guess or not self.answers:
+            return False
+
+        if guess in self.exact:
+            return True
+
+        if self.token_set_hit(guess):
+            return True
+
+        return any(self.score(answer, guess) > self.threshold
+                   for answer in self.candidates_for(guess))
+
+    def score(self, answer, guess):
+        if len(answer) < SHORT_ANSWER:
+            return fuzz.ratio(answer, guess)
+        return fuzz.partial_ratio(answer, guess)
+
+    def token_set_hit(self, guess):
+        """
+        Returns True if every word of an answer is in guess. Short answers
+        are left to score().
+        """
+        hits = Counter(chain.from_iterable(self.words.get(word, ())
+                                           for word in set(guess.split())))
+        return any(count == self.word_counts[index]
+                   and len(self.answers[index]) >= SHORT_ANSWER
+                   for index, count in hits.items())
+
+    def candidates_for(self, guess):
+        """
+        Returns the answers most likely to match guess, ie. those sharing
+        the largest part of their trigrams (or of the guess's trigrams,
+        when it is the shorter) with it.
+        """
+        if len(self.answers) <= self.candidates:
+            return self.answers
+
+        grams = trigrams(guess)
+        shared = Counter(chain.from_iterable(self.trigrams.get(gram, ())
+                                             for gram in grams))
+        best = heapq.nlargest(
+            self.candidates, shared,
+            key=lambda index: shared[index] / min(self.trigram_counts[index],
+                                                  len(grams)))
+        return [self.answers[index] for index in best]
@@ -0,0 +1,109 @@
+"""
+Query instrumentation.
+
+QueryRecorder counts, times and keeps the slowest of the queries run while
+it is active. QueryTimingMiddleware records each request with one and, in
+debug mode, reports the figures in a Server-Timing header, which browsers
+show with the request's timings:
+
+    MIDDLEWARE = [
+        'quiz.middleware.QueryTimingMiddleware',
+        ...
+    ]
+"""
+import heapq
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+# the number of statements kept by QueryRecorder
+SLOWEST = 3
+
+# the length statements are cut to in the Server-Timing header
+DESCRIPTION_LENGTH = 100
+
+UNSAFE = re.compile(r'[^\x20-\x7e]|["\\]')
+
+
+class QueryRecorder(object):
+    """
+    Records the queries run on every database connection of this thread.
+
+        with QueryRecorder() as queries:
+            ...
+        queries.count, queries.duration, queries.slowest()
+
+    Durations are in seconds. Unlike django.db.connection.queries, this
+    works with DEBUG off.
+    """
+
+    def __init__(self, slowest=SLOWEST):
+        self.count = 0
+        self.duration = 0.0
+        self.keep = slowest
+        self._slowest = []
+        self._wrappers = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if self.keep:
+                heapq.heappush(self._slowest, (duration, self.count, sql))
+                if len(self._slowest) > self.keep:
+                    heapq.heappop(self._slowest)
+
+    def __enter__(self):
+        self._wrappers = ExitStack()
+        for connection in connections.all():
+            self._wrappers.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrappers.close()
+        self._wrappers = None
+
+    def slowest(self):
+        """
+        Returns (duration, sql) for the slowest statements, slowest first.
+        """
+        return [(duration, sql) for duration, _, sql
+                in sorted(self._slowest, reverse=True)]
+
+    def server_timing(self):
+        """
+        Returns the figures as the value of a Server-Timing header.
+        """
+        metrics = ['db;dur=%.2f;desc="%d queries"' % (self.duration * 1000,
+                                                       self.count)]
+        for i, (duration, sql) in enumerate(self.slowest(), 1):
+            description = UNSAFE.sub(' ', sql)[:DESCRIPTION_LENGTH]
+            metrics.append('sql-%d;dur=%.2f;desc="%s"' % (i, duration * 1000,
+                                                          description))
+        return ', '.join(metrics)
+
+
+class QueryTimingMiddleware(object):
+    """
+    Records the queries run for each request in request.queries and, when
+    DEBUG is on, adds a Server-Timing header describing them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as queries:
+            request.queries = queries
+            response = self.get_response(request)
+
+        if settings.DEBUG:
+            response['Server-Timing'] = queries.server_timing()
+        return response
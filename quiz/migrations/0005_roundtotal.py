@@ -0,0 +1,44 @@
+# Generated by Django 2.2 on 2026-10-18 19:06
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def populate_round_totals(apps, schema_editor):
+    Score = apps.get_model('quiz', 'Score')
+    RoundTotal = apps.get_model('quiz', 'RoundTotal')
+    totals = Score.objects.values('user', 'round')\
+                          .annotate(total=Sum('score')).order_by()
+    RoundTotal.objects.bulk_create(
+        [RoundTotal(user_id=row['user'], round=row['round'],
+                    total=row['total']) for row in totals],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0004_auto_20201229_1805'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoundTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('round', models.IntegerField(verbose_name='Round')),
+                ('total', models.FloatField(default=0, verbose_name='Total')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Round total',
+                'verbose_name_plural': 'Round totals',
+                'unique_together': {('user', 'round')},
+            },
+        ),
+        migrations.RunPython(populate_round_totals,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.2 on 2026-10-18 19:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """
+    Swaps the auto-created Question.quiz table for the QuizQuestion model.
+
+    QuizQuestion uses the existing quiz_question_quiz table, so the
+    relation is only changed in the migration state before the position
+    column is added to it.
+    """
+
+    dependencies = [
+        ('quiz', '0005_roundtotal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='round_number',
+            field=models.PositiveIntegerField(blank=True, db_index=True, help_text='Round that scores for this quiz are recorded against. Taken from the number at the end of the title if left blank.', null=True, verbose_name='Round Number'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='QuizQuestion',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.Question', verbose_name='Question')),
+                        ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.Quiz', verbose_name='Quiz')),
+                    ],
+                    options={
+                        'verbose_name': 'Quiz question',
+                        'verbose_name_plural': 'Quiz questions',
+                        'db_table': 'quiz_question_quiz',
+                        'unique_together': {('question', 'quiz')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='question',
+                    name='quiz',
+                    field=models.ManyToManyField(blank=True, through='quiz.QuizQuestion', to='quiz.Quiz', verbose_name='Quiz'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='quizquestion',
+            name='position',
+            field=models.PositiveIntegerField(default=0, verbose_name='Position'),
+        ),
+        migrations.AddIndex(
+            model_name='quizquestion',
+            index=models.Index(fields=['quiz', 'position'], name='quiz_questi_quiz_id_9f9962_idx'),
+        ),
+    ]
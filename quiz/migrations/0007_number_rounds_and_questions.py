@@ -0,0 +1,77 @@
+# Generated by Django 2.2 on 2026-10-18 19:10
+
+import re
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def number_rounds_and_questions(apps, schema_editor):
+    """
+    Fills in Quiz.round_number from the number ending the title and
+    QuizQuestion.position from the "R3 Q7 ..." prefix of the question
+    text. The prefix is only used when its round is the quiz's round (or
+    the quiz has none), as a question carried over from another round
+    keeps the prefix of that round, and when no other question of the
+    quiz has taken the number. The remaining questions follow in pk
+    order, ie. the order they were added in.
+    """
+    Quiz = apps.get_model('quiz', 'Quiz')
+    QuizQuestion = apps.get_model('quiz', 'QuizQuestion')
+
+    quizzes = []
+    for quiz in Quiz.objects.filter(round_number__isnull=True).iterator():
+        match = re.search(r'(\d+)\s*$', quiz.title)
+        if match:
+            quiz.round_number = int(match.group(1))
+            quizzes.append(quiz)
+    Quiz.objects.bulk_update(quizzes, ['round_number'],
+                             batch_size=BATCH_SIZE)
+
+    links = []
+    last_quiz, taken, unnumbered = None, set(), []
+
+    def number_unnumbered():
+        position = max(taken, default=0)
+        for link in unnumbered:
+            position += 1
+            link.position = position
+            links.append(link)
+
+    for link in QuizQuestion.objects.select_related('question', 'quiz')\
+                                    .order_by('quiz_id', 'pk')\
+                                    .iterator():
+        if link.quiz_id != last_quiz:
+            number_unnumbered()
+            last_quiz, taken, unnumbered = link.quiz_id, set(), []
+
+        match = re.match(r'\s*R(\d+)\s+Q(\d+)', link.question.content)
+        round_number = link.quiz.round_number
+        if match and int(match.group(2)) not in taken and \
+                round_number in (None, int(match.group(1))):
+            link.position = int(match.group(2))
+            taken.add(link.position)
+            links.append(link)
+        else:
+            unnumbered.append(link)
+
+        if len(links) >= BATCH_SIZE:
+            QuizQuestion.objects.bulk_update(links, ['position'])
+            links = []
+
+    number_unnumbered()
+    QuizQuestion.objects.bulk_update(links, ['position'],
+                                     batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0006_round_and_question_numbers'),
+    ]
+
+    operations = [
+        migrations.RunPython(number_rounds_and_questions,
+                             migrations.RunPython.noop),
+    ]
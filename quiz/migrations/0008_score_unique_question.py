@@ -0,0 +1,54 @@
+# Generated by Django 2.2 on 2026-10-18 19:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def remove_duplicate_scores(apps, schema_editor):
+    """
+    Keeps only the latest score for each user, round and question.
+    """
+    Score = apps.get_model('quiz', 'Score')
+    duplicates = Score.objects.values('user', 'round', 'question')\
+                              .annotate(count=Count('id'), latest=Max('id'))\
+                              .filter(count__gt=1).order_by()
+    for row in duplicates.iterator():
+        Score.objects.filter(user=row['user'], round=row['round'],
+                             question=row['question'])\
+                     .exclude(id=row['latest']).delete()
+
+
+def rebuild_round_totals(apps, schema_editor):
+    Score = apps.get_model('quiz', 'Score')
+    RoundTotal = apps.get_model('quiz', 'RoundTotal')
+    totals = Score.objects.values('user', 'round')\
+                          .annotate(total=Sum('score')).order_by()
+    RoundTotal.objects.all().delete()
+    RoundTotal.objects.bulk_create(
+        [RoundTotal(user_id=row['user'], round=row['round'],
+                    total=row['total']) for row in totals],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0007_number_rounds_and_questions'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_scores,
+                             migrations.RunPython.noop),
+        migrations.RunPython(rebuild_round_totals,
+                             migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='score',
+            unique_together={('user', 'round', 'question')},
+        ),
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(fields=['user', 'round', 'score'], name='quiz_score_user_id_08360c_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 2.2 on 2026-10-18 19:13
+
+import django.core.validators
+from django.db import migrations, models
+import re
+
+BATCH_SIZE = 500
+FIELDS = ['question_order', 'cursor', 'incorrect']
+
+
+def to_cursor_and_bitset(apps, schema_editor):
+    """
+    Converts the csv lists of unanswered and incorrect questions into a
+    cursor into question_order and a bitset over it.
+    """
+    Sitting = apps.get_model('quiz', 'Sitting')
+
+    def ids(csv):
+        return [int(n) for n in csv.split(',') if n]
+
+    sittings = []
+    for sitting in Sitting.objects.iterator():
+        order = ids(sitting.question_order)
+        index = {question_id: i for i, question_id in enumerate(order)}
+
+        sitting.question_order = ','.join(str(n) for n in order)
+        sitting.cursor = len(order) - len(ids(sitting.question_list))
+
+        bits = 0
+        for question_id in ids(sitting.incorrect_questions):
+            if question_id in index:
+                bits |= 1 << index[question_id]
+        sitting.incorrect = bits.to_bytes((bits.bit_length() + 7) // 8,
+                                          'little')
+
+        sittings.append(sitting)
+        if len(sittings) >= BATCH_SIZE:
+            Sitting.objects.bulk_update(sittings, FIELDS)
+            sittings = []
+
+    Sitting.objects.bulk_update(sittings, FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0008_score_unique_question'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitting',
+            name='cursor',
+            field=models.PositiveIntegerField(default=0, verbose_name='Cursor'),
+        ),
+        migrations.AddField(
+            model_name='sitting',
+            name='incorrect',
+            field=models.BinaryField(blank=True, default=b'', verbose_name='Incorrect questions'),
+        ),
+        migrations.AlterField(
+            model_name='sitting',
+            name='question_order',
+            field=models.TextField(validators=[django.core.validators.RegexValidator(re.compile('^\\d+(?:,\\d+)*\\Z'), code='invalid', message='Enter only digits separated by commas.')], verbose_name='Question Order'),
+        ),
+        migrations.RunPython(to_cursor_and_bitset,
+                             migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='sitting',
+            name='incorrect_questions',
+        ),
+        migrations.RemoveField(
+            model_name='sitting',
+            name='question_list',
+        ),
+    ]
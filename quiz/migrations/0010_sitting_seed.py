@@ -0,0 +1,30 @@
+# Generated by Django 2.2 on 2026-10-18 19:16
+
+import django.core.validators
+from django.db import migrations, models
+import re
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0009_compact_sitting_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitting',
+            name='pack_version',
+            field=models.CharField(blank=True, max_length=40, verbose_name='Pack Version'),
+        ),
+        migrations.AddField(
+            model_name='sitting',
+            name='seed',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Seed'),
+        ),
+        migrations.AlterField(
+            model_name='sitting',
+            name='question_order',
+            field=models.TextField(blank=True, validators=[django.core.validators.RegexValidator(re.compile('^\\d+(?:,\\d+)*\\Z'), code='invalid', message='Enter only digits separated by commas.')], verbose_name='Question Order'),
+        ),
+    ]
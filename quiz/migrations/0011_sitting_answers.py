@@ -0,0 +1,133 @@
+# Generated by Django 2.2 on 2026-10-18 19:25
+
+import json
+import random
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+BATCH_SIZE = 500
+
+
+def question_ids(sitting, QuizQuestion):
+    """
+    The sitting's question order, derived as QuizPack.order() does when
+    it is not stored.
+    """
+    if sitting.question_order or sitting.seed is None:
+        return [int(n) for n in sitting.question_order.split(',') if n]
+
+    ids = list(QuizQuestion.objects.filter(quiz_id=sitting.quiz_id)
+                                   .order_by('position', 'pk')
+                                   .values_list('question_id', flat=True))
+    if sitting.seed:
+        random.Random(sitting.seed).shuffle(ids)
+    if sitting.quiz.max_questions:
+        ids = ids[:sitting.quiz.max_questions]
+    return ids
+
+
+def to_answer_log(apps, schema_editor):
+    """
+    Copies the answers held in each sitting's user_answers json into
+    SittingAnswer rows. Each answer's score is the one stored for it in
+    Score, as music questions can score half a point; answers without a
+    stored score, from quizzes with no round number, score 1 if correct.
+    """
+    Sitting = apps.get_model('quiz', 'Sitting')
+    SittingAnswer = apps.get_model('quiz', 'SittingAnswer')
+    QuizQuestion = apps.get_model('quiz', 'QuizQuestion')
+    Question = apps.get_model('quiz', 'Question')
+    Score = apps.get_model('quiz', 'Score')
+
+    existing = set(Question.objects.values_list('pk', flat=True))
+    positions = {(quiz_id, question_id): position for
+                 quiz_id, question_id, position in
+                 QuizQuestion.objects.values_list('quiz', 'question',
+                                                  'position')}
+    scores = {(user_id, round, position): score for
+              user_id, round, position, score in
+              Score.objects.values_list('user', 'round', 'question', 'score')}
+    answers = []
+    for sitting in Sitting.objects.select_related('quiz').iterator():
+        user_answers = json.loads(sitting.user_answers or '{}')
+        if not user_answers:
+            continue
+
+        index = {question_id: i for i, question_id
+                 in enumerate(question_ids(sitting, QuizQuestion))}
+        bits = int.from_bytes(bytes(sitting.incorrect or b''), 'little')
+        answered = sitting.end or sitting.start
+
+        for question_id, guess in user_answers.items():
+            question_id = int(question_id)
+            if question_id not in existing or question_id not in index:
+                continue
+
+            title = ''
+            if isinstance(guess, (list, tuple)):
+                guess, title = guess
+            position = index[question_id]
+            correct = not bits >> position & 1
+            score = scores.get((sitting.user_id, sitting.quiz.round_number,
+                                positions.get((sitting.quiz_id,
+                                               question_id))))
+            if score is None:
+                score = 1 if correct else 0
+            answers.append(SittingAnswer(sitting_id=sitting.pk,
+                                         question_id=question_id,
+                                         position=position,
+                                         guess=str(guess),
+                                         title=title or '',
+                                         correct=correct,
+                                         score=score,
+                                         answered=answered))
+
+        if len(answers) >= BATCH_SIZE:
+            SittingAnswer.objects.bulk_create(answers)
+            answers = []
+
+    SittingAnswer.objects.bulk_create(answers)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0010_sitting_seed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SittingAnswer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(verbose_name='Position')),
+                ('guess', models.TextField(blank=True, verbose_name='Guess')),
+                ('title', models.CharField(blank=True, max_length=1000, verbose_name='Title')),
+                ('correct', models.BooleanField(default=False, verbose_name='Correct')),
+                ('score', models.FloatField(default=0, verbose_name='Score')),
+                ('answered', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Answered')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.Question', verbose_name='Question')),
+                ('sitting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='quiz.Sitting', verbose_name='Sitting')),
+            ],
+            options={
+                'verbose_name': 'Sitting answer',
+                'verbose_name_plural': 'Sitting answers',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='sittinganswer',
+            index=models.Index(fields=['sitting', 'position'], name='quiz_sittin_sitting_f0531b_idx'),
+        ),
+        migrations.RunPython(to_answer_log, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='sittinganswer',
+            name='answered',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Answered'),
+        ),
+        migrations.RemoveField(
+            model_name='sitting',
+            name='user_answers',
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2 on 2026-10-18 19:28
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def count_logged_answers(apps, schema_editor):
+    """
+    Starts the counters from the answers already logged.
+    """
+    SittingAnswer = apps.get_model('quiz', 'SittingAnswer')
+    QuestionStatistic = apps.get_model('quiz', 'QuestionStatistic')
+
+    counts = SittingAnswer.objects.values('question')\
+                                  .annotate(answered=Count('pk'),
+                                            correct=Sum('correct'))\
+                                  .order_by()
+    QuestionStatistic.objects.bulk_create(
+        [QuestionStatistic(question_id=row['question'],
+                           answered=row['answered'],
+                           correct=row['correct'] or 0)
+         for row in counts], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0011_sitting_answers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStatistic',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistic', serialize=False, to='quiz.Question', verbose_name='Question')),
+                ('answered', models.PositiveIntegerField(default=0, verbose_name='Answered')),
+                ('correct', models.IntegerField(default=0, verbose_name='Correct')),
+            ],
+            options={
+                'verbose_name': 'Question statistic',
+                'verbose_name_plural': 'Question statistics',
+            },
+        ),
+        migrations.RunPython(count_logged_answers, migrations.RunPython.noop),
+    ]
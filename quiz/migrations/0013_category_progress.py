@@ -0,0 +1,80 @@
+# Generated by Django 2.2 on 2026-10-18 19:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import re
+
+
+def split_scores(apps, schema_editor):
+    """
+    Moves each category's score and possible score out of the
+    "category,score,possible," string kept on Progress.
+    """
+    Category = apps.get_model('quiz', 'Category')
+    CategoryProgress = apps.get_model('quiz', 'CategoryProgress')
+    Progress = apps.get_model('quiz', 'Progress')
+
+    categories = list(Category.objects.exclude(category=None))
+    rows = []
+    for progress in Progress.objects.exclude(score='').iterator():
+        for category in categories:
+            match = re.search(re.escape(category.category) + r",(\d+),(\d+),",
+                              progress.score, re.IGNORECASE)
+            if match and int(match.group(2)):
+                rows.append(CategoryProgress(user_id=progress.user_id,
+                                             category=category,
+                                             score=int(match.group(1)),
+                                             possible=int(match.group(2))))
+    CategoryProgress.objects.bulk_create(rows, batch_size=500)
+
+
+def join_scores(apps, schema_editor):
+    CategoryProgress = apps.get_model('quiz', 'CategoryProgress')
+    Progress = apps.get_model('quiz', 'Progress')
+
+    scores = {}
+    for row in CategoryProgress.objects.select_related('category')\
+                                       .order_by('pk'):
+        scores.setdefault(row.user_id, []).append(
+            '%s,%d,%d,' % (row.category.category, row.score, row.possible))
+    for user_id, score in scores.items():
+        Progress.objects.update_or_create(user_id=user_id,
+                                          defaults={'score': ''.join(score)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0012_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField(default=0, verbose_name='Score')),
+                ('possible', models.PositiveIntegerField(default=0, verbose_name='Possible')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_scores', to='quiz.Category', verbose_name='Category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Category progress',
+                'verbose_name_plural': 'Category progress',
+                'unique_together': {('user', 'category')},
+            },
+        ),
+        migrations.RunPython(split_scores, join_scores),
+        # gives the column a default, so that it can be added back
+        migrations.AlterField(
+            model_name='progress',
+            name='score',
+            field=models.CharField(default='', max_length=1024, verbose_name='Score'),
+        ),
+        migrations.RemoveField(
+            model_name='progress',
+            name='score',
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.2 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+def set_question_types(apps, schema_editor):
+    """
+    Labels each existing question with the model of the table it has a
+    row in.
+    """
+    Question = apps.get_model('quiz', 'Question')
+    Question.objects.update(question_type='quiz.question')
+    for model in apps.get_models():
+        if Question in model._meta.parents:
+            Question.objects.filter(pk__in=model.objects.values('pk'))\
+                            .update(question_type=model._meta.label_lower)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0013_category_progress'),
+        ('essay', '0002_essay_answer'),
+        ('multichoice', '0002_statistics'),
+        ('music', '0001_initial'),
+        ('true_false', '0002_remove_ordering'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='question',
+            options={'verbose_name': 'Question', 'verbose_name_plural': 'Questions'},
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='question_type',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Question type'),
+        ),
+        migrations.RunPython(set_question_types, migrations.RunPython.noop),
+    ]
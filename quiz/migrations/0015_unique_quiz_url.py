@@ -0,0 +1,48 @@
+# Generated by Django 2.2 on 2026-10-18 19:41
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def deduplicate_urls(apps, schema_editor):
+    """
+    Keeps the url of the oldest quiz using it and numbers the others,
+    eg. round-1-2, round-1-3.
+    """
+    Quiz = apps.get_model('quiz', 'Quiz')
+
+    urls = set(Quiz.objects.values_list('url', flat=True))
+    duplicated = Quiz.objects.values('url').annotate(count=Count('pk'))\
+                             .filter(count__gt=1).values_list('url', flat=True)
+
+    kept = set()
+    for quiz in Quiz.objects.filter(url__in=list(duplicated)).order_by('pk'):
+        if quiz.url not in kept:
+            kept.add(quiz.url)
+            continue
+
+        number = 2
+        while True:
+            suffix = '-%d' % number
+            url = quiz.url[:60 - len(suffix)] + suffix
+            if url not in urls:
+                break
+            number += 1
+        urls.add(url)
+        Quiz.objects.filter(pk=quiz.pk).update(url=url)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0014_question_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_urls, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='quiz',
+            name='url',
+            field=models.SlugField(help_text='a user friendly url', max_length=60, unique=True, verbose_name='user friendly url'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2 on 2026-10-18 19:58
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def number_questions(apps, schema_editor):
+    """
+    Gives links saved without a position, eg. from the admin, the next
+    free positions in their quizzes, in the order they were added.
+    """
+    QuizQuestion = apps.get_model('quiz', 'QuizQuestion')
+
+    for link in QuizQuestion.objects.filter(position=0).order_by('pk'):
+        last = QuizQuestion.objects.filter(quiz_id=link.quiz_id)\
+                                   .aggregate(last=Max('position'))['last']
+        QuizQuestion.objects.filter(pk=link.pk)\
+                            .update(position=(last or 0) + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0015_unique_quiz_url'),
+    ]
+
+    operations = [
+        migrations.RunPython(number_questions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 2.2 on 2026-10-18 20:04
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import random
+import re
+
+BATCH_SIZE = 500
+
+
+def store_question_orders(apps, schema_editor):
+    """
+    Sittings started so far derive their question order from a pack that
+    was only ever cached, and may be gone. Their order is written out
+    from the quiz's questions as they are now, which is what the sitting
+    would otherwise have fallen back to, so it no longer changes.
+    """
+    Sitting = apps.get_model('quiz', 'Sitting')
+    QuizQuestion = apps.get_model('quiz', 'QuizQuestion')
+
+    orders = {}
+    changed = []
+    sittings = Sitting.objects.filter(question_order='', seed__isnull=False)\
+                              .select_related('quiz')
+    for sitting in sittings.iterator():
+        if sitting.quiz_id not in orders:
+            orders[sitting.quiz_id] = list(
+                QuizQuestion.objects.filter(quiz_id=sitting.quiz_id)
+                                    .order_by('position', 'pk')
+                                    .values_list('question_id', flat=True))
+        ids = list(orders[sitting.quiz_id])
+        if sitting.seed:
+            random.Random(sitting.seed).shuffle(ids)
+        if sitting.quiz.max_questions:
+            ids = ids[:sitting.quiz.max_questions]
+        sitting.question_order = ','.join(str(n) for n in ids)
+        changed.append(sitting)
+
+    Sitting.objects.bulk_update(changed, ['question_order'],
+                                batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0016_number_unpositioned_questions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=40, verbose_name='Digest')),
+                ('question_ids', models.TextField(blank=True, validators=[django.core.validators.RegexValidator(re.compile('^\\d+(?:,\\d+)*\\Z'), code='invalid', message='Enter only digits separated by commas.')], verbose_name='Question ids')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.Quiz', verbose_name='Quiz')),
+            ],
+            options={
+                'verbose_name': 'Pack version',
+                'verbose_name_plural': 'Pack versions',
+                'unique_together': {('quiz', 'digest')},
+            },
+        ),
+        migrations.RunPython(store_question_orders,
+                             migrations.RunPython.noop),
+    ]
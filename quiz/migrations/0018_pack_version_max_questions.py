@@ -0,0 +1,33 @@
+# Generated by Django 2.2 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+def copy_max_questions(apps, schema_editor):
+    """
+    Versions recorded so far were ordered with the quiz's max_questions as
+    it is now, so that is the number their sittings take.
+    """
+    PackVersion = apps.get_model('quiz', 'PackVersion')
+    Quiz = apps.get_model('quiz', 'Quiz')
+
+    for quiz_id, max_questions in Quiz.objects.filter(
+            max_questions__isnull=False).values_list('pk', 'max_questions'):
+        PackVersion.objects.filter(quiz_id=quiz_id)\
+                           .update(max_questions=max_questions or None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0017_pack_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='packversion',
+            name='max_questions',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Max Questions'),
+        ),
+        migrations.RunPython(copy_max_questions, migrations.RunPython.noop),
+    ]
@@ -1,19 +1,35 @@
 from __future__ import unicode_literals
 import re
 import json
-
-from django.db import models
-from django.core.exceptions import ValidationError, ImproperlyConfigured
+import random
+from contextlib import contextmanager
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, FilteredRelation, Max, Q, Sum
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from django.core.exceptions import (
+    ValidationError, ImproperlyConfigured, ObjectDoesNotExist,
+)
 from django.core.validators import (
     MaxValueValidator, validate_comma_separated_integer_list,
 )
 from django.utils.translation import ugettext_lazy as _
 from django.utils.timezone import now
 from django.utils.encoding import python_2_unicode_compatible
+from django.utils.text import slugify
 from django.conf import settings
 
 from model_utils.managers import InheritanceManager
 
+from .cache import watch_question_models, watch_quiz_model
+from .matching import AnswerMatcher
+from .pack import get_pack, get_pack_version, shuffled
+
+MAX_SEED = 2 ** 31 - 1
+
 
 class CategoryManager(models.Manager):
 
@@ -64,6 +80,17 @@ class SubCategory(models.Model):
         return self.sub_category + " (" + self.category.category + ")"
 
 
+def round_number_from_title(title):
+    """
+    Returns the number at the end of a quiz title, eg. 12 for "Round 12",
+    or None if there is not one.
+    """
+    match = re.search(r'(\d+)\s*$', title or '')
+    if match:
+        return int(match.group(1))
+    return None
+
+
 @python_2_unicode_compatible
 class Quiz(models.Model):
 
@@ -76,7 +103,7 @@ class Quiz(models.Model):
         blank=True, help_text=_("a description of the quiz"))
 
     url = models.SlugField(
-        max_length=60, blank=False,
+        max_length=60, blank=False, unique=True,
         help_text=_("a user friendly url"),
         verbose_name=_("user friendly url"))
 
@@ -137,12 +164,22 @@ class Quiz(models.Model):
                     " taken by users who can edit"
                     " quizzes."))
 
+    round_number = models.PositiveIntegerField(
+        blank=True, null=True, db_index=True,
+        verbose_name=_("Round Number"),
+        help_text=_("Round that scores for this quiz are recorded"
+                    " against. Taken from the number at the end"
+                    " of the title if left blank."))
+
     def save(self, force_insert=False, force_update=False, *args, **kwargs):
         self.url = re.sub('\s+', '-', self.url).lower()
 
         self.url = ''.join(letter for letter in self.url if
                            letter.isalnum() or letter == '-')
 
+        if self.round_number is None:
+            self.round_number = round_number_from_title(self.title)
+
         if self.single_attempt is True:
             self.exam_paper = True
 
@@ -159,12 +196,28 @@ class Quiz(models.Model):
         return self.title
 
     def get_questions(self):
-        # print(f"QS: {self.question_set.all().select_subclasses()}")
-        return self.question_set.all().select_subclasses()
+        """
+        Returns the quiz's questions in position order, read by an index
+        scan of the links and one query per question type.
+        """
+        links = list(self.quizquestion_set.order_by('position', 'pk')
+                                          .values_list('question_id',
+                                                       'question__question_type'))
+        return Question.objects.by_type([question_id for question_id, _
+                                         in links], types=dict(links))
 
     @property
     def get_max_score(self):
-        return self.get_questions().count()
+        return self.question_set.count()
+
+    def new_seed(self):
+        """
+        Returns the seed a new sitting's question order is derived from;
+        0 keeps the questions in the order they are set.
+        """
+        if self.random_order is True:
+            return random.randint(1, MAX_SEED)
+        return 0
 
     def anon_score_id(self):
         return str(self.id) + "_score"
@@ -176,11 +229,52 @@ class Quiz(models.Model):
         return str(self.id) + "_data"
 
 
+watch_quiz_model(Quiz)
+
+
+class DeferredSaveMixin(object):
+    """
+    Lets the helper methods of a model that save after each change be
+    grouped, so that all of their changes are written with one UPDATE.
+
+        with transaction.atomic(), sitting.deferred_save():
+            sitting.add_to_score(1)
+            sitting.remove_first_question()
+    """
+    _deferred_fields = None
+
+    def save_or_defer(self, *fields):
+        """
+        Saves the given fields now, or records them to be saved when the
+        enclosing deferred_save block ends.
+        """
+        if self._deferred_fields is None:
+            self.save()
+        else:
+            self._deferred_fields.update(fields)
+
+    @contextmanager
+    def deferred_save(self):
+        if self._deferred_fields is not None:
+            # already batching, the outermost block does the save
+            yield self
+            return
+
+        self._deferred_fields = set()
+        try:
+            yield self
+            fields = self._deferred_fields
+        finally:
+            self._deferred_fields = None
+
+        if fields:
+            self.save(update_fields=sorted(fields))
+
+
 class ProgressManager(models.Manager):
 
     def new_progress(self, user):
-        new_progress = self.create(user=user,
-                                   score="")
+        new_progress = self.create(user=user)
         new_progress.save()
         return new_progress
 
@@ -190,15 +284,10 @@ class Progress(models.Model):
     Progress is used to track an individual signed in users score on different
     quiz's and categories
 
-    Data stored in csv using the format:
-        category, score, possible, category, score, possible, ...
+    The scores are kept per category in CategoryProgress.
     """
     user = models.OneToOneField(settings.AUTH_USER_MODEL, verbose_name=_("User"), on_delete=models.CASCADE)
 
-    score = models.CharField(max_length=1024,
-                             verbose_name=_("Score"),
-                             validators=[validate_comma_separated_integer_list])
-
     objects = ProgressManager()
 
     class Meta:
@@ -217,36 +306,7 @@ class Progress(models.Model):
 
         The dict will have one key for every category that you have defined
         """
-        score_before = self.score
-        output = {}
-
-        for cat in Category.objects.all():
-            to_find = re.escape(cat.category) + r",(\d+),(\d+),"
-            #  group 1 is score, group 2 is highest possible
-
-            match = re.search(to_find, self.score, re.IGNORECASE)
-
-            if match:
-                score = int(match.group(1))
-                possible = int(match.group(2))
-
-                try:
-                    percent = int(round((float(score) / float(possible))
-                                        * 100))
-                except:
-                    percent = 0
-
-                output[cat.category] = [score, possible, percent]
-
-            else:  # if category has not been added yet, add it.
-                self.score += cat.category + ",0,0,"
-                output[cat.category] = [0, 0]
-
-        if len(self.score) > len(score_before):
-            # If a new category has been added, save changes.
-            self.save()
-
-        return output
+        return CategoryProgress.objects.scores(self.user_id)
 
     def update_score(self, question, score_to_add=0, possible_to_add=0):
         """
@@ -255,94 +315,80 @@ class Progress(models.Model):
 
         Does not return anything.
         """
-        category_test = Category.objects.filter(category=question.category)\
-                                        .exists()
-
-        if any([item is False for item in [category_test,
+        if any([item is False for item in [question.category_id is not None,
                                            score_to_add,
                                            possible_to_add,
                                            isinstance(score_to_add, int),
                                            isinstance(possible_to_add, int)]]):
             return _("error"), _("category does not exist or invalid score")
 
-        to_find = re.escape(str(question.category)) +\
-            r",(?P<score>\d+),(?P<possible>\d+),"
-
-        match = re.search(to_find, self.score, re.IGNORECASE)
-
-        if match:
-            updated_score = int(match.group('score')) + abs(score_to_add)
-            updated_possible = int(match.group('possible')) +\
-                abs(possible_to_add)
-
-            new_score = ",".join(
-                [
-                    str(question.category),
-                    str(updated_score),
-                    str(updated_possible), ""
-                ])
-
-            # swap old score for the new one
-            self.score = self.score.replace(match.group(), new_score)
-            self.save()
-
-        else:
-            #  if not present but existing, add with the points passed in
-            self.score += ",".join(
-                [
-                    str(question.category),
-                    str(score_to_add),
-                    str(possible_to_add),
-                    ""
-                ])
-            self.save()
+        CategoryProgress.objects.add({'score': abs(score_to_add),
+                                      'possible': abs(possible_to_add)},
+                                     user_id=self.user_id,
+                                     category_id=question.category_id)
 
     def show_exams(self):
         """
         Finds the previous quizzes marked as 'exam papers'.
         Returns a queryset of complete exams.
         """
-        return Sitting.objects.filter(user=self.user, complete=True)
+        return Sitting.objects.filter(user_id=self.user_id, complete=True)
 
     def __str__(self):
         return str(self.user)
 
 class SittingManager(models.Manager):
 
-    def new_sitting(self, user, quiz):
-        if quiz.random_order is True:
-            question_set = quiz.question_set.all() \
-                                            .select_subclasses() \
-                                            .order_by('?')
-        else:
-            question_set = quiz.question_set.all() \
-                                            .select_subclasses().order_by('content')
-
+    def _unsaved_sitting(self, user, quiz, pack):
+        if len(pack) == 0:
+            raise ImproperlyConfigured('Question set of the quiz is empty. '
+                                       'Please configure questions properly')
 
-        question_set = [item.id for item in question_set]
+        return self.model(user=user,
+                          quiz=quiz,
+                          question_order='',
+                          seed=quiz.new_seed(),
+                          pack_version=pack.digest,
+                          cursor=0,
+                          incorrect=b'',
+                          current_score=0,
+                          complete=False)
 
+    def new_sitting(self, user, quiz):
+        new_sitting = self._unsaved_sitting(user, quiz, get_pack(quiz.id))
+        new_sitting.save(force_insert=True, using=self.db)
+        return new_sitting
 
-        if len(question_set) == 0:
-            raise ImproperlyConfigured('Question set of the quiz is empty. '
-                                       'Please configure questions properly')
+    def open_round(self, quiz, users=None):
+        """
+        Takes the quiz out of draft and creates a sitting for each of users
+        (by default every active user) that does not already have one in
+        progress, so players starting the round only read their sitting.
+        Players who have completed a single attempt quiz are skipped.
 
-        if quiz.max_questions and quiz.max_questions < len(question_set):
-            question_set = question_set[:quiz.max_questions]
+        Returns the number of sittings created.
+        """
+        if users is None:
+            users = get_user_model().objects.filter(is_active=True)\
+                                            .only('pk')
 
+        pack = get_pack(quiz.id)
 
-        questions = ",".join(map(str, question_set)) + ","
+        with transaction.atomic():
+            existing = self.filter(quiz=quiz)
+            if quiz.single_attempt is not True:
+                existing = existing.filter(complete=False)
+            skip = set(existing.values_list('user_id', flat=True))
 
+            sittings = [self._unsaved_sitting(user, quiz, pack)
+                        for user in users if user.pk not in skip]
+            self.bulk_create(sittings, batch_size=500)
 
+            if quiz.draft:
+                quiz.draft = False
+                quiz.save(update_fields=['draft'])
 
-        new_sitting = self.create(user=user,
-                                  quiz=quiz,
-                                  question_order=questions,
-                                  question_list=questions,
-                                  incorrect_questions="",
-                                  current_score=0,
-                                  complete=False,
-                                  user_answers='{}')
-        return new_sitting
+        return len(sittings)
 
     def user_sitting(self, user, quiz):
         if quiz.single_attempt is True and self.filter(user=user,
@@ -357,56 +403,62 @@ class SittingManager(models.Manager):
             sitting = self.new_sitting(user, quiz)
         except Sitting.MultipleObjectsReturned:
             sitting = self.filter(user=user, quiz=quiz, complete=False)[0]
+        sitting.quiz = quiz
         return sitting
 
 
-class Sitting(models.Model):
+class Sitting(DeferredSaveMixin, models.Model):
     """
     Used to store the progress of logged in users sitting a quiz.
     Replaces the session system used by anon users.
 
+    Seed and pack_version fix the questions of the sitting and their
+    order: the quiz's pack with that digest, shuffled by seed (0 keeps
+    the order they are set in) and cut to the max_questions the pack was
+    built with, so editing the quiz does not move open sittings.
+
     Question_order is a list of integer pks of all the questions in the
-    quiz, in order.
+    quiz, in order, in csv format. It is only kept for sittings started
+    before the order was derived, and is empty otherwise.
 
-    Question_list is a list of integers which represent id's of
-    the unanswered questions in csv format.
+    Cursor is the index in question_order of the next question to be
+    answered; the questions before it have been answered.
 
-    Incorrect_questions is a list in the same format.
+    Incorrect is a bitset over question_order, with a bit set for each
+    question answered incorrectly.
 
     Sitting deleted when quiz finished unless quiz.exam_paper is true.
 
-    User_answers is a json object in which the question PK is stored
-    with the answer the user gave.
+    The question order is decoded once, the first time it is needed.
+
+    The answers given are logged in SittingAnswer, one row per answer.
     """
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_("User"), on_delete=models.CASCADE)
 
     quiz = models.ForeignKey(Quiz, verbose_name=_("Quiz"), on_delete=models.CASCADE)
 
-    question_order = models.CharField(
-        max_length=1024,
-        verbose_name=_("Question Order"),
+    question_order = models.TextField(
+        blank=True, verbose_name=_("Question Order"),
         validators=[validate_comma_separated_integer_list])
 
-    question_list = models.CharField(
-        max_length=1024,
-        verbose_name=_("Question List"),
-        validators=[validate_comma_separated_integer_list])
+    seed = models.PositiveIntegerField(null=True, blank=True,
+                                       verbose_name=_("Seed"))
 
-    incorrect_questions = models.CharField(
-        max_length=1024,
-        blank=True,
-        verbose_name=_("Incorrect questions"),
-        validators=[validate_comma_separated_integer_list])
+    pack_version = models.CharField(max_length=40, blank=True,
+                                    verbose_name=_("Pack Version"))
+
+    cursor = models.PositiveIntegerField(default=0,
+                                         verbose_name=_("Cursor"))
+
+    incorrect = models.BinaryField(default=b'', blank=True,
+                                   verbose_name=_("Incorrect questions"))
 
     current_score = models.IntegerField(verbose_name=_("Current Score"))
 
     complete = models.BooleanField(default=False, blank=False,
                                    verbose_name=_("Complete"))
 
-    user_answers = models.TextField(blank=True, default='{}',
-                                    verbose_name=_("User Answers"))
-
     start = models.DateTimeField(auto_now_add=True,
                                  verbose_name=_("Start"))
 
@@ -417,40 +469,92 @@ class Sitting(models.Model):
     class Meta:
         permissions = (("view_sittings", _("Can see completed exams.")),)
 
+    _order = None
+    _answers = None
+
+    def _question_ids(self):
+        key = (self.question_order, self.seed, self.pack_version)
+        if self._order is None or self._order[0] != key:
+            if self.question_order or self.seed is None:
+                ids = [int(n) for n in self.question_order.split(',') if n]
+            else:
+                ids = get_pack_version(self.quiz_id, self.pack_version)\
+                    .order(self.seed)
+            self._order = (key, ids,
+                           {question_id: index
+                            for index, question_id in enumerate(ids)})
+        return self._order[1]
+
+    def has_question(self, question_id):
+        self._question_ids()
+        return question_id in self._order[2]
+
+    def _question_index(self, question_id):
+        self._question_ids()
+        try:
+            return self._order[2][question_id]
+        except KeyError:
+            raise ValueError('Question %s is not part of this sitting'
+                             % question_id)
+
+    def _user_answers(self):
+        if self._answers is None:
+            self._answers = {
+                str(answer.question_id): answer.answer
+                for answer in self.answers.order_by('position', 'pk')}
+        return self._answers
+
+    @property
+    def user_answers(self):
+        """
+        The answers given, as a json object keyed on question pk.
+        """
+        return json.dumps(self._user_answers())
+
+    def _incorrect_bits(self):
+        return int.from_bytes(bytes(self.incorrect or b''), 'little')
+
+    def _set_incorrect_bits(self, bits):
+        self.incorrect = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+    def _remaining_ids(self):
+        return self._question_ids()[self.cursor:]
+
+    @property
+    def question_list(self):
+        """
+        The unanswered questions, in the csv format previously stored.
+        """
+        return ''.join('%s,' % question_id
+                       for question_id in self._remaining_ids())
+
     def get_first_question(self):
         """
         Returns the next question.
         If no question is found, returns False
         Does NOT remove the question from the front of the list.
         """
-        if not self.question_list:
+        remaining = self._remaining_ids()
+        if not remaining:
             return False
 
-        # print(self.question_list)
-
-        first, _ = self.question_list.split(',', 1)
-        question_id = int(first)
-        return Question.objects.get_subclass(id=question_id)
+        return get_pack(self.quiz_id).question(remaining[0])
 
     def remove_first_question(self):
-        if not self.question_list:
+        if not self._remaining_ids():
             return
 
-        _, others = self.question_list.split(',', 1)
-        self.question_list = others
-        self.save()
+        self.cursor += 1
+        self.save_or_defer('cursor')
 
     def add_to_score(self, points):
         self.current_score += int(points)
-        self.save()
+        self.save_or_defer('current_score')
 
     @property
     def get_current_score(self):
         return self.current_score
 
-    def _question_ids(self):
-        return [int(n) for n in self.question_order.split(',') if n]
-
     @property
     def get_percent_correct(self):
         dividend = float(self.current_score)
@@ -467,29 +571,50 @@ class Sitting(models.Model):
             return correct
         else:
             return 0
-    
+
     @property
     def get_incorrect_questions_list(self):
-        # print([int(num) for num in self.incorrect_questions.split(",") if num !=''])
         """ returns id/pk of incorrect questions """
-        return [int(num) for num in self.incorrect_questions.split(",") if num !='']
+        return self.get_incorrect_questions
 
     def mark_quiz_complete(self):
         self.complete = True
         self.end = now()
-        self.save()
+        self.save_or_defer('complete', 'end')
 
     def add_incorrect_question(self, question):
         """
-        Adds uid of incorrect question to the list.
+        Marks the question as answered incorrectly.
         The question object must be passed in.
         """
-        if len(self.incorrect_questions) > 0:
-            self.incorrect_questions += ','
-        self.incorrect_questions += str(question.id) + ","
+        bit = 1 << self._question_index(question.id)
+        bits = self._incorrect_bits()
+        if bits & bit:
+            return
+
+        self._set_incorrect_bits(bits | bit)
         if self.complete:
             self.add_to_score(-1)
-        self.save()
+        self.save_or_defer('incorrect')
+
+    def mark_question(self, question_id, is_correct):
+        """
+        Changes the verdict on an answered question, adjusting the score
+        to match. Returns True if the verdict has changed.
+        Does not save the sitting.
+        """
+        bit = 1 << self._question_index(question_id)
+        bits = self._incorrect_bits()
+        if bool(bits & bit) is not bool(is_correct):
+            return False
+
+        if is_correct:
+            self._set_incorrect_bits(bits & ~bit)
+            self.current_score += 1
+        else:
+            self._set_incorrect_bits(bits | bit)
+            self.current_score -= 1
+        return True
 
     @property
     def get_incorrect_questions(self):
@@ -497,14 +622,35 @@ class Sitting(models.Model):
         Returns a list of non empty integers, representing the pk of
         questions
         """
-        return [int(q) for q in self.incorrect_questions.split(',') if q]
+        bits = self._incorrect_bits()
+        return [question_id for index, question_id
+                in enumerate(self._question_ids()) if bits >> index & 1]
+
+    @property
+    def incorrect_questions(self):
+        """
+        The incorrectly answered questions, in csv format.
+        """
+        return ','.join(map(str, self.get_incorrect_questions))
+
+    @incorrect_questions.setter
+    def incorrect_questions(self, value):
+        bits = 0
+        for question_id in value.split(','):
+            if question_id and int(question_id) in self._question_ids():
+                bits |= 1 << self._question_index(int(question_id))
+        self._set_incorrect_bits(bits)
 
     def remove_incorrect_question(self, question):
-        current = self.get_incorrect_questions
-        current.remove(question.id)
-        self.incorrect_questions = ','.join(map(str, current))
+        bit = 1 << self._question_index(question.id)
+        bits = self._incorrect_bits()
+        if not bits & bit:
+            raise ValueError('Question %s is not marked incorrect'
+                             % question.id)
+
+        self._set_incorrect_bits(bits & ~bit)
         self.add_to_score(1)
-        self.save()
+        self.save_or_defer('incorrect')
 
     @property
     def check_if_passed(self):
@@ -517,23 +663,36 @@ class Sitting(models.Model):
         else:
             return self.quiz.fail_text
 
-    def add_user_answer(self, question, guess):
-        current = json.loads(self.user_answers)
-        current[question.id] = guess
-        self.user_answers = json.dumps(current)
-        self.save()
+    def add_user_answer(self, question, guess, is_correct=False, score=0):
+        """
+        Logs the answer given to a question, with a single insert.
+        guess may be an (artist, title) pair for a music question.
+        """
+        title = ''
+        if isinstance(guess, (list, tuple)):
+            guess, title = guess
+        position = self._question_index(question.id)
+
+        answer = SittingAnswer.objects.create(sitting=self,
+                                              question_id=question.id,
+                                              position=position,
+                                              guess=guess,
+                                              title=title or '',
+                                              correct=bool(is_correct),
+                                              score=score)
+        if self._answers is not None:
+            self._answers[str(question.id)] = answer.answer
 
     def get_questions(self, with_answers=False):
-        question_ids = self._question_ids()
-        questions = sorted(
-            self.quiz.question_set.filter(id__in=question_ids)
-                                  .select_subclasses(),
-            key=lambda q: question_ids.index(q.id))
+        pack = get_pack(self.quiz_id)
+        questions = pack.questions([question_id for question_id
+                                    in self._question_ids()
+                                    if question_id in pack])
 
         if with_answers:
-            user_answers = json.loads(self.user_answers)
+            user_answers = self._user_answers()
             for question in questions:
-                question.user_answer = user_answers[str(question.id)]
+                question.user_answer = user_answers.get(str(question.id))
 
         return questions
 
@@ -552,19 +711,155 @@ class Sitting(models.Model):
         Returns the number of questions answered so far and the total number of
         questions.
         """
-        answered = len(json.loads(self.user_answers))
+        answered = len(self._user_answers())
         total = self.get_max_score
         return answered, total
 
 
+class SittingAnswer(models.Model):
+    """
+    An answer given in a sitting. Rows are only added while a quiz is
+    played; re-marking updates their verdict.
+
+    Position is the index of the question in the sitting's question order.
+    Title is the second part of a two part answer, ie. the title given for
+    a music question.
+    """
+    sitting = models.ForeignKey(Sitting, related_name='answers',
+                                verbose_name=_("Sitting"),
+                                on_delete=models.CASCADE)
+
+    question = models.ForeignKey('Question', verbose_name=_("Question"),
+                                 on_delete=models.CASCADE)
+
+    position = models.PositiveIntegerField(verbose_name=_("Position"))
+
+    guess = models.TextField(blank=True, verbose_name=_("Guess"))
+
+    title = models.CharField(max_length=1000, blank=True,
+                             verbose_name=_("Title"))
+
+    correct = models.BooleanField(default=False, verbose_name=_("Correct"))
+
+    score = models.FloatField(default=0, verbose_name=_("Score"))
+
+    answered = models.DateTimeField(auto_now_add=True,
+                                    verbose_name=_("Answered"))
+
+    class Meta:
+        verbose_name = _("Sitting answer")
+        verbose_name_plural = _("Sitting answers")
+        indexes = [models.Index(fields=['sitting', 'position'])]
+
+    @property
+    def answer(self):
+        """
+        The answer in the form it was given to Question.mark().
+        """
+        if self.title:
+            return [self.guess, self.title]
+        return self.guess
+
+
+class PackVersion(models.Model):
+    """
+    The question ids of a version of a quiz's pack, in position order, as
+    a list of integer pks in csv format, and the number of them a sitting
+    takes. Sittings refer to it by digest to derive their question order
+    once the pack has left the cache.
+    """
+    quiz = models.ForeignKey(Quiz, verbose_name=_("Quiz"),
+                             on_delete=models.CASCADE)
+
+    digest = models.CharField(max_length=40, verbose_name=_("Digest"))
+
+    question_ids = models.TextField(
+        blank=True, verbose_name=_("Question ids"),
+        validators=[validate_comma_separated_integer_list])
+
+    max_questions = models.PositiveIntegerField(
+        blank=True, null=True, verbose_name=_("Max Questions"))
+
+    created = models.DateTimeField(auto_now_add=True,
+                                   verbose_name=_("Created"))
+
+    class Meta:
+        verbose_name = _("Pack version")
+        verbose_name_plural = _("Pack versions")
+        unique_together = ('quiz', 'digest')
+
+    def order(self, seed=0):
+        return shuffled([int(n) for n in self.question_ids.split(',') if n],
+                        seed, self.max_questions)
+
+
+class QuestionManager(InheritanceManager):
+
+    def by_type(self, question_ids, types=None):
+        """
+        Returns the questions with the given ids, each as an instance of its
+        own question type, in the order of question_ids.
+
+        Rather than joining every question type's table, the ids are grouped
+        by question_type and only the table of each type present is read.
+        types maps question ids to their question_type when the caller
+        already has them, saving the query that looks them up.
+        """
+        question_ids = list(question_ids)
+        if types is None:
+            types = dict(self.filter(pk__in=question_ids)
+                             .values_list('pk', 'question_type'))
+
+        by_type = {}
+        for question_id in question_ids:
+            if question_id in types:
+                by_type.setdefault(types[question_id], []).append(question_id)
+
+        models_by_type = question_types()
+        questions = {}
+        for question_type, typed_ids in by_type.items():
+            model = models_by_type.get(question_type, self.model)
+            for question in model._default_manager.filter(pk__in=typed_ids)\
+                                                  .select_related('category'):
+                questions[question.pk] = question
+
+        return [questions[question_id] for question_id in question_ids
+                if question_id in questions]
+
+    def get_by_type(self, question_id):
+        """
+        Returns one question as an instance of its own question type.
+        """
+        questions = self.by_type([question_id])
+        if not questions:
+            raise self.model.DoesNotExist(
+                'Question matching query does not exist.')
+        return questions[0]
+
+
+def question_types():
+    """
+    Returns a dict of question_type to the question model it names.
+    """
+    from django.apps import apps
+
+    return {model._meta.label_lower: model for model in apps.get_models()
+            if issubclass(model, Question)}
+
+
 @python_2_unicode_compatible
 class Question(models.Model):
     """
     Base class for all question types.
     Shared properties placed here.
+
+    question_type holds the label of the question's own model, so a
+    question can be read from its type's table without first joining the
+    tables of every other type.
     """
 
     quiz = models.ManyToManyField(Quiz,
+                                  through='QuizQuestion',
                                   verbose_name=_("Quiz"),
                                   blank=True)
 
@@ -598,16 +893,214 @@ class Question(models.Model):
                                                "been answered."),
                                    verbose_name=_('Explanation'))
 
-    objects = InheritanceManager()
+    question_type = models.CharField(max_length=100,
+                                     blank=True,
+                                     editable=False,
+                                     verbose_name=_("Question type"))
+
+    objects = QuestionManager()
+
+    # the question's answers once loaded by load_answers, used in place of
+    # querying the answer table
+    answer_cache = None
+
+    # matchers built from the loaded answers, shared by copies of the
+    # question so a cached question builds each one only once
+    _matchers = None
 
     class Meta:
         verbose_name = _("Question")
         verbose_name_plural = _("Questions")
-        ordering = ['category']
 
     def __str__(self):
         return self.content
 
+    def save(self, *args, **kwargs):
+        if not self.question_type:
+            self.question_type = self._meta.label_lower
+        super(Question, self).save(*args, **kwargs)
+
+    @classmethod
+    def answers_for(cls, question_ids):
+        """
+        Returns the answers stored for the given questions, or None for
+        question types that do not have an answer table.
+        """
+        return None
+
+    def answer_queryset(self):
+        return self.answers_for([self.pk])
+
+    def load_answers(self):
+        """
+        Reads the question's answers into answer_cache, so that marking and
+        displaying the question need no further queries.
+        """
+        load_answers([self])
+
+    def get_answer_objects(self):
+        if self.answer_cache is not None:
+            return self.answer_cache
+        return list(self.answer_queryset())
+
+    def mark(self, guess):
+        """
+        Returns whether guess is correct and the score it earns.
+        """
+        is_correct = self.check_if_correct(guess)
+        return is_correct, 1 if is_correct else 0
+
+    def record_statistics(self, guess, is_correct):
+        """
+        Counts an answer to the question in its statistics.
+        """
+        QuestionStatistic.objects.add({'answered': 1,
+                                       'correct': 1 if is_correct else 0},
+                                      question_id=self.pk)
+
+    def answer_matcher(self, field):
+        """
+        Returns an AnswerMatcher over the given field of the question's
+        answers.
+        """
+        if self._matchers is None:
+            self._matchers = {}
+        matcher = self._matchers.get(field)
+        if matcher is None:
+            matcher = AnswerMatcher(getattr(answer, field)
+                                    for answer in self.get_answer_objects())
+            self._matchers[field] = matcher
+        return matcher
+
+
+watch_question_models(Question)
+
+
+def load_answers(questions):
+    """
+    Fills in answer_cache on each of the questions, using one query per
+    question type rather than one per question.
+    """
+    by_type = {}
+    for question in questions:
+        by_type.setdefault(question.__class__, []).append(question)
+
+    for question_type, typed_questions in by_type.items():
+        answers = question_type.answers_for([q.pk for q in typed_questions])
+        if answers is None:
+            continue
+
+        by_question = {}
+        for answer in answers:
+            by_question.setdefault(answer.question_id, []).append(answer)
+        for question in typed_questions:
+            question.answer_cache = by_question.get(question.pk, [])
+            question._matchers = {}
+
+
+class QuizQuestion(models.Model):
+    """
+    Places a question in a quiz.
+
+    Position is the question's number within the quiz, starting from 1.
+    Questions added without a position are numbered after the existing
+    ones.
+    """
+    quiz = models.ForeignKey(Quiz, verbose_name=_("Quiz"),
+                             on_delete=models.CASCADE)
+
+    question = models.ForeignKey(Question, verbose_name=_("Question"),
+                                 on_delete=models.CASCADE)
+
+    position = models.PositiveIntegerField(default=0,
+                                           verbose_name=_("Position"))
+
+    class Meta:
+        db_table = 'quiz_question_quiz'
+        verbose_name = _("Quiz question")
+        verbose_name_plural = _("Quiz questions")
+        unique_together = (('question', 'quiz'),)
+        indexes = [models.Index(fields=['quiz', 'position'])]
+
+    def __str__(self):
+        return "%s: %s" % (self.quiz, self.position)
+
+    def save(self, *args, **kwargs):
+        # links saved directly, eg. from the admin, rather than added
+        # through the relation, are numbered here
+        if not self.position:
+            last = QuizQuestion.objects.filter(quiz_id=self.quiz_id)\
+                                       .exclude(pk=self.pk)\
+                                       .aggregate(last=Max('position'))['last']
+            self.position = (last or 0) + 1
+        super(QuizQuestion, self).save(*args, **kwargs)
+
+
+@receiver(m2m_changed, sender=QuizQuestion)
+def number_new_questions(sender, instance, action, **kwargs):
+    """
+    Gives questions added through question.quiz or quiz.question_set the
+    next free positions in their quizzes.
+    """
+    if action != 'post_add':
+        return
+
+    unnumbered = QuizQuestion.objects.filter(position=0)
+    if isinstance(instance, Quiz):
+        unnumbered = unnumbered.filter(quiz=instance)
+    else:
+        unnumbered = unnumbered.filter(question=instance)
+
+    for link in unnumbered.order_by('pk'):
+        last = QuizQuestion.objects.filter(quiz_id=link.quiz_id)\
+                                   .aggregate(last=Max('position'))['last']
+        QuizQuestion.objects.filter(pk=link.pk)\
+                            .update(position=(last or 0) + 1)
+
+
+watch_question_models(QuizQuestion)
+
+
+class ScoreManager(models.Manager):
+
+    def round_totals(self, users=None):
+        """
+        Returns a dict keyed on (user id, round number) holding the summed
+        score for that round, built from a single grouped query.
+        """
+        queryset = self.get_queryset()
+        if users is not None:
+            queryset = queryset.filter(user__in=users)
+
+        totals = queryset.values('user', 'round')\
+                         .annotate(total=Sum('score'))\
+                         .order_by()
+        return {(row['user'], row['round']): row['total'] for row in totals}
+
+    def record(self, user, round, question, score):
+        """
+        Stores the score for a single answer and adds it to the user's
+        running total for the round, in one transaction.
+
+        There is only ever one score per user, round and question; if the
+        question is answered again the new score replaces the old one and
+        the round total is adjusted by the difference.
+        """
+        with transaction.atomic():
+            question_score, created = self.select_for_update().get_or_create(
+                user=user, round=round, question=question,
+                defaults={'score': score})
+
+            if created:
+                RoundTotal.objects.add(user, round, score)
+            elif question_score.score != score:
+                difference = score - question_score.score
+                question_score.score = score
+                question_score.save(update_fields=['score'])
+                RoundTotal.objects.add(user, round, difference)
+
+        return question_score
+
 
 class Score(models.Model):
     """
@@ -619,4 +1112,247 @@ class Score(models.Model):
 
     question = models.IntegerField()
 
-    score = models.FloatField()
\ No newline at end of file
+    score = models.FloatField()
+
+    objects = ScoreManager()
+
+    class Meta:
+        unique_together = (('user', 'round', 'question'),)
+        # covers the per-round totals so they can be summed from the index
+        indexes = [models.Index(fields=['user', 'round', 'score'])]
+
+
+class RoundTotalManager(models.Manager):
+
+    def add(self, user, round, score):
+        """
+        Adds score to the user's total for the round, creating the row if
+        this is the first answer the user has given in that round.
+        """
+        updated = self.filter(user=user, round=round)\
+                      .update(total=F('total') + score)
+        if updated:
+            return
+
+        try:
+            with transaction.atomic():
+                self.create(user=user, round=round, total=score)
+        except IntegrityError:
+            # another request created the row first
+            self.filter(user=user, round=round)\
+                .update(total=F('total') + score)
+
+    def rebuild(self):
+        """
+        Recalculates every total from the Score table.
+        Returns the number of totals written.
+        """
+        totals = [self.model(user_id=user_id, round=round, total=total)
+                  for (user_id, round), total
+                  in Score.objects.round_totals().items()]
+
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(totals, batch_size=500)
+        return len(totals)
+
+    def round_totals(self, users=None):
+        """
+        Returns a dict keyed on (user id, round number) holding the user's
+        total for that round.
+        """
+        queryset = self.get_queryset()
+        if users is not None:
+            queryset = queryset.filter(user__in=users)
+
+        return {(user_id, round): total for user_id, round, total
+                in queryset.values_list('user', 'round', 'total')}
+
+    def user_totals(self, user):
+        """
+        Returns a dict keyed on round number holding the user's total for
+        that round.
+        """
+        return {round: total for (user_id, round), total
+                in self.round_totals([user]).items()}
+
+    def leaderboard(self, users=None):
+        """
+        Builds the user x round score matrix for all live rounds.
+
+        Returns a dict with:
+            round_list - the live quizzes, ordered by title
+            round_names - slugified titles, used as keys in each user row
+            user_stats_list - one dict per user holding 'name', a score per
+                              round name and 'total', sorted by total
+            max_scores - the best score for each round name
+
+        Costs one quiz query, one user query and one query on the totals
+        table regardless of the number of users, rounds or answers.
+        """
+        totals = self.round_totals(users)
+        if users is None:
+            users = get_user_model().objects.all()
+
+        round_list = list(Quiz.objects.filter(draft=False).order_by('title'))
+        round_names = [slugify(quiz) for quiz in round_list]
+        round_numbers = [quiz.round_number for quiz in round_list]
+
+        user_stats_list = []
+        max_scores = dict.fromkeys(round_names, 0)
+        for user in users:
+            current_user = {'name': user}
+            user_score_total = 0
+            for round_name, round_num in zip(round_names, round_numbers):
+                this_round_score = totals.get((user.pk, round_num), 0)
+                current_user[round_name] = this_round_score
+                user_score_total += this_round_score
+
+                if this_round_score > max_scores[round_name]:
+                    max_scores[round_name] = this_round_score
+
+            current_user['total'] = user_score_total
+            user_stats_list.append(current_user)
+
+        user_stats_list.sort(key=lambda k: k['total'], reverse=True)
+
+        return {
+            'round_list': round_list,
+            'round_names': round_names,
+            'user_stats_list': user_stats_list,
+            'max_scores': max_scores,
+        }
+
+
+class RoundTotal(models.Model):
+    """
+    Running total of a user's score in one round.
+
+    A denormalised copy of the sum of the matching Score rows, kept up to
+    date by Score.objects.record and rebuilt by the rebuild_round_totals
+    management command.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_("User"), on_delete=models.CASCADE)
+
+    round = models.IntegerField(verbose_name=_("Round"))
+
+    total = models.FloatField(default=0, verbose_name=_("Total"))
+
+    objects = RoundTotalManager()
+
+    class Meta:
+        verbose_name = _("Round total")
+        verbose_name_plural = _("Round totals")
+        unique_together = (('user', 'round'),)
+
+
+class CounterManager(models.Manager):
+
+    def add(self, counts, **keys):
+        """
+        Adds counts, a dict of field name to amount, to the counters of the
+        row matching keys, creating the row if it does not exist yet.
+        Counters never go below zero, eg. when an answer is marked wrong
+        before any were counted.
+        """
+        increments = {name: F(name) + amount if amount >= 0
+                      else Greatest(F(name) + amount, 0)
+                      for name, amount in counts.items()}
+        if self.filter(**keys).update(**increments):
+            return
+
+        try:
+            with transaction.atomic():
+                self.create(**dict(keys, **{name: max(amount, 0)
+                                            for name, amount
+                                            in counts.items()}))
+        except IntegrityError:
+            # another request created the row first
+            self.filter(**keys).update(**increments)
+
+
+def get_statistic(instance):
+    """
+    Returns the statistic row of a question or multiple choice answer, or
+    None if it has not been answered yet.
+    """
+    try:
+        return instance.statistic
+    except ObjectDoesNotExist:
+        return None
+
+
+class QuestionStatistic(models.Model):
+    """
+    Running counts of the answers signed in players have given to a
+    question, updated as each answer is marked.
+    """
+    question = models.OneToOneField('Question', primary_key=True,
+                                    related_name='statistic',
+                                    verbose_name=_("Question"),
+                                    on_delete=models.CASCADE)
+
+    answered = models.PositiveIntegerField(default=0,
+                                           verbose_name=_("Answered"))
+
+    correct = models.IntegerField(default=0, verbose_name=_("Correct"))
+
+    objects = CounterManager()
+
+    class Meta:
+        verbose_name = _("Question statistic")
+        verbose_name_plural = _("Question statistics")
+
+    @property
+    def percent_correct(self):
+        if not self.answered:
+            return None
+        return int(round(100.0 * self.correct / self.answered))
+
+
+class CategoryProgressManager(CounterManager):
+
+    def scores(self, user_id):
+        """
+        Returns the scores of a user in the format of
+        Progress.list_all_cat_scores, read with one query.
+        """
+        categories = Category.objects.annotate(
+            user_score=FilteredRelation(
+                'user_scores', condition=Q(user_scores__user=user_id)))\
+            .order_by('category')\
+            .values_list('category', 'user_score__score',
+                         'user_score__possible')
+
+        output = {}
+        for category, score, possible in categories:
+            score, possible = score or 0, possible or 0
+            percent = int(round(score * 100.0 / possible)) if possible else 0
+            output[category] = [score, possible, percent]
+        return output
+
+
+class CategoryProgress(models.Model):
+    """
+    The number of questions a signed in user has answered, and answered
+    correctly, in one category.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             verbose_name=_("User"),
+                             on_delete=models.CASCADE)
+
+    category = models.ForeignKey(Category, related_name='user_scores',
+                                 verbose_name=_("Category"),
+                                 on_delete=models.CASCADE)
+
+    score = models.PositiveIntegerField(default=0, verbose_name=_("Score"))
+
+    possible = models.PositiveIntegerField(default=0,
+                                           verbose_name=_("Possible"))
+
+    objects = CategoryProgressManager()
+
+    class Meta:
+        verbose_name = _("Category progress")
+        verbose_name_plural = _("Category progress")
+        unique_together = ('user', 'category')
@@ -0,0 +1,217 @@
+"""
+Quiz packs: everything needed to show and mark a quiz, compiled once.
+
+A pack holds a quiz's questions in order, each with its subclass, category,
+figure and answers already loaded. Packs are immutable once built, are
+identified by a hash of their content and are shared between processes
+through Django's cache, so during play only per-user state is read from
+or written to the database.
+
+The question ids of every pack are also recorded in PackVersion, so the
+question order of a sitting can still be derived once the pack it was
+started with has left the cache.
+"""
+import copy
+import hashlib
+import random
+
+from django.core.cache import cache
+
+from .cache import (QUESTION_VERSION_KEY, QUIZ_VERSION_KEY, get_question,
+                    get_questions, get_version, versioned)
+
+PACK_KEY = 'quiz:pack:%s'
+PACK_POINTER_KEY = 'quiz:pack:%s:%s'
+
+
+class QuizPack(object):
+    """
+    The compiled questions of one quiz.
+
+    question_ids - the quiz's question ids, in position order
+    positions - maps each question id to its position in the quiz
+    types - maps each question id to the name of its question class
+    limit - the quiz's max_questions, the number of questions a sitting
+            takes, or None for all of them
+    digest - hash of the pack's content
+    """
+
+    def __init__(self, quiz_id, links, questions, limit=None):
+        """
+        links is a list of (question id, position) pairs in order and
+        questions a list of the loaded questions.
+        """
+        self.quiz_id = quiz_id
+        self.limit = limit or None
+        self._questions = {question.id: question for question in questions}
+        self.question_ids = tuple(question_id for question_id, _ in links
+                                  if question_id in self._questions)
+        self.positions = dict(links)
+        self.types = {question.id: question.__class__.__name__
+                      for question in questions}
+        self.digest = self._digest(links)
+
+    @classmethod
+    def build(cls, quiz_id):
+        """
+        Compiles the pack for a quiz from the database.
+        """
+        from .models import Question, Quiz, QuizQuestion, load_answers
+
+        limit = Quiz.objects.filter(pk=quiz_id)\
+                            .values_list('max_questions', flat=True).first()
+        rows = list(QuizQuestion.objects.filter(quiz_id=quiz_id)
+                                        .order_by('position', 'pk')
+                                        .values_list('question_id',
+                                                     'position',
+                                                     'question__question_type'))
+        links = [(question_id, position) for question_id, position, _ in rows]
+        questions = Question.objects.by_type(
+            [question_id for question_id, _, _ in rows],
+            types={question_id: question_type
+                   for question_id, _, question_type in rows})
+        load_answers(questions)
+        return cls(quiz_id, links, questions, limit)
+
+    def _digest(self, links):
+        content = []
+        for question_id, position in links:
+            question = self._questions.get(question_id)
+            if question is None:
+                continue
+            content.append((position, self.types[question_id],
+                            _fields(question),
+                            [_fields(answer)
+                             for answer in question.answer_cache or []]))
+        if self.limit:
+            content.append(('limit', self.limit))
+        return hashlib.sha1(repr(content).encode('utf-8')).hexdigest()
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def __contains__(self, question_id):
+        return question_id in self._questions
+
+    def question(self, question_id):
+        """
+        Returns a copy of the question, safe to modify for one request.
+        Questions no longer in the quiz are read through the question
+        cache instead.
+        """
+        question = self._questions.get(question_id)
+        if question is None:
+            return get_question(question_id)
+        return copy.copy(question)
+
+    def questions(self, question_ids=None):
+        """
+        Returns copies of the given questions, or of every question in the
+        quiz, in the order given. Questions no longer in the quiz are read
+        through the question cache together, and left out if they have
+        been deleted.
+        """
+        if question_ids is None:
+            question_ids = self.question_ids
+
+        others = {question.id: question for question in get_questions(
+            [question_id for question_id in question_ids
+             if question_id not in self._questions])}
+
+        questions = []
+        for question_id in question_ids:
+            if question_id in self._questions:
+                questions.append(copy.copy(self._questions[question_id]))
+            elif question_id in others:
+                questions.append(others[question_id])
+        return questions
+
+    def position(self, question_id):
+        return self.positions.get(question_id)
+
+    def order(self, seed=0):
+        return shuffled(self.question_ids, seed, self.limit)
+
+
+def shuffled(question_ids, seed=0, limit=None):
+    """
+    Returns the question ids for a sitting started with seed: in
+    position order when seed is 0, otherwise shuffled by a generator
+    seeded with it. Only the first limit questions are kept.
+    """
+    question_ids = list(question_ids)
+    if seed:
+        random.Random(seed).shuffle(question_ids)
+    if limit:
+        question_ids = question_ids[:limit]
+    return question_ids
+
+
+def _fields(instance):
+    return sorted((name, str(value)) for name, value in vars(instance).items()
+                  if not name.startswith('_') and name != 'answer_cache')
+
+
+def get_pack(quiz_id):
+    """
+    Returns the pack for a quiz.
+
+    Looks in this process first, then in Django's cache, and only compiles
+    the pack from the database when neither has a copy for the current
+    question and quiz versions. The first time a process sees a pack, its
+    version is recorded.
+    """
+    packs = versioned('quiz:packs')
+    quiz_version = get_version(QUIZ_VERSION_KEY)
+    pack = packs.get((quiz_id, quiz_version))
+    if pack is not None:
+        return pack
+
+    pointer = PACK_POINTER_KEY % (quiz_id, '%s.%s' % (
+        get_version(QUESTION_VERSION_KEY), quiz_version))
+    digest = cache.get(pointer)
+    if digest is not None:
+        pack = cache.get(PACK_KEY % digest)
+
+    if pack is None:
+        pack = QuizPack.build(quiz_id)
+        cache.set(PACK_KEY % pack.digest, pack, None)
+        cache.set(pointer, pack.digest, None)
+
+    _record_version(pack)
+    packs[(quiz_id, quiz_version)] = pack
+    return pack
+
+
+def _record_version(pack):
+    from .models import PackVersion
+
+    PackVersion.objects.get_or_create(
+        quiz_id=pack.quiz_id, digest=pack.digest,
+        defaults={'question_ids': ','.join(str(question_id) for question_id
+                                           in pack.question_ids),
+                  'max_questions': pack.limit})
+
+
+def get_pack_version(quiz_id, digest):
+    """
+    Returns the pack with the given digest, ie. the quiz as it was when a
+    sitting was started, so the sitting's question order can be derived
+    again. Once that version has left the cache, its recorded PackVersion
+    is returned instead, which derives the same order. Raises
+    PackVersion.DoesNotExist if the version was never recorded.
+    """
+    pack = get_pack(quiz_id)
+    if not digest or pack.digest == digest:
+        return pack
+
+    packs = versioned('quiz:pack_versions')
+    old = packs.get(digest)
+    if old is None:
+        old = cache.get(PACK_KEY % digest)
+        if old is None:
+            from .models import PackVersion
+
+            old = PackVersion.objects.get(quiz_id=quiz_id, digest=digest)
+        packs[digest] = old
+    return old
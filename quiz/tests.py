@@ -1,27 +1,47 @@
 # -*- coding: iso-8859-15 -*-
 from importlib import import_module
+import json
 
 from django.conf import settings
-from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
+from django.contrib.auth.models import AnonymousUser, User, Permission
 from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import IntegrityError
 try:
-    from django.core.urlresolvers import resolve
+    from django.conf.urls import include, url
 except ImportError:
-    from django.urls import resolve
-from django.http import HttpRequest
+    from django.urls import include, re_path as url
+try:
+    from django.core.urlresolvers import resolve, reverse
+except ImportError:
+    from django.urls import resolve, reverse
+from django.http import HttpRequest, HttpResponse
 from django.template import Template, Context
-from django.test import TestCase
+from django.test import TestCase, RequestFactory, override_settings
 from django.utils.six import StringIO
 from django.utils.translation import ugettext_lazy as _
 
-from .models import Category, Quiz, Progress, Sitting, SubCategory
+from .anon import AnonSitting, CookieState, SessionState, get_anon_state
+from .cache import check_shared_cache, get_question, get_quiz
+from .eventdata import generate_event_data
+from .marking import mark_answer, remark_questions
+from .matching import AnswerMatcher, normalize
+from .middleware import QueryRecorder
+from .pack import QuizPack, get_pack, get_pack_version
+from .models import (Category, CategoryProgress, PackVersion, Quiz, Progress,
+                     Sitting, SubCategory, Score, RoundTotal, Question,
+                     QuizQuestion, SittingAnswer, QuestionStatistic,
+                     get_statistic)
 from .views import (anon_session_score, QuizListView, CategoriesListView,
-                    QuizDetailView)
+                    QuizDetailView, LeaderboardNew, ProgressViewNew,
+                    QuizStatistics)
 
 from multichoice.models import MCQuestion, Answer
 from true_false.models import TF_Question
-from essay.models import Essay_Question
+from essay.models import Essay_Question, Essay_Answer
+from music.models import Music_Question, Music_Answer
 
 
 class TestCategory(TestCase):
@@ -94,12 +114,61 @@ class TestQuiz(TestCase):
     def test_get_questions(self):
         self.assertIn(self.question1, self.quiz1.get_questions())
 
+    def test_get_questions_in_position_order(self):
+        question2 = TF_Question.objects.create(id=2, content='aardvark',
+                                               correct=True)
+        question3 = MCQuestion.objects.create(id=3, content='zebra')
+        question2.quiz.add(self.quiz1)
+        question3.quiz.add(self.quiz1)
+        QuizQuestion.objects.filter(quiz=self.quiz1, question=question3)\
+                            .update(position=1)
+        QuizQuestion.objects.filter(quiz=self.quiz1, question=self.question1)\
+                            .update(position=3)
+
+        # the links, then one query for each question type
+        with self.assertNumQueries(3):
+            questions = self.quiz1.get_questions()
+        self.assertEqual([question.id for question in questions], [3, 2, 1])
+
     def test_anon_score_id(self):
         self.assertEqual(self.quiz1.anon_score_id(), '1_score')
 
     def test_anon_q_list(self):
         self.assertEqual(self.quiz1.anon_q_list(), '1_q_list')
 
+    def test_round_number(self):
+        self.assertEqual(self.quiz1.round_number, 1)
+
+        quiz = Quiz.objects.create(title='Round 12', url='r12')
+        self.assertEqual(quiz.round_number, 12)
+
+        quiz = Quiz.objects.create(title='Finale', url='finale')
+        self.assertEqual(quiz.round_number, None)
+
+        quiz = Quiz.objects.create(title='Round 3', url='r3', round_number=7)
+        self.assertEqual(quiz.round_number, 7)
+
+    def test_question_positions(self):
+        question2 = TF_Question.objects.create(content='oink')
+        question3 = TF_Question.objects.create(content='moo')
+        self.quiz1.question_set.add(question2, question3)
+
+        positions = dict(self.quiz1.quizquestion_set
+                                   .values_list('question', 'position'))
+        self.assertEqual(positions, {self.question1.id: 1,
+                                     question2.id: 2,
+                                     question3.id: 3})
+
+    def test_question_positions_saved_directly(self):
+        # as the admin inlines save them
+        question2 = TF_Question.objects.create(content='oink')
+        link = QuizQuestion.objects.create(quiz=self.quiz1, question=question2)
+        self.assertEqual(link.position, 2)
+        self.assertEqual(get_pack(self.quiz1.id).position(question2.id), 2)
+
+        link.save()
+        self.assertEqual(link.position, 2)
+
     def test_pass_mark(self):
         self.assertEqual(self.quiz1.pass_mark, False)
         self.quiz1.pass_mark = 50
@@ -128,19 +197,15 @@ class TestProgress(TestCase):
         self.p1 = Progress.objects.new_progress(self.user)
 
     def test_list_all_empty(self):
-        self.assertEqual(self.p1.score, '')
+        with self.assertNumQueries(1):
+            category_dict = self.p1.list_all_cat_scores
 
-        category_dict = self.p1.list_all_cat_scores
-
-        self.assertIn(str(list(category_dict.keys())[0]), self.p1.score)
-
-        self.assertIn(self.c1.category, self.p1.score)
+        self.assertEqual(category_dict, {'elderberries': [0, 0, 0]})
 
         Category.objects.new_category(category='cheese')
 
-        self.p1.list_all_cat_scores
-
-        self.assertIn('cheese', self.p1.score)
+        self.assertIn('cheese', self.p1.list_all_cat_scores)
+        self.assertEqual(CategoryProgress.objects.count(), 0)
 
     def test_subcategory_all_empty(self):
         SubCategory.objects.create(sub_category='pickles',
@@ -177,6 +242,20 @@ class TestProgress(TestCase):
         self.p1.update_score(question2, -1, 1)
         self.assertEqual([4, 6, 67], self.p1.list_all_cat_scores['cheese'])
 
+    def test_update_score_queries(self):
+        self.p1.update_score(self.question1, 1, 1)
+        with self.assertNumQueries(1):
+            self.p1.update_score(self.question1, 0, 1)
+
+        row = CategoryProgress.objects.get(user=self.user)
+        self.assertEqual((row.category, row.score, row.possible),
+                         (self.c1, 1, 2))
+
+        uncategorised = MCQuestion.objects.create(content='squeek')
+        with self.assertNumQueries(0):
+            self.assertIn(_('error'),
+                          self.p1.update_score(uncategorised, 1, 1))
+
 
 class TestSitting(TestCase):
     def setUp(self):
@@ -224,6 +303,32 @@ class TestSitting(TestCase):
 
         self.assertNotIn('2', sub_sitting.question_list)
 
+    def test_max_questions_changed_mid_round(self):
+        quiz2 = Quiz.objects.create(id=2, title='test quiz 2', url='tq2',
+                                    max_questions=1)
+        self.question1.quiz.add(quiz2)
+        self.question2.quiz.add(quiz2)
+        sitting = Sitting.objects.new_sitting(self.user, quiz2)
+        with sitting.deferred_save():
+            sitting.add_incorrect_question(self.question1)
+            sitting.add_user_answer(self.question1, '123')
+            sitting.remove_first_question()
+
+        quiz2.max_questions = 2
+        quiz2.save()
+        self.assertEqual(len(Sitting.objects.new_sitting(self.user, quiz2)
+                                            .get_questions()), 2)
+
+        # the open sitting keeps the one question it started with, also
+        # once its pack has left the cache
+        for clear_cache in (False, True):
+            if clear_cache:
+                cache.clear()
+            sitting = Sitting.objects.get(pk=sitting.pk)
+            self.assertEqual(sitting.progress(), (1, 1))
+            self.assertEqual(sitting.get_incorrect_questions, [1])
+            self.assertIs(sitting.get_first_question(), False)
+
     def test_get_next_remove_first(self):
         self.assertEqual(self.sitting.get_first_question(),
                          self.question1)
@@ -264,10 +369,13 @@ class TestSitting(TestCase):
         self.sitting.add_incorrect_question(self.question1)
         self.assertIn(1, self.sitting.get_incorrect_questions)
 
+        self.sitting.add_incorrect_question(self.question1)
+        self.assertEqual(self.sitting.get_incorrect_questions, [1])
+
         question3 = TF_Question.objects.create(id=3,
                                                content='oink')
-        self.sitting.add_incorrect_question(question3)
-        self.assertIn(3, self.sitting.get_incorrect_questions)
+        with self.assertRaises(ValueError):
+            self.sitting.add_incorrect_question(question3)
 
         self.assertEqual(self.sitting.complete, False)
         self.sitting.mark_quiz_complete()
@@ -283,6 +391,29 @@ class TestSitting(TestCase):
 
         self.assertIn('123', self.sitting.user_answers)
 
+    def test_answer_log(self):
+        self.sitting.add_user_answer(self.question2, '456', True, 1)
+        self.sitting.add_user_answer(self.question1, ['artist', 'title'])
+
+        answers = SittingAnswer.objects.filter(sitting=self.sitting)\
+                                       .order_by('position')
+        self.assertEqual(
+            [(a.question_id, a.position, a.guess, a.title, a.correct, a.score)
+             for a in answers],
+            [(1, 0, 'artist', 'title', False, 0), (2, 1, '456', '', True, 1)])
+
+        sitting = Sitting.objects.select_related('quiz')\
+                                 .get(pk=self.sitting.pk)
+        with self.assertNumQueries(1):
+            questions = sitting.get_questions(with_answers=True)
+        self.assertEqual([q.user_answer for q in questions],
+                         [['artist', 'title'], '456'])
+        self.assertEqual(sitting.progress(), (2, 2))
+
+        with self.assertRaises(ValueError):
+            sitting.add_user_answer(TF_Question.objects.create(content='x'),
+                                    'True')
+
     def test_return_questions_with_answers(self):
         '''
         Also tests sitting.get_questions(with_answers=True)
@@ -301,6 +432,93 @@ class TestSitting(TestCase):
         self.assertEqual(self.sitting.incorrect_questions, '2')
         self.assertEqual(self.sitting.current_score, 1)
 
+    def test_compact_state(self):
+        self.sitting.add_incorrect_question(self.question2)
+        self.sitting.remove_first_question()
+
+        sitting = Sitting.objects.get(pk=self.sitting.pk)
+        self.assertEqual(sitting.question_order, '')
+        self.assertEqual(sitting.cursor, 1)
+        self.assertEqual(bytes(sitting.incorrect), b'\x02')
+        self.assertEqual(sitting.question_list, '2,')
+        self.assertEqual(sitting.get_incorrect_questions, [2])
+
+        sitting.remove_incorrect_question(self.question2)
+        self.assertEqual(bytes(sitting.incorrect), b'')
+        with self.assertRaises(ValueError):
+            sitting.remove_incorrect_question(self.question2)
+
+    def test_long_quiz(self):
+        quiz2 = Quiz.objects.create(id=2, title='long quiz', url='long')
+        for i in range(400):
+            TF_Question.objects.create(id=1000 + i, content='q%s' % i)
+        QuizQuestion.objects.bulk_create(
+            [QuizQuestion(quiz=quiz2, question_id=1000 + i, position=i + 1)
+             for i in range(400)])
+
+        sitting = Sitting.objects.new_sitting(self.user, quiz2)
+        self.assertEqual(len(sitting.get_questions()), 400)
+
+        with sitting.deferred_save():
+            for question in sitting.get_questions():
+                sitting.add_incorrect_question(question)
+                sitting.add_user_answer(question, 'False')
+                sitting.remove_first_question()
+
+        sitting = Sitting.objects.get(pk=sitting.pk)
+        self.assertEqual(sitting.get_first_question(), False)
+        self.assertEqual(len(sitting.get_incorrect_questions), 400)
+        self.assertEqual(sitting.progress(), (400, 400))
+
+    def test_seeded_order(self):
+        self.assertEqual(self.sitting.seed, 0)
+        self.assertEqual(self.sitting.pack_version,
+                         get_pack(self.quiz1.id).digest)
+        self.assertEqual(self.sitting.question_list, '1,2,')
+
+        self.quiz1.random_order = True
+        self.quiz1.save()
+        get_pack(self.quiz1.id)
+        with self.assertNumQueries(1):
+            sitting = Sitting.objects.new_sitting(self.user, self.quiz1)
+        self.assertGreater(sitting.seed, 0)
+        self.assertEqual(sitting.question_order, '')
+
+        order = get_pack(self.quiz1.id).order(sitting.seed)
+        self.assertEqual(sorted(order), [1, 2])
+        self.assertEqual(sitting.get_first_question().id, order[0])
+
+        # resuming derives the same order, from the pack the sitting
+        # started with
+        question3 = MCQuestion.objects.create(id=3, content='squish')
+        question3.quiz.add(self.quiz1)
+        sitting = Sitting.objects.get(pk=sitting.pk)
+        self.assertEqual(sitting.question_list,
+                         ''.join('%s,' % n for n in order))
+
+    def test_open_round(self):
+        self.quiz1.draft = True
+        self.quiz1.save()
+        players = [User.objects.create_user(username='player%s' % n)
+                   for n in range(3)]
+        User.objects.create_user(username='gone', is_active=False)
+
+        self.assertEqual(Sitting.objects.open_round(self.quiz1), 3)
+        self.quiz1.refresh_from_db()
+        self.assertFalse(self.quiz1.draft)
+        self.assertEqual(Sitting.objects.filter(quiz=self.quiz1).count(), 4)
+
+        # players already sitting the quiz are left alone
+        self.assertEqual(Sitting.objects.open_round(self.quiz1), 0)
+
+        with self.assertNumQueries(1):
+            sitting = Sitting.objects.user_sitting(players[0], self.quiz1)
+        self.assertEqual(sitting.progress(), (0, 2))
+
+        out = StringIO()
+        call_command('open_round', 'tq1', stdout=out)
+        self.assertIn('0 new sittings', out.getvalue())
+
     def test_return_user_sitting(self):
         via_manager = Sitting.objects.user_sitting(self.user, self.quiz1)
         self.assertEqual(self.sitting, via_manager)
@@ -310,6 +528,634 @@ class TestSitting(TestCase):
         self.sitting.add_user_answer(self.question1, '123')
         self.assertEqual(self.sitting.progress(), (1, 2))
 
+    def test_deferred_save(self):
+        # the answer is logged with an insert and the sitting updated once
+        with self.assertNumQueries(2):
+            with self.sitting.deferred_save():
+                self.sitting.add_incorrect_question(self.question1)
+                self.sitting.add_to_score(1)
+                self.sitting.add_user_answer(self.question1, '123')
+                self.sitting.remove_first_question()
+
+        sitting = Sitting.objects.get(pk=self.sitting.pk)
+        self.assertEqual(sitting.current_score, 1)
+        self.assertEqual(sitting.get_incorrect_questions, [1])
+        self.assertEqual(sitting.progress(), (1, 2))
+        self.assertEqual(sitting.get_first_question(), self.question2)
+
+    def test_deferred_save_nested(self):
+        with self.assertNumQueries(1):
+            with self.sitting.deferred_save():
+                self.sitting.add_to_score(1)
+                with self.sitting.deferred_save():
+                    self.sitting.remove_first_question()
+
+        self.assertEqual(Sitting.objects.get(pk=self.sitting.pk).question_list,
+                         '2,')
+
+    def test_deferred_save_discarded_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.sitting.deferred_save():
+                self.sitting.add_to_score(1)
+                raise ValueError
+
+        self.assertEqual(Sitting.objects.get(pk=self.sitting.pk).current_score,
+                         0)
+        self.sitting.add_to_score(1)  # saves straight away again
+        self.assertEqual(Sitting.objects.get(pk=self.sitting.pk).current_score,
+                         2)
+
+
+class TestLeaderboard(TestCase):
+    def setUp(self):
+        self.round1 = Quiz.objects.create(id=1, title='Round 1', url='r1')
+        self.round2 = Quiz.objects.create(id=2, title='Round 2', url='r2')
+        Quiz.objects.create(id=3, title='Round 3', url='r3', draft=True)
+
+        self.jacob = User.objects.create_user(username='jacob',
+                                              password='top_secret')
+        self.luke = User.objects.create_user(username='luke',
+                                             password='top_secret')
+        self.yoda = User.objects.create_user(username='yoda',
+                                             password='top_secret')
+
+        for user, round, question, score in [(self.jacob, 1, 1, 1),
+                                             (self.jacob, 1, 2, 0.5),
+                                             (self.jacob, 2, 1, 0),
+                                             (self.luke, 1, 1, 1),
+                                             (self.luke, 2, 1, 1),
+                                             (self.luke, 2, 2, 1),
+                                             (self.luke, 3, 1, 1)]:
+            Score.objects.record(user, round, question, score)
+
+    def test_round_totals(self):
+        totals = Score.objects.round_totals()
+        self.assertEqual(totals[(self.jacob.pk, 1)], 1.5)
+        self.assertEqual(totals[(self.luke.pk, 2)], 2)
+        self.assertNotIn((self.yoda.pk, 1), totals)
+
+        self.assertEqual(RoundTotal.objects.round_totals(), totals)
+
+    def test_record_updates_totals(self):
+        Score.objects.record(self.yoda, 1, 1, 0.5)
+        Score.objects.record(self.yoda, 1, 2, 1)
+
+        total = RoundTotal.objects.get(user=self.yoda, round=1)
+        self.assertEqual(total.total, 1.5)
+        self.assertEqual(Score.objects.filter(user=self.yoda).count(), 2)
+
+    def test_record_replaces_previous_score(self):
+        Score.objects.record(self.yoda, 1, 1, 1)
+        Score.objects.record(self.yoda, 1, 1, 0.5)
+        Score.objects.record(self.yoda, 1, 1, 0.5)
+
+        self.assertEqual(Score.objects.filter(user=self.yoda).count(), 1)
+        self.assertEqual(Score.objects.get(user=self.yoda).score, 0.5)
+        self.assertEqual(RoundTotal.objects.get(user=self.yoda).total, 0.5)
+
+    def test_score_unique_per_question(self):
+        with self.assertRaises(IntegrityError):
+            Score.objects.create(user=self.jacob, round=1, question=1,
+                                 score=1)
+
+    def test_rebuild(self):
+        RoundTotal.objects.filter(user=self.luke).delete()
+        RoundTotal.objects.filter(user=self.jacob).update(total=100)
+
+        out = StringIO()
+        call_command('rebuild_round_totals', stdout=out)
+
+        self.assertIn('5 round totals', out.getvalue())
+        self.assertEqual(RoundTotal.objects.round_totals(),
+                         Score.objects.round_totals())
+
+    def test_leaderboard(self):
+        with self.assertNumQueries(3):
+            board = RoundTotal.objects.leaderboard()
+
+        self.assertEqual(board['round_list'], [self.round1, self.round2])
+        self.assertEqual(board['round_names'], ['round-1', 'round-2'])
+        self.assertEqual(board['max_scores'], {'round-1': 1.5, 'round-2': 2})
+
+        names = [row['name'] for row in board['user_stats_list']]
+        self.assertEqual(names, [self.luke, self.jacob, self.yoda])
+
+        luke = board['user_stats_list'][0]
+        self.assertEqual(luke['round-1'], 1)
+        self.assertEqual(luke['round-2'], 2)
+        self.assertEqual(luke['total'], 3)  # draft round 3 is not counted
+
+        yoda = board['user_stats_list'][2]
+        self.assertEqual(yoda['total'], 0)
+
+    def test_leaderboard_query_count_independent_of_users(self):
+        for i in range(20):
+            user = User.objects.create_user(username='user%s' % i)
+            Score.objects.record(user, 1, 1, 1)
+
+        with self.assertNumQueries(3):
+            board = RoundTotal.objects.leaderboard()
+        self.assertEqual(len(board['user_stats_list']), 23)
+
+    def test_leaderboard_view_context(self):
+        view = LeaderboardNew()
+        view.setup(RequestFactory().get('/leaderboard/'))
+        context = view.get_context_data()
+
+        self.assertEqual(context['round_names'], ['round-1', 'round-2'])
+        self.assertEqual(context['user_stats_list'][0]['name'], self.luke)
+
+    def test_progress_view_context(self):
+        request = RequestFactory().get('/progress/')
+        request.user = self.jacob
+        view = ProgressViewNew()
+        view.setup(request)
+
+        with self.assertNumQueries(2):
+            context = view.get_context_data()
+
+        self.assertEqual(len(context['user_stats_list']), 1)
+        self.assertEqual(context['user_stats_list'][0]['round-1'], 1.5)
+        self.assertEqual(context['user_stats_list'][0]['total'], 1.5)
+
+        request.user = AnonymousUser()
+        with self.assertNumQueries(1):
+            context = view.get_context_data()
+        self.assertEqual(context['user_stats_list'], [])
+
+    def test_quiz_list_view_context(self):
+        request = RequestFactory().get('/')
+        request.user = self.luke
+        view = QuizListView()
+        view.setup(request)
+        view.object_list = view.get_queryset()
+
+        with self.assertNumQueries(1):
+            context = view.get_context_data()
+        self.assertEqual(context['scores_dict'], {1: 1, 2: 2, 3: 1})
+
+        request.user = AnonymousUser()
+        context = view.get_context_data()
+        self.assertEqual(context['scores_dict'], {})
+        self.assertIsNone(context['quiz_list'])
+
+
+class TestQuestionCache(TestCase):
+    def setUp(self):
+        self.question = MCQuestion.objects.create(id=1, content='squawk',
+                                                  answer_order='content')
+        self.answer1 = Answer.objects.create(id=123, question=self.question,
+                                             content='bing', correct=False)
+        self.answer2 = Answer.objects.create(id=456, question=self.question,
+                                             content='bang', correct=True)
+        self.essay = Essay_Question.objects.create(id=2, content='scribble')
+        Essay_Answer.objects.create(question=self.essay,
+                                    correct_answer='Paris')
+
+    def test_shared_cache_check(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)],
+                         ['quiz.W001'])
+
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/quiz-cache'}}
+        with self.settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_cached_question(self):
+        question = get_question(1)
+        self.assertIsInstance(question, MCQuestion)
+        get_question(2)
+
+        with self.assertNumQueries(0):
+            question = get_question(1)
+            self.assertEqual(question.category, None)
+            self.assertEqual(question.get_answers_list(),
+                             [(456, 'bang'), (123, 'bing')])
+            self.assertTrue(question.check_if_correct('456'))
+            self.assertFalse(question.check_if_correct(123))
+            self.assertEqual(question.answer_choice_to_string(123), 'bing')
+
+            essay = get_question(2)
+            self.assertTrue(essay.check_if_correct('paris'))
+
+    def test_copies_are_independent(self):
+        get_question(1).user_answer = '123'
+        self.assertFalse(hasattr(get_question(1), 'user_answer'))
+
+    def test_invalidated_on_save(self):
+        get_question(1)
+
+        self.answer1.correct = True
+        self.answer1.save()
+        self.assertTrue(get_question(1).check_if_correct(123))
+
+        self.question.content = 'squeak'
+        self.question.save()
+        self.assertEqual(get_question(1).content, 'squeak')
+
+        self.answer2.delete()
+        self.assertEqual(len(get_question(1).get_answers()), 1)
+
+    def test_cached_quiz(self):
+        quiz = Quiz.objects.create(id=1, title='Round 1', url='r1')
+        get_quiz('r1')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_quiz('r1').title, 'Round 1')
+
+        quiz.title = 'Round one'
+        quiz.save()
+        self.assertEqual(get_quiz('r1').title, 'Round one')
+
+        quiz.delete()
+        with self.assertRaises(Quiz.DoesNotExist):
+            get_quiz('r1')
+
+    def test_unique_quiz_url(self):
+        Quiz.objects.create(id=1, title='Round 1', url='r1')
+        with self.assertRaises(IntegrityError):
+            Quiz.objects.create(id=2, title='Round 2', url='R1')
+
+    def test_question_type(self):
+        self.assertEqual(self.question.question_type, 'multichoice.mcquestion')
+        self.assertEqual(Question.objects.get(pk=2).question_type,
+                         'essay.essay_question')
+
+    def test_by_type(self):
+        TF_Question.objects.create(id=3, content='oink', correct=True)
+
+        # one query for the types, then one for each type present
+        with self.assertNumQueries(3):
+            questions = Question.objects.by_type([3, 1, 4])
+        self.assertEqual([q.__class__ for q in questions],
+                         [TF_Question, MCQuestion])
+        self.assertEqual(questions[1].answer_order, 'content')
+
+        with self.assertNumQueries(1):
+            question = Question.objects.by_type(
+                [2], types={2: 'essay.essay_question'})[0]
+        self.assertEqual(question.content, 'scribble')
+
+        with self.assertRaises(Question.DoesNotExist):
+            Question.objects.get_by_type(4)
+
+
+class TestQuizPack(TestCase):
+    def setUp(self):
+        self.c1 = Category.objects.new_category(category='elderberries')
+        self.quiz1 = Quiz.objects.create(id=1, title='Round 1', url='r1')
+
+        self.question1 = MCQuestion.objects.create(id=1, content='squawk',
+                                                   category=self.c1)
+        self.answer1 = Answer.objects.create(id=123, question=self.question1,
+                                             content='bing', correct=True)
+        self.question2 = TF_Question.objects.create(id=2, content='oink',
+                                                    correct=True)
+        self.question3 = Essay_Question.objects.create(id=3, content='say')
+        Essay_Answer.objects.create(question=self.question3,
+                                    correct_answer='hello')
+
+        QuizQuestion.objects.create(quiz=self.quiz1, question=self.question3,
+                                    position=1)
+        QuizQuestion.objects.create(quiz=self.quiz1, question=self.question1,
+                                    position=2)
+        QuizQuestion.objects.create(quiz=self.quiz1, question=self.question2,
+                                    position=3)
+
+    def test_build(self):
+        pack = QuizPack.build(self.quiz1.id)
+
+        self.assertEqual(pack.question_ids, (3, 1, 2))
+        self.assertEqual(pack.position(1), 2)
+        self.assertEqual(pack.types, {1: 'MCQuestion', 2: 'TF_Question',
+                                      3: 'Essay_Question'})
+        self.assertEqual(len(pack), 3)
+        self.assertIn(2, pack)
+
+        with self.assertNumQueries(0):
+            questions = pack.questions()
+            self.assertEqual(questions, [self.question3, self.question1,
+                                         self.question2])
+            self.assertEqual(questions[1].category, self.c1)
+            self.assertTrue(questions[1].check_if_correct(123))
+            self.assertTrue(questions[0].check_if_correct('Hello'))
+            self.assertEqual(list(questions[1].get_answers()),
+                             [self.answer1])
+
+    def test_digest(self):
+        digest = QuizPack.build(self.quiz1.id).digest
+        self.assertEqual(QuizPack.build(self.quiz1.id).digest, digest)
+
+        self.answer1.content = 'bong'
+        self.answer1.save()
+        self.assertNotEqual(QuizPack.build(self.quiz1.id).digest, digest)
+
+    def test_get_pack(self):
+        pack = get_pack(self.quiz1.id)
+        with self.assertNumQueries(0):
+            self.assertIs(get_pack(self.quiz1.id), pack)
+
+        self.question2.quiz.remove(self.quiz1)
+        self.assertEqual(get_pack(self.quiz1.id).question_ids, (3, 1))
+
+        self.question2.content = 'moo'
+        self.question2.save()
+        self.assertNotEqual(get_pack(self.quiz1.id).digest, pack.digest)
+
+    def test_sitting_reads_from_pack(self):
+        user = User.objects.create_user(username='jacob')
+        sitting = Sitting.objects.new_sitting(user, self.quiz1)
+        sitting.add_user_answer(self.question1, '123')
+        sitting.add_user_answer(self.question2, 'True')
+        sitting.add_user_answer(self.question3, 'hi')
+        get_pack(self.quiz1.id)
+
+        with self.assertNumQueries(0):
+            sitting.get_first_question()
+        with self.assertNumQueries(1):
+            questions = sitting.get_questions(with_answers=True)
+
+        self.assertEqual(sorted(q.user_answer for q in questions),
+                         ['123', 'True', 'hi'])
+
+    def test_pack_versions(self):
+        self.quiz1.random_order = True
+        self.quiz1.save()
+        user = User.objects.create_user(username='jacob')
+        sitting = Sitting.objects.new_sitting(user, self.quiz1)
+        order = sitting.question_list
+        self.assertEqual(PackVersion.objects.get(digest=sitting.pack_version)
+                                            .question_ids, '3,1,2')
+
+        # the quiz changes and the pack the sitting started with leaves
+        # the cache
+        self.question2.quiz.remove(self.quiz1)
+        cache.clear()
+        sitting = Sitting.objects.get(pk=sitting.pk)
+        self.assertEqual(sitting.question_list, order)
+        self.assertEqual(get_pack(self.quiz1.id).question_ids, (3, 1))
+
+        # a version that was never recorded is not swapped for the current
+        # one
+        PackVersion.objects.all().delete()
+        cache.clear()
+        with self.assertRaises(PackVersion.DoesNotExist):
+            get_pack_version(self.quiz1.id, sitting.pack_version)
+
+
+class TestStatistics(TestCase):
+
+    def setUp(self):
+        self.quiz1 = Quiz.objects.create(id=1, title='Round 1', url='r1')
+        self.question1 = MCQuestion.objects.create(id=1, content='squawk')
+        self.question1.quiz.add(self.quiz1)
+        self.answer1 = Answer.objects.create(id=123, question=self.question1,
+                                             content='bing', correct=True)
+        self.answer2 = Answer.objects.create(id=456, question=self.question1,
+                                             content='bong', correct=False)
+        self.question2 = TF_Question.objects.create(id=2, content='oink',
+                                                    correct=True)
+        self.question2.quiz.add(self.quiz1)
+
+        self.question1.record_statistics('123', True)
+        self.question1.record_statistics('456', False)
+        self.question1.record_statistics('456', False)
+        self.question1.record_statistics('123', True)
+
+    def test_counters(self):
+        statistic = QuestionStatistic.objects.get(question=self.question1)
+        self.assertEqual((statistic.answered, statistic.correct), (4, 2))
+        self.assertEqual(statistic.percent_correct, 50)
+        self.assertEqual(self.answer1.statistic.picked, 2)
+        self.assertEqual(self.answer2.statistic.picked, 2)
+        self.assertIsNone(get_statistic(self.question2))
+
+        self.question2.record_statistics('False', False)
+        with self.assertNumQueries(1):
+            self.question2.record_statistics('True', True)
+        statistic = QuestionStatistic.objects.get(question=self.question2)
+        self.assertEqual(statistic.percent_correct, 50)
+
+    def test_counters_not_negative(self):
+        question3 = TF_Question.objects.create(id=3, content='moo')
+        QuestionStatistic.objects.add({'correct': -1}, question_id=3)
+        statistic = QuestionStatistic.objects.get(question=question3)
+        self.assertEqual((statistic.answered, statistic.correct), (0, 0))
+
+        QuestionStatistic.objects.add({'correct': -1}, question_id=3)
+        QuestionStatistic.objects.add({'answered': 1, 'correct': 1},
+                                      question_id=3)
+        statistic.refresh_from_db()
+        self.assertEqual((statistic.answered, statistic.correct), (1, 1))
+
+    def test_read_with_questions(self):
+        with self.assertNumQueries(3):
+            question = MCQuestion.objects.select_related('statistic')\
+                                         .prefetch_related(
+                                             'answer_set__statistic').get()
+            self.assertEqual(get_statistic(question).answered, 4)
+            self.assertEqual([get_statistic(answer).picked
+                              for answer in question.answer_set.all()],
+                             [2, 2])
+
+    def test_json_endpoint(self):
+        request = RequestFactory().get('/statistics/r1/')
+        request.user = User.objects.create_superuser(
+            username='yoda', email='yoda@example.com', password='force')
+
+        with self.assertNumQueries(3):
+            response = QuizStatistics.as_view()(request, quiz_name='r1')
+        data = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(data['quiz'], 'r1')
+        first, second = data['questions']
+        self.assertEqual((first['id'], first['answered'], first['correct'],
+                          first['percent_correct']), (1, 4, 2, 50))
+        self.assertEqual([(c['id'], c['picked']) for c in first['choices']],
+                         [(123, 2), (456, 2)])
+        self.assertEqual((second['id'], second['answered'],
+                          second['percent_correct']), (2, 0, None))
+        self.assertNotIn('choices', second)
+
+        request.user = User.objects.create_user(username='luke')
+        response = QuizStatistics.as_view()(request, quiz_name='r1')
+        self.assertEqual(response.status_code, 302)
+
+
+class TestAnswerMatcher(TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(normalize('  The Beatles!'), 'beatles')
+        self.assertEqual(normalize('Beyonc'), 'beyonce')
+        self.assertEqual(normalize("Guns N' Roses"), 'guns n roses')
+        self.assertEqual(normalize('AC/DC'), 'ac dc')
+        self.assertEqual(normalize('The'), 'the')
+        self.assertEqual(normalize('A-ha'), 'a ha')
+        self.assertEqual(normalize('The Who'), 'who')
+        self.assertEqual(normalize('The XX'), 'the xx')
+
+    def test_matches(self):
+        matcher = AnswerMatcher(['The Beatles', 'Beatles', '', 'Sigur Rs'])
+        self.assertEqual(len(matcher), 2)
+        self.assertTrue(matcher.matches('beatles'))
+        self.assertTrue(matcher.matches('sigur ros'))
+        self.assertTrue(matcher.matches('ros sigur'))
+        self.assertTrue(matcher.matches('I think it was the Beatles'))
+        self.assertFalse(matcher.matches('the beatels'))
+        self.assertFalse(matcher.matches('the'))
+        self.assertFalse(matcher.matches(''))
+        self.assertFalse(AnswerMatcher([]).matches('anything'))
+
+    def test_short_answers(self):
+        matcher = AnswerMatcher(['A-ha'])
+        self.assertTrue(matcher.matches('a-ha'))
+        self.assertTrue(matcher.matches('A ha'))
+        self.assertFalse(matcher.matches('Shakira'))
+        self.assertFalse(matcher.matches('Hall and Oates'))
+
+        matcher = AnswerMatcher(['The Who'])
+        self.assertTrue(matcher.matches('the who'))
+        self.assertTrue(matcher.matches('Who'))
+        self.assertFalse(matcher.matches('who cares'))
+
+    def test_candidates(self):
+        answers = ['band number %s' % n for n in range(100)]
+        answers.append('Siouxsie and the Banshees')
+        matcher = AnswerMatcher(answers)
+
+        candidates = matcher.candidates_for(normalize('Suzie and the Banshees'))
+        self.assertEqual(len(candidates), 5)
+        self.assertEqual(candidates[0], 'siouxsie and the banshees')
+        self.assertTrue(matcher.matches('Siouxsie and the Banshes'))
+        self.assertFalse(matcher.matches('The Cure'))
+
+        small = AnswerMatcher(answers[:3])
+        self.assertEqual(small.candidates_for('band'), small.answers)
+
+
+class TestRemark(TestCase):
+
+    def setUp(self):
+        self.quiz = Quiz.objects.create(id=1, title='Round 1', url='r1')
+        self.essay = Essay_Question.objects.create(id=1, content='capital')
+        self.essay.quiz.add(self.quiz)
+        self.answer = Essay_Answer.objects.create(question=self.essay,
+                                                  correct_answer='Parsi')
+        self.music = Music_Question.objects.create(id=2, content='song')
+        self.music.quiz.add(self.quiz)
+        self.song = Music_Answer.objects.create(question=self.music,
+                                                correct_artist='Blur',
+                                                correct_title='Song 1')
+        self.user = User.objects.create_user(username='jacob')
+
+        self.sitting = Sitting.objects.new_sitting(self.user, self.quiz)
+        self.answer_question(self.essay, 'Paris')
+        self.answer_question(self.music, ['blur', 'Song 2'])
+
+    def answer_question(self, question, answer):
+        is_correct, score = get_question(question.id).mark(answer)
+        with self.sitting.deferred_save():
+            if is_correct:
+                self.sitting.add_to_score(1)
+            else:
+                self.sitting.add_incorrect_question(question)
+            Score.objects.record(self.user, 1, question.id, score)
+            self.sitting.add_user_answer(question, answer, is_correct, score)
+            question.record_statistics(answer, is_correct)
+            self.sitting.remove_first_question()
+
+    def test_mark(self):
+        self.assertEqual(self.music.mark('blur'), (True, 1))
+        self.assertEqual(self.music.mark(['blur', '']), (True, 1))
+        self.assertEqual(self.music.mark(['oasis', 'song 1']), (False, 0.5))
+        self.assertEqual(self.music.answer_choice_to_string(['Blur', 'x']),
+                         'Blur - x')
+
+    def test_mark_answer(self):
+        self.assertTrue(mark_answer(self.sitting, 1, True))
+        self.assertFalse(mark_answer(self.sitting, 1, True))
+
+        sitting = Sitting.objects.get(pk=self.sitting.pk)
+        self.assertEqual(sitting.get_incorrect_questions, [])
+        self.assertEqual(sitting.current_score, 2)
+        answer = sitting.answers.get(question=1)
+        self.assertEqual((answer.correct, answer.score), (True, 1))
+        self.assertEqual(Score.objects.get(question=1).score, 1)
+        self.assertEqual(RoundTotal.objects.get(user=self.user).total, 1.5)
+        self.assertEqual(QuestionStatistic.objects.get(question=1).correct, 1)
+
+        # a partly right music answer marked wrong loses its half point
+        self.assertFalse(mark_answer(sitting, 2, True))
+        self.assertTrue(mark_answer(sitting, 2, False))
+        self.assertEqual(sitting.get_incorrect_questions, [2])
+        self.assertEqual(sitting.answers.get(question=2).score, 0)
+        self.assertEqual(Score.objects.get(question=2).score, 0)
+        self.assertEqual(RoundTotal.objects.get(user=self.user).total, 1)
+
+    @override_settings(ROOT_URLCONF='quiz.tests')
+    def test_marking_detail_toggle_updates_scores(self):
+        marker = User.objects.create_user(username='marker', password='pw')
+        marker.user_permissions.add(
+            Permission.objects.get(codename='view_sittings'))
+        self.client.login(username='marker', password='pw')
+        url = reverse('quiz_marking_detail', kwargs={'pk': self.sitting.pk})
+
+        self.client.post(url, {'qid': 1})
+        self.assertEqual(Score.objects.get(question=1).score, 1)
+        self.assertEqual(RoundTotal.objects.get(user=self.user).total, 1.5)
+
+        self.client.post(url, {'qid': 1})
+        self.assertEqual(Score.objects.get(question=1).score, 0)
+        self.assertEqual(RoundTotal.objects.get(user=self.user).total, 0.5)
+        self.assertEqual(Sitting.objects.get(pk=self.sitting.pk)
+                                .get_incorrect_questions, [1])
+
+        # questions that are not in the sitting are refused
+        other = Essay_Question.objects.create(id=3, content='elsewhere')
+        self.assertEqual(self.client.post(url, {'qid': 3}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'qid': 'x'}).status_code,
+                         400)
+        self.assertEqual(Sitting.objects.get(pk=self.sitting.pk)
+                                .get_incorrect_questions, [1])
+        self.assertFalse(self.sitting.has_question(other.id))
+
+    def test_remark_questions(self):
+        self.assertEqual(self.sitting.get_incorrect_questions, [1])
+        self.assertEqual(RoundTotal.objects.get(user=self.user).total, 0.5)
+
+        self.answer.correct_answer = 'Paris'
+        self.answer.save()
+        self.song.correct_title = 'Song 2'
+        self.song.save()
+
+        result = remark_questions([1, 2])
+        self.assertEqual(result, {'answers': 2, 'sittings': 1, 'scores': 2})
+
+        sitting = Sitting.objects.get(pk=self.sitting.pk)
+        self.assertEqual(sitting.get_incorrect_questions, [])
+        self.assertEqual(sitting.current_score, 2)
+        self.assertEqual(
+            dict(Score.objects.values_list('question', 'score')),
+            {1: 1, 2: 1})
+        self.assertEqual(RoundTotal.objects.get(user=self.user).total, 2)
+        self.assertEqual(
+            dict(QuestionStatistic.objects.values_list('question', 'correct')),
+            {1: 1, 2: 1})
+
+        # marking again changes nothing, also across processes
+        out = StringIO()
+        call_command('remark', '1', '2', '--processes', '2', stdout=out)
+        self.assertIn('Re-marked 2 answers: 0 sittings and 0 scores',
+                      out.getvalue())
+
+        self.answer.correct_answer = 'Rome'
+        self.answer.save()
+        remark_questions([1])
+        sitting = Sitting.objects.get(pk=self.sitting.pk)
+        self.assertEqual(sitting.get_incorrect_questions, [1])
+        self.assertEqual(sitting.current_score, 1)
+        self.assertEqual(RoundTotal.objects.get(user=self.user).total, 1)
+
 
 class TestNonQuestionViews(TestCase):
     '''
@@ -432,6 +1278,80 @@ class TestNonQuestionViews(TestCase):
         self.assertEqual((score, possible), (0.5, 2))
 
 
+class TestAnonState(TestCase):
+    def setUp(self):
+        self.quiz1 = Quiz.objects.create(id=1, title='Round 1', url='r1')
+
+    def play(self, state):
+        sitting = AnonSitting(seed=5, pack='abc')
+        state.start(self.quiz1, sitting)
+        for is_correct in (True, False, True, False):
+            sitting.add_answer(is_correct)
+            state.add_to_total(1 if is_correct else 0, 1)
+        state.save(self.quiz1, sitting)
+        return sitting
+
+    def assertSameSitting(self, sitting, loaded):
+        self.assertEqual((loaded.seed, loaded.pack, loaded.cursor,
+                          loaded.score, loaded.incorrect),
+                         (sitting.seed, sitting.pack, sitting.cursor,
+                          sitting.score, sitting.incorrect))
+
+    def test_sitting(self):
+        sitting = AnonSitting(seed=0, pack='abc')
+        for is_correct in (False, True, False):
+            sitting.add_answer(is_correct)
+        self.assertEqual((sitting.cursor, sitting.score), (3, 1))
+        self.assertEqual(sitting.incorrect_questions([7, 8, 9]), [7, 9])
+
+    def test_session_state(self):
+        request = HttpRequest()
+        engine = import_module(settings.SESSION_ENGINE)
+        request.session = engine.SessionStore(None)
+        state = SessionState(request)
+        self.assertIsNone(state.load(self.quiz1))
+
+        sitting = self.play(state)
+        self.assertSameSitting(sitting, SessionState(request).load(self.quiz1))
+        self.assertEqual(request.session['1_q_list'],
+                         {'seed': 5, 'pack': 'abc', 'cursor': 4})
+        self.assertEqual(request.session['1_score'], 2)
+        self.assertEqual(state.add_to_total(), (2, 4))
+
+        state.delete(self.quiz1)
+        self.assertNotIn('1_q_list', request.session)
+        self.assertIsNone(state.load(self.quiz1))
+
+    def test_cookie_state(self):
+        state = CookieState(RequestFactory().get('/r1/take/'))
+        sitting = self.play(state)
+        response = HttpResponse()
+        state.apply(response)
+
+        request = RequestFactory().get('/r1/take/')
+        request.COOKIES = {name: cookie.value
+                           for name, cookie in response.cookies.items()}
+        with self.assertNumQueries(0):
+            state = CookieState(request)
+            self.assertSameSitting(sitting, state.load(self.quiz1))
+            self.assertEqual(state.add_to_total(), (2, 4))
+
+        state.delete(self.quiz1)
+        response = HttpResponse()
+        state.apply(response)
+        self.assertEqual(response.cookies['quiz_1']['max-age'], 0)
+
+        request.COOKIES['quiz_1'] += 'x'
+        self.assertIsNone(CookieState(request).load(self.quiz1))
+
+    def test_get_anon_state(self):
+        request = RequestFactory().get('/r1/take/')
+        request.session = {}
+        self.assertIsInstance(get_anon_state(request), SessionState)
+        with self.settings(QUIZ_ANON_STATE='cookie'):
+            self.assertIsInstance(get_anon_state(request), CookieState)
+
+
 class TestQuestionMarking(TestCase):
     urls = 'quiz.urls'
 
@@ -598,7 +1518,7 @@ class TestQuestionViewsAnon(TestCase):
 
         self.assertContains(response, 'squawk', status_code=200)
         self.assertEqual(self.client.session.get_expiry_age(), 259200)
-        self.assertEqual(self.client.session['1_q_list'], [1, 2])
+        self.assertEqual(self.client.session['1_q_list']['cursor'], 0)
         self.assertEqual(self.client.session['1_score'], 0)
         self.assertEqual(response.context['quiz'].id, self.quiz1.id)
         self.assertEqual(response.context['question'].content,
@@ -612,9 +1532,23 @@ class TestQuestionViewsAnon(TestCase):
 
         self.client.get('/tq1/take/')
         self.assertEqual(self.client.session.get_expiry_age(), 1)
-        self.assertEqual(self.client.session['1_q_list'], [1, 2])
+        self.assertEqual(self.client.session['1_q_list']['cursor'], 0)
         self.assertEqual(self.client.session['1_score'], 0)
 
+    @override_settings(ROOT_URLCONF='quiz.tests')
+    def test_anon_sitting_of_unknown_pack_restarts(self):
+        self.client.get('/tq1/take/')
+        session = self.client.session
+        session['1_q_list'] = dict(session['1_q_list'], pack='unknown',
+                                   cursor=1)
+        session.save()
+
+        response = self.client.get('/tq1/take/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.session['1_q_list']['cursor'], 0)
+        self.assertEqual(self.client.session['1_q_list']['pack'],
+                         get_pack(self.quiz1.id).digest)
+
     def test_image_in_question(self):
         imgfile = StringIO(
             'GIF87a\x01\x00\x01\x00\x80\x01\x00\x00\x00\x00ccc,'
@@ -636,13 +1570,13 @@ class TestQuestionViewsAnon(TestCase):
         response = self.client.post('/tq1/take/',
                                     {'answers': '123',
                                      'question_id':
-                                     self.client.session['1_q_list'][0]})
+                                     1})
 
         self.assertContains(response, 'previous', status_code=200)
         self.assertContains(response, 'incorrect')
         self.assertContains(response, 'Explanation:')
         self.assertContains(response, 'squeek')
-        self.assertEqual(self.client.session['1_q_list'], [2])
+        self.assertEqual(self.client.session['1_q_list']['cursor'], 1)
         self.assertEqual(self.client.session['session_score'], 0)
         self.assertEqual(self.client.session['session_score_possible'], 1)
         self.assertEqual(response.context['previous']['question_type'],
@@ -655,7 +1589,7 @@ class TestQuestionViewsAnon(TestCase):
         response = self.client.post('/tq1/take/',
                                     {'answers': '456',
                                      'question_id':
-                                     self.client.session['1_q_list'][0]})
+                                     2})
 
         self.assertContains(response, 'previous question', status_code=200)
         self.assertNotContains(response, 'incorrect')
@@ -683,7 +1617,7 @@ class TestQuestionViewsAnon(TestCase):
         response = self.client.post('/tq1/take/',
                                     {'answers': '123',
                                      'question_id':
-                                     self.client.session['1_q_list'][0]})
+                                     1})
         self.assertEqual(self.client.session['session_score'], 1)
         self.assertEqual(self.client.session['session_score_possible'], 3)
 
@@ -701,7 +1635,7 @@ class TestQuestionViewsAnon(TestCase):
         response = self.client.post('/tq1/take/',
                                     {'answers': '123',
                                      'question_id':
-                                     self.client.session['1_q_list'][0]})
+                                     1})
         self.assertEqual(response.context['progress'], (1, 2))
 
 
@@ -794,7 +1728,7 @@ class TestQuestionViewsUser(TestCase):
     def test_quiz_take_user_submit(self):
         self.client.login(username='jacob', password='top_secret')
         response = self.client.get('/tq1/take/')
-        progress_count = Progress.objects.count()
+        progress_count = CategoryProgress.objects.count()
 
         self.assertNotContains(response, 'previous question')
         self.assertEqual(progress_count, 0)
@@ -808,12 +1742,12 @@ class TestQuestionViewsUser(TestCase):
                                      next_question.id})
 
         sitting = Sitting.objects.get(quiz=self.quiz1)
-        progress_count = Progress.objects.count()
-        progress = Progress.objects.get(user=sitting.user).list_all_cat_scores
+        progress_count = CategoryProgress.objects.count()
+        progress = CategoryProgress.objects.scores(sitting.user_id)
 
         self.assertContains(response, 'previous question', status_code=200)
         self.assertEqual(sitting.current_score, 0)
-        self.assertEqual(sitting.incorrect_questions, '1,')
+        self.assertEqual(sitting.incorrect_questions, '1')
         self.assertEqual(sitting.complete, False)
         self.assertEqual(progress_count, 1)
         self.assertIn(self.c1.category, progress)
@@ -854,7 +1788,7 @@ class TestQuestionViewsUser(TestCase):
 
         sitting = Sitting.objects.get(quiz=self.quiz2,
                                       user=self.user)
-        progress = Progress.objects.get(user=self.user)
+        progress = Progress.objects.new_progress(self.user)
 
         # test that exam_paper = True prevents sitting deletion
         self.assertEqual(Sitting.objects.count(), 1)
@@ -991,3 +1925,256 @@ class TestTemplateTags(TestCase):
                            'incorrect_questions': [1]})
 
         self.assertIn('bing', template.render(context))
+
+    def test_results_queries(self):
+        for i in range(20):
+            question = MCQuestion.objects.create(content='q%d' % i)
+            Answer.objects.create(question=question, content='a%d' % i,
+                                  correct=True)
+            question.quiz.add(self.quiz1)
+        sitting = Sitting.objects.new_sitting(self.user, self.quiz1)
+        for question in sitting.get_questions():
+            answer = question.get_answers_list()[0][0]
+            sitting.add_user_answer(question, str(answer))
+        sitting.mark_quiz_complete()
+
+        template = Template('{% load quiz_tags %}'
+                            '{% for question in questions %}'
+                            '{% correct_answer_for_all question %}'
+                            '{{ question|answer_choice_to_string:'
+                            'question.user_answer }}{% endfor %}')
+
+        # just the answer log once the quiz's pack is loaded
+        sitting = Sitting.objects.select_related('quiz').get(pk=sitting.pk)
+        with self.assertNumQueries(1):
+            questions = sitting.get_questions(with_answers=True)
+            html = template.render(Context({
+                'questions': questions,
+                'incorrect_questions': sitting.get_incorrect_questions}))
+        self.assertEqual(len(questions), 22)
+        self.assertIn('a19', html)
+
+    def test_questions_removed_from_quiz(self):
+        pack = get_pack(self.quiz1.id)
+        others = [MCQuestion.objects.create(content='q%d' % i)
+                  for i in range(5)]
+
+        # the types, the question table and the answers, for all five
+        with self.assertNumQueries(3):
+            questions = pack.questions([1] + [q.id for q in others] + [999])
+        self.assertEqual([q.id for q in questions],
+                         [1] + [q.id for q in others])
+
+
+class TestEventData(TestCase):
+    def setUp(self):
+        Quiz.objects.create(title='Round 1', url='round-1')
+
+    def test_generate(self):
+        result = generate_event_data(users=20, rounds=3, questions=8,
+                                     categories=2, seed=1)
+        self.assertEqual(result['users'], 20)
+        self.assertEqual(result['questions'], 24)
+        self.assertEqual(Sitting.objects.count(), result['sittings'])
+        self.assertEqual(Sitting.objects.filter(complete=True).count(),
+                         result['complete'])
+        self.assertEqual(SittingAnswer.objects.count(), result['answers'])
+        self.assertEqual(Score.objects.count(), result['scores'])
+        self.assertEqual(set(Question.objects.values_list('question_type',
+                                                          flat=True)),
+                         {'multichoice.mcquestion', 'true_false.tf_question',
+                          'essay.essay_question', 'music.music_question'})
+
+        # rounds follow the existing ones
+        self.assertEqual(sorted(Score.objects.values_list('round', flat=True)
+                                             .distinct()), [2, 3, 4])
+        self.assertEqual(RoundTotal.objects.round_totals(),
+                         Score.objects.round_totals())
+
+        sitting = Sitting.objects.filter(complete=True).first()
+        self.assertEqual(sitting.progress(), (8, 8))
+        self.assertEqual(sitting.current_score,
+                         sitting.answers.filter(correct=True).count())
+
+        statistics = QuestionStatistic.objects.all()
+        self.assertEqual(sum(s.answered for s in statistics),
+                         result['answers'])
+
+        # the answers were marked as the questions would mark them
+        remarked = remark_questions(Question.objects.values_list('pk',
+                                                                 flat=True))
+        self.assertEqual(remarked, {'answers': result['answers'],
+                                    'sittings': 0, 'scores': 0})
+
+    def test_only_own_players_and_categories(self):
+        User.objects.create_user(username='player-admin')
+        Category.objects.new_category(category='player-category-1')
+        Category.objects.new_category(category='category-3')
+        Category.objects.get(category='category-3').delete()
+
+        generate_event_data(users=3, rounds=1, questions=2, categories=2,
+                            participation=1, seed=1)
+        self.assertEqual(
+            set(Sitting.objects.values_list('user__username', flat=True)),
+            {'player-0', 'player-1', 'player-2'})
+        self.assertEqual(
+            set(Category.objects.values_list('category', flat=True)),
+            {'player-category-1', 'player-category-2'})
+
+    def test_players_can_sign_in(self):
+        out = StringIO()
+        call_command('generate_event_data', '--users', '3', '--rounds', '1',
+                     '--questions', '2', '--mix', 'tf=1', '--prefix', 'guest',
+                     '--password', 'letmein', stdout=out)
+        self.assertIn('Created 3 users', out.getvalue())
+        self.assertTrue(self.client.login(username='guest-2',
+                                          password='letmein'))
+
+
+@override_settings(ROOT_URLCONF='quiz.tests')
+class TestQuizWithoutRound(TestCase):
+    def setUp(self):
+        self.quiz = Quiz.objects.create(title='Christmas Special',
+                                        url='christmas', exam_paper=True)
+        self.question = TF_Question.objects.create(content='snow',
+                                                   correct=True)
+        self.question.quiz.add(self.quiz)
+        User.objects.create_user(username='jacob', password='top_secret')
+
+    def test_answer_without_round(self):
+        self.assertIsNone(self.quiz.round_number)
+
+        self.client.login(username='jacob', password='top_secret')
+        self.client.get('/christmas/take/')
+        response = self.client.post('/christmas/take/',
+                                    {'answers': 'True',
+                                     'question_id': self.question.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['score'], 1)
+        self.assertEqual(SittingAnswer.objects.get().score, 1)
+        self.assertFalse(Score.objects.exists())
+        self.assertFalse(RoundTotal.objects.exists())
+
+
+# the quiz urls, with stand-ins for the account urls the templates link to
+urlpatterns = [
+    url(r'^accounts/login/$', lambda request: HttpResponse(),
+        name='account_login'),
+    url(r'^accounts/logout/$', lambda request: HttpResponse(),
+        name='account_logout'),
+    url(r'^accounts/signup/$', lambda request: HttpResponse(),
+        name='account_signup'),
+    url(r'^', include('quiz.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF='quiz.tests',
+                   MIDDLEWARE=settings.MIDDLEWARE +
+                   ('quiz.middleware.QueryTimingMiddleware', ))
+class TestQueryBudgets(TestCase):
+    """
+    The number of queries each page costs a signed in marker once its
+    quiz is cached, which must not grow with the number of players.
+    """
+    # url name, url kwargs, query budget
+    BUDGETS = [
+        ('quiz_index', {}, 4),
+        ('quiz_category_list_all', {}, 3),
+        ('quiz_category_list_matching', {'category_name': 'elderberries'}, 4),
+        ('quiz_progress', {}, 4),
+        ('quiz_final_progress', {}, 4),
+        ('quiz_leaderboard', {}, 5),
+        ('quiz_marking', {}, 3),
+        ('quiz_marking_detail', {'pk': None}, 4),
+        ('quiz_statistics', {'quiz_name': 'round-1'}, 4),
+        ('quiz_start_page', {'slug': 'round-1'}, 2),
+        ('quiz_question', {'quiz_name': 'round-1'}, 4),
+    ]
+
+    def setUp(self):
+        self.c1 = Category.objects.new_category(category='elderberries')
+        self.quiz1 = Quiz.objects.create(title='Round 1', url='round-1',
+                                         category=self.c1)
+        question1 = MCQuestion.objects.create(content='squawk',
+                                              category=self.c1)
+        question1.quiz.add(self.quiz1)
+        answer1 = Answer.objects.create(question=question1, content='bing',
+                                        correct=True)
+        question2 = TF_Question.objects.create(content='oink', correct=True,
+                                               category=self.c1)
+        question2.quiz.add(self.quiz1)
+
+        self.marker = User.objects.create_superuser(
+            username='marker', email='marker@x.com', password='top_secret')
+        sitting = Sitting.objects.new_sitting(self.marker, self.quiz1)
+        sitting.add_user_answer(question1, str(answer1.id), True, 1)
+        sitting.add_user_answer(question2, 'True', True, 1)
+        sitting.mark_quiz_complete()
+        self.sitting = sitting
+        self.players = 0
+
+    def add_players(self, players):
+        """
+        Adds players, up to the number given, who have each completed
+        round 1.
+        """
+        User.objects.bulk_create(
+            User(username='player-%d' % i)
+            for i in range(self.players, players))
+        new = list(User.objects.filter(username__startswith='player-')
+                               .exclude(roundtotal__round=1))
+        RoundTotal.objects.bulk_create(
+            RoundTotal(user=user, round=1, total=user.pk % 5) for user in new)
+        Sitting.objects.open_round(self.quiz1, new)
+        Sitting.objects.filter(user__in=new).update(complete=True)
+        self.players = players
+
+    def assertQueryBudget(self, path, budget):
+        # the first request fills the caches and starts any sitting
+        self.client.get(path)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+
+        queries = response.wsgi_request.queries
+        self.assertLessEqual(
+            queries.count, budget,
+            '%s ran %d queries, over its budget of %d. The slowest:\n%s'
+            % (path, queries.count, budget,
+               '\n'.join(sql for duration, sql in queries.slowest())))
+
+    def test_budgets(self):
+        self.client.login(username='marker', password='top_secret')
+        for players in (10, 1000):
+            self.add_players(players)
+            for name, kwargs, budget in self.BUDGETS:
+                if 'pk' in kwargs:
+                    kwargs = {'pk': self.sitting.pk}
+                with self.subTest(name=name, players=players):
+                    self.assertQueryBudget(reverse(name, kwargs=kwargs),
+                                           budget)
+
+    def test_server_timing(self):
+        with self.settings(DEBUG=True):
+            response = self.client.get('/round-1/')
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries"')
+
+        with self.settings(DEBUG=False):
+            response = self.client.get('/round-1/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_recorder(self):
+        with QueryRecorder(slowest=2) as queries:
+            list(User.objects.all())
+            list(Quiz.objects.all())
+            list(Category.objects.all())
+        self.assertEqual(queries.count, 3)
+        self.assertEqual(len(queries.slowest()), 2)
+        self.assertGreater(queries.duration, 0)
+
+        timing = queries.server_timing()
+        self.assertTrue(timing.startswith('db;dur='))
+        self.assertIn('desc="3 queries"', timing)
+        self.assertIn('sql-2;dur=', timing)
+        self.assertNotIn('sql-3', timing)
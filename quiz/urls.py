@@ -14,6 +14,7 @@ from .views import (
     QuizUserFinalProgressView,
     LeaderboardNew,
     ProgressViewNew,
+    QuizStatistics,
 )
 
 urlpatterns = [
@@ -51,6 +52,10 @@ urlpatterns = [
         view=QuizMarkingDetail.as_view(),
         name='quiz_marking_detail'),
 
+    url(r'^statistics/(?P<quiz_name>[\w-]+)/$',
+        view=QuizStatistics.as_view(),
+        name='quiz_statistics'),
+
     #  passes variable 'quiz_name' to quiz_take view
     url(r'^(?P<slug>[\w-]+)/$',
         view=QuizDetailView.as_view(),
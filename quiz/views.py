@@ -1,23 +1,35 @@
 import enum
-import random
 import re
 
-from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required, permission_required
 from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.utils.decorators import method_decorator
-from django.views.generic import DetailView, ListView, TemplateView, FormView
-from django.utils.text import slugify
+from django.views.generic import DetailView, ListView, TemplateView, FormView, View
 
 from random import randint
 
+from .anon import AnonSitting, anon_session_score, get_anon_state
+from .cache import get_quiz
 from .forms import QuestionForm, EssayForm, MusicForm
-from .models import Quiz, Category, Progress, Sitting, Question, Score
+from .marking import mark_answer
+from .pack import get_pack, get_pack_version
+from .models import (Quiz, Category, CategoryProgress, PackVersion, Sitting,
+                     Score, RoundTotal, QuizQuestion, get_statistic)
 from essay.models import Essay_Question
+from multichoice.models import Answer
 from music.models import Music_Question
 
 
+def get_quiz_or_404(url):
+    try:
+        return get_quiz(url)
+    except Quiz.DoesNotExist:
+        raise Http404
+
+
 class QuizMarkerMixin(object):
     @method_decorator(login_required)
     @method_decorator(permission_required("quiz.view_sittings"))
@@ -43,18 +55,12 @@ class QuizListView(ListView):
         user = self.request.user
         scores_dict = {}
 
-        try:
-            round_scores = Score.objects.filter(user=user).all()
-            for round in round_scores:
-                if round.round in scores_dict.keys():
-                    scores_dict[round.round] += round.score
-                else:
-                    scores_dict[round.round] = round.score
-        except TypeError:
+        if user.is_authenticated:
+            scores_dict = RoundTotal.objects.user_totals(user)
+        else:
             # user is not signed in, so remove all quizzes
             context['quiz_list'] = None
-            pass
-        
+
         context["scores_dict"] = scores_dict
         return context
 
@@ -62,13 +68,16 @@ class QuizListView(ListView):
         queryset = super(QuizListView, self).get_queryset()
         # filter by score present?
         
-        return queryset.filter(draft=False)
+        return queryset.filter(draft=False).select_related('category')
 
 
 class QuizDetailView(DetailView):
     model = Quiz
     slug_field = "url"
 
+    def get_object(self, queryset=None):
+        return get_quiz_or_404(self.kwargs[self.slug_url_kwarg])
+
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
 
@@ -111,33 +120,13 @@ class ProgressViewNew(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
         user = self.request.user
-        round_list = Quiz.objects.filter(draft=False).all().order_by("title")
-        round_names = [slugify(quiz) for quiz in Quiz.objects.filter(draft=False).all().order_by("title")]
-
-        user_stats_list = []
-        current_user = {}
-        current_user["name"] = user
-        user_score_total = 0
-        for idx, round in enumerate(Quiz.objects.filter(draft=False).all().order_by("title")):
-            round_num = int(str(round)[-1:])
-            user_round_scores = (
-                Score.objects.filter(user=user).filter(round=round_num).all()
-            )
-            this_round_score = 0
-            for user_score in user_round_scores:
-                this_round_score += user_score.score
+        board = RoundTotal.objects.leaderboard(
+            users=[user] if user.is_authenticated else [])
 
-            current_user[round_names[idx]] = this_round_score
-            user_score_total += this_round_score
-
-        current_user["total"] = user_score_total
-        user_stats_list.append(current_user)
-
-        context["user_stats_list"] = user_stats_list
-        context["round_list"] = round_list
-        context["round_names"] = round_names
+        context["user_stats_list"] = board["user_stats_list"]
+        context["round_list"] = board["round_list"]
+        context["round_names"] = board["round_names"]
         return context
 
 
@@ -146,47 +135,7 @@ class LeaderboardNew(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        User = get_user_model()
-        user_list = User.objects.all()
-        round_list = Quiz.objects.filter(draft=False).all()
-        round_names = [slugify(quiz) for quiz in Quiz.objects.filter(draft=False).all().order_by("title")]
-
-        user_stats_list = []
-        max_scores = {}
-        for user in user_list:
-            current_user = {}
-            current_user["name"] = user
-            user_score_total = 0
-            for idx, round in enumerate(Quiz.objects.filter(draft=False).all().order_by("title")):
-                round_num = int(str(round)[-1:])
-                round_name = slugify(round)
-                user_round_scores = (
-                    Score.objects.filter(user=user).filter(round=round_num).all()
-                )
-                this_round_score = 0
-                for user_score in user_round_scores:
-                    this_round_score += user_score.score
-
-                current_user[round_names[idx]] = this_round_score
-                user_score_total += this_round_score
-
-                if round_name in max_scores.keys():
-                    if this_round_score > max_scores[round_name]:
-                        max_scores[round_name] = this_round_score
-                else:
-                    max_scores[round_name] = this_round_score
-
-            current_user["total"] = user_score_total
-            user_stats_list.append(current_user)
-
-        # sort user_stats_list by total score
-        user_stats_list = sorted(user_stats_list, key=lambda k: k['total'], reverse=True)
-
-        context["max_scores"] = max_scores
-        context["user_stats_list"] = user_stats_list
-        context["round_list"] = round_list
-        context["round_names"] = round_names
+        context.update(RoundTotal.objects.leaderboard())
         return context
 
 
@@ -199,9 +148,10 @@ class QuizUserFinalProgressView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super(QuizUserFinalProgressView, self).get_context_data(**kwargs)
-        progress, c = Progress.objects.get_or_create(user=self.request.user)
-        context["cat_scores"] = progress.list_all_cat_scores
-        context["exams"] = progress.show_exams()
+        user = self.request.user
+        context["cat_scores"] = CategoryProgress.objects.scores(user.id)
+        context["exams"] = Sitting.objects.filter(user=user, complete=True)\
+                                          .select_related('quiz')
         return context
 
 
@@ -209,7 +159,9 @@ class QuizMarkingList(QuizMarkerMixin, SittingFilterTitleMixin, ListView):
     model = Sitting
 
     def get_queryset(self):
-        queryset = super(QuizMarkingList, self).get_queryset().filter(complete=True)
+        queryset = super(QuizMarkingList, self).get_queryset()\
+                                               .filter(complete=True)\
+                                               .select_related('quiz', 'user')
 
         user_filter = self.request.GET.get("user_filter")
         if user_filter:
@@ -220,17 +172,23 @@ class QuizMarkingList(QuizMarkerMixin, SittingFilterTitleMixin, ListView):
 
 class QuizMarkingDetail(QuizMarkerMixin, DetailView):
     model = Sitting
+    queryset = Sitting.objects.select_related('quiz__category', 'user')
 
     def post(self, request, *args, **kwargs):
         sitting = self.get_object()
 
         q_to_toggle = request.POST.get("qid", None)
         if q_to_toggle:
-            q = Question.objects.get_subclass(id=int(q_to_toggle))
-            if int(q_to_toggle) in sitting.get_incorrect_questions:
-                sitting.remove_incorrect_question(q)
-            else:
-                sitting.add_incorrect_question(q)
+            try:
+                question_id = int(q_to_toggle)
+            except ValueError:
+                question_id = None
+            # a stale or altered form may name a question not in this
+            # sitting
+            if question_id is None or not sitting.has_question(question_id):
+                return HttpResponseBadRequest()
+            mark_answer(sitting, question_id,
+                        question_id in sitting.get_incorrect_questions)
 
         return self.get(request)
 
@@ -240,6 +198,53 @@ class QuizMarkingDetail(QuizMarkerMixin, DetailView):
         return context
 
 
+class QuizStatistics(QuizMarkerMixin, View):
+    """
+    The answer statistics of each question in a quiz, as JSON, read from
+    the precomputed counters.
+    """
+
+    def get(self, request, *args, **kwargs):
+        quiz = get_quiz_or_404(self.kwargs["quiz_name"])
+
+        links = (
+            QuizQuestion.objects.filter(quiz=quiz)
+            .select_related("question__statistic")
+            .order_by("position", "pk")
+        )
+        choices = {}
+        for answer in Answer.objects.filter(
+            question__in=[link.question_id for link in links]
+        ).select_related("statistic").order_by("pk"):
+            statistic = get_statistic(answer)
+            choices.setdefault(answer.question_id, []).append(
+                {
+                    "id": answer.id,
+                    "content": answer.content,
+                    "correct": answer.correct,
+                    "picked": statistic.picked if statistic else 0,
+                }
+            )
+
+        questions = []
+        for link in links:
+            question = link.question
+            statistic = get_statistic(question)
+            entry = {
+                "id": question.id,
+                "position": link.position,
+                "content": question.content,
+                "answered": statistic.answered if statistic else 0,
+                "correct": statistic.correct if statistic else 0,
+                "percent_correct": statistic.percent_correct if statistic else None,
+            }
+            if question.id in choices:
+                entry["choices"] = choices[question.id]
+            questions.append(entry)
+
+        return JsonResponse({"quiz": quiz.url, "questions": questions})
+
+
 class QuizTake(FormView):
     form_class = QuestionForm
     template_name = "question.html"
@@ -247,10 +252,12 @@ class QuizTake(FormView):
     single_complete_template_name = "single_complete.html"
 
     def dispatch(self, request, *args, **kwargs):
-        self.quiz = get_object_or_404(Quiz, url=self.kwargs["quiz_name"])
+        self.quiz = get_quiz_or_404(self.kwargs["quiz_name"])
         if self.quiz.draft and not request.user.has_perm("quiz.change_quiz"):
             raise PermissionDenied
 
+        self.pack = get_pack(self.quiz.id)
+
         try:
             self.logged_in_user = self.request.user.is_authenticated()
         except TypeError:
@@ -259,12 +266,16 @@ class QuizTake(FormView):
         if self.logged_in_user:
             self.sitting = Sitting.objects.user_sitting(request.user, self.quiz)
         else:
+            self.anon_state = get_anon_state(request)
             self.sitting = self.anon_load_sitting()
 
         if self.sitting is False:
             return render(request, self.single_complete_template_name)
 
-        return super(QuizTake, self).dispatch(request, *args, **kwargs)
+        response = super(QuizTake, self).dispatch(request, *args, **kwargs)
+        if not self.logged_in_user:
+            self.anon_state.apply(response)
+        return response
 
     def get_form(self, *args, **kwargs):
         if self.logged_in_user:
@@ -298,7 +309,8 @@ class QuizTake(FormView):
                 return self.final_result_user()
         else:
             self.form_valid_anon(form)
-            if not self.request.session[self.quiz.anon_q_list()]:
+            answered, total = self.anon_sitting_progress()
+            if answered >= total:
                 return self.final_result_anon()
 
         self.request.POST = {}
@@ -316,9 +328,6 @@ class QuizTake(FormView):
         return context
 
     def form_valid_user(self, form):
-        progress, c = Progress.objects.get_or_create(user=self.request.user)
-        # print("Form valid user called...")
-
         # check for silent value for music quiz questions, mark accordingly.
         music_guess = None
         try:
@@ -327,14 +336,11 @@ class QuizTake(FormView):
             pass
 
         guess = form.cleaned_data["answers"]
-        is_correct = self.question.check_if_correct(guess)
 
-        if is_correct is True:
-            self.sitting.add_to_score(1)
-            progress.update_score(self.question, 1, 1)
-        else:
-            self.sitting.add_incorrect_question(self.question)
-            progress.update_score(self.question, 0, 1)
+        # music questions are worth 0.5 for each part right, so keep both
+        # parts to be able to mark them again
+        answer = [guess, music_guess] if music_guess else guess
+        is_correct, score = self.question.mark(answer)
 
         if self.quiz.answers_at_end is not True:
             self.previous = {
@@ -347,35 +353,35 @@ class QuizTake(FormView):
         else:
             self.previous = {}
 
-        score = 0
-        if music_guess:
-            # music question, so 0.5 for each part right...
-            # check first part
-            if is_correct:
-                score = 0.5
-            # check second part
-            if self.question.check_title_correct(music_guess):
-                score += 0.5
-
-        else:
-            # normal marking
-            if is_correct:
-                score = 1
+        round = self.quiz.round_number
+        question = self.pack.position(self.question.id)
 
-        quiz_round = str(self.question)
-        round = int(quiz_round.split()[0][1:])
-        question = int(quiz_round.split()[1][1:])
-
-        # add score to database...
-        question_score = Score()
-        question_score.user = self.request.user
-        question_score.round = round
-        question_score.question = question
-        question_score.score = score
-        question_score.save()
-
-        self.sitting.add_user_answer(self.question, guess)
-        self.sitting.remove_first_question()
+        # all writes for this answer go in one transaction, with a single
+        # UPDATE each for the sitting and the category progress rows
+        with transaction.atomic():
+            with self.sitting.deferred_save():
+                if is_correct is True:
+                    self.sitting.add_to_score(1)
+                else:
+                    self.sitting.add_incorrect_question(self.question)
+
+                if self.question.category_id is not None:
+                    CategoryProgress.objects.add(
+                        {'score': 1 if is_correct is True else 0,
+                         'possible': 1},
+                        user_id=self.request.user.id,
+                        category_id=self.question.category_id)
+
+                # add score to database, keeping the round totals in step;
+                # quizzes without a round number are not on the leaderboard
+                if round is not None and question is not None:
+                    Score.objects.record(self.request.user, round, question,
+                                         score)
+
+                self.sitting.add_user_answer(self.question, answer,
+                                             is_correct, score)
+                self.question.record_statistics(answer, is_correct)
+                self.sitting.remove_first_question()
 
     def final_result_user(self):
         results = {
@@ -403,61 +409,48 @@ class QuizTake(FormView):
         if self.quiz.single_attempt is True:
             return False
 
-        if self.quiz.anon_q_list() in self.request.session:
-            return self.request.session[self.quiz.anon_q_list()]
-        else:
-            return self.new_anon_quiz_session()
+        sitting = self.anon_state.load(self.quiz)
+        if sitting is not None:
+            try:
+                get_pack_version(self.quiz.id, sitting.pack)
+            except PackVersion.DoesNotExist:
+                # the questions it was started with are no longer known
+                sitting = None
+        if sitting is None:
+            sitting = self.new_anon_quiz_session()
+        return sitting
 
     def new_anon_quiz_session(self):
         """
-        Sets the session variables when starting a quiz for the first time
-        as a non signed-in user
+        Starts a sitting when a non signed-in user takes a quiz for the
+        first time: the question order, as a seed and the pack it applies
+        to, the number of questions answered, the score and the incorrect
+        answers
         """
-        self.request.session.set_expiry(259200)  # expires after 3 days
-        questions = self.quiz.get_questions()
-        question_list = [question.id for question in questions]
-
-        if self.quiz.random_order is True:
-            random.shuffle(question_list)
-
-        if self.quiz.max_questions and (self.quiz.max_questions < len(question_list)):
-            question_list = question_list[: self.quiz.max_questions]
-
-        # session score for anon users
-        self.request.session[self.quiz.anon_score_id()] = 0
+        sitting = AnonSitting(seed=self.quiz.new_seed(), pack=self.pack.digest)
+        self.anon_state.start(self.quiz, sitting)
+        return sitting
 
-        # session list of questions
-        self.request.session[self.quiz.anon_q_list()] = question_list
-
-        # session list of question order and incorrect questions
-        self.request.session[self.quiz.anon_q_data()] = dict(
-            incorrect_questions=[],
-            order=question_list,
-        )
-
-        return self.request.session[self.quiz.anon_q_list()]
+    def anon_question_order(self):
+        if not hasattr(self, "anon_order"):
+            self.anon_order = get_pack_version(
+                self.quiz.id, self.sitting.pack
+            ).order(self.sitting.seed)
+        return self.anon_order
 
     def anon_next_question(self):
-        next_question_id = self.request.session[self.quiz.anon_q_list()][0]
-        return Question.objects.get_subclass(id=next_question_id)
+        return self.pack.question(self.anon_question_order()[self.sitting.cursor])
 
     def anon_sitting_progress(self):
-        total = len(self.request.session[self.quiz.anon_q_data()]["order"])
-        answered = total - len(self.request.session[self.quiz.anon_q_list()])
-        return (answered, total)
+        return (self.sitting.cursor, len(self.anon_question_order()))
 
     def form_valid_anon(self, form):
         guess = form.cleaned_data["answers"]
         is_correct = self.question.check_if_correct(guess)
 
-        if is_correct:
-            self.request.session[self.quiz.anon_score_id()] += 1
-            anon_session_score(self.request.session, 1, 1)
-        else:
-            anon_session_score(self.request.session, 0, 1)
-            self.request.session[self.quiz.anon_q_data()]["incorrect_questions"].append(
-                self.question.id
-            )
+        self.sitting.add_answer(is_correct)
+        self.anon_state.add_to_total(1 if is_correct else 0, 1)
+        self.anon_state.save(self.quiz, self.sitting)
 
         self.previous = {}
         if self.quiz.answers_at_end is not True:
@@ -469,17 +462,13 @@ class QuizTake(FormView):
                 "question_type": {self.question.__class__.__name__: True},
             }
 
-        self.request.session[self.quiz.anon_q_list()] = self.request.session[
-            self.quiz.anon_q_list()
-        ][1:]
-
     def final_result_anon(self):
-        score = self.request.session[self.quiz.anon_score_id()]
-        q_order = self.request.session[self.quiz.anon_q_data()]["order"]
+        score = self.sitting.score
+        q_order = self.anon_question_order()
         max_score = len(q_order)
         percent = int(round((float(score) / max_score) * 100))
-        session, session_possible = anon_session_score(self.request.session)
-        if score is 0:
+        session, session_possible = self.anon_state.add_to_total()
+        if score == 0:
             score = "0"
 
         results = {
@@ -490,45 +479,16 @@ class QuizTake(FormView):
             "possible": session_possible,
         }
 
-        del self.request.session[self.quiz.anon_q_list()]
-
         if self.quiz.answers_at_end:
-            results["questions"] = sorted(
-                self.quiz.question_set.filter(id__in=q_order).select_subclasses(),
-                key=lambda q: q_order.index(q.id),
+            results["questions"] = self.pack.questions(
+                [question_id for question_id in q_order if question_id in self.pack]
             )
 
-            results["incorrect_questions"] = self.request.session[
-                self.quiz.anon_q_data()
-            ]["incorrect_questions"]
+            results["incorrect_questions"] = self.sitting.incorrect_questions(q_order)
 
         else:
             results["previous"] = self.previous
 
-        del self.request.session[self.quiz.anon_q_data()]
+        self.anon_state.delete(self.quiz)
 
         return render(self.request, "result.html", results)
-
-
-def anon_session_score(session, to_add=0, possible=0):
-    """
-    Returns the session score for non-signed in users.
-    If number passed in then add this to the running total and
-    return session score.
-
-    examples:
-        anon_session_score(1, 1) will add 1 out of a possible 1
-        anon_session_score(0, 2) will add 0 out of a possible 2
-        x, y = anon_session_score() will return the session score
-                                    without modification
-
-    Left this as an individual function for unit testing
-    """
-    if "session_score" not in session:
-        session["session_score"], session["session_score_possible"] = 0, 0
-
-    if possible > 0:
-        session["session_score"] += to_add
-        session["session_score_possible"] += possible
-
-    return session["session_score"], session["session_score_possible"]
@@ -28,6 +28,9 @@ CACHES = {
     }
 }
 
+# the tests run in a single process
+SILENCED_SYSTEM_CHECKS = ['quiz.W001']
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be available on all operating systems.
@@ -121,6 +124,7 @@ INSTALLED_APPS = (
     'multichoice',
     'true_false',
     'essay',
+    'music',
 )
 
 
@@ -0,0 +1,17 @@
+# Generated by Django 2.2 on 2026-10-18 19:35
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('true_false', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='tf_question',
+            options={'verbose_name': 'True/False Question', 'verbose_name_plural': 'True/False Questions'},
+        ),
+    ]
@@ -2,6 +2,7 @@ from __future__ import unicode_literals
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from django.db import models
+from quiz.cache import watch_question_models
 from quiz.models import Question
 
 
@@ -41,4 +42,6 @@ class TF_Question(Question):
     class Meta:
         verbose_name = _("True/False Question")
         verbose_name_plural = _("True/False Questions")
-        ordering = ['category']
+
+
+watch_question_models(TF_Question)
@@ -89,6 +89,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # wait for a competing writer rather than failing straight away
+        # with "database is locked"
+        'OPTIONS': {'timeout': 20},
+    }
+}
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+#
+# The quiz keeps per-process copies of questions and quizzes and drops them
+# when a version number in this cache moves on, so it must be shared by
+# every server process. Files suit a single host; use memcached or redis
+# across several.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
 